@@ -0,0 +1,319 @@
+# BenchmarkSuite.py
+# Offline scaling benchmark for the pipeline stages: builds synthetic universes (price
+# cache, trade journal, portfolio) of several sizes in a scratch directory, times each
+# stage on them and stores the results as JSON. Compared against a saved baseline, a
+# stage that got slower beyond the tolerance is a regression (exit status 1).
+#   python BenchmarkSuite.py                        (all sizes, compare with the baseline)
+#   python BenchmarkSuite.py --sizes 100 1000 -r 5  (quicker, best of 5)
+#   python BenchmarkSuite.py --save-baseline        (accept this run as the new baseline)
+import os
+# Before any stage imports DataManager: prices and quotes come from the synthetic cache
+os.environ["BOT_DATA_BACKEND"] = "offline"
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import date, datetime, timedelta
+import numpy as np
+import DataManager
+import GenerateSignals
+import PerformanceMetrics
+from Pipeline import PipelineContext
+from SelectStocks import select_stocks
+from GenerateSignals import generate_signals
+from ExecuteTrades import execute_trades, INITIAL_CASH
+from TradeSummary import summarize
+from ValidateTrades import validate
+from TradeJournal import replace_all
+from PortfolioHistory import append_entry
+from StateAccess import write_json
+from Instrumentation import reset, snapshot, peak_rss_mb
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+SIZES         = [100, 1_000, 10_000]  # Tickers per synthetic universe
+REPEATS       = 3      # Best of N runs of the whole chain per size
+DAYS          = 60     # Daily bars per ticker (the live download is 60d)
+INTRADAY_BARS = 60     # 5-minute bars today from 08:00
+HELD_SHARE    = 0.05   # Share of the universe held at the start
+ROUND_TRIPS   = 0.10   # Share of the universe bought and sold again in the journal
+SEED          = 42
+RESULTS_DIR   = "benchmarks"
+BASELINE_FILE = os.path.join(RESULTS_DIR, "baseline.json")
+TOLERANCE     = 0.25   # Slower than baseline by more than this fraction (and MIN_DELTA_S) = regression
+MIN_DELTA_S   = 0.05   # Ignore slowdowns smaller than this (timer noise on fast stages)
+
+# Each repeat starts from the generated inputs (price_cache.json, ftse100_stocks.json,
+# trades_log.jsonl, portfolio_summary.json) with every derived file removed and the
+# in-process memos cleared, then runs the chain LoadPrices → SelectStocks →
+# GenerateSignals → ExecuteTrades → TradeSummary → ValidateTrades, each stage on the
+# outputs of the one before (stage output is discarded). Random walks give few buy
+# signals, so ExecuteTrades also gets one for every screened buy candidate: allocation
+# and the opportunistic buys always run. TradeSummary and ValidateTrades start without
+# their checkpoints (full journal replay).
+# Results (benchmarks/results-<run id>.json):
+#   {"run_id", "timestamp", "commit", "host": {...}, "repeats",
+#    "sizes": {n: {"stages": {stage: {"best_s", "median_s", "cpu_s", "bytes_read", "bytes_written"}},
+#                  "trades", "peak_rss_mb"}}}
+
+# ─── SYNTHETIC DATA ─────────────────────────────────────────────────────────────
+
+def trading_days(n, end=None):
+    """The n weekdays before end (default today), oldest first."""
+    day, days = end or date.today(), []
+    while len(days) < n:
+        day -= timedelta(days=1)
+        if day.weekday() < 5:
+            days.append(day)
+    return [str(d) for d in reversed(days)]
+
+def synthetic_universe(n, rng):
+    """ftse100_stocks.json entries and their yfinance tickers."""
+    stocks = [{"name": f"Synthetic {i}", "code": f"S{i:05d}", "market_cap": round(float(rng.lognormal(8, 1.2)), 1)}
+              for i in range(n)]
+    return stocks, [DataManager.yf_ticker(s["code"]) for s in stocks]
+
+def synthetic_prices(tickers, days, rng):
+    """Price cache {ticker: {"daily", "intraday"}}: random walks with per-ticker drift and volatility."""
+    n = len(tickers)
+    drift = rng.normal(0.0005, 0.002, n)
+    vol = rng.uniform(0.008, 0.03, n)
+    close = rng.uniform(20, 500, n) * np.exp(np.cumsum(rng.normal(drift, vol, (len(days), n)), axis=0))
+    open_ = close * (1 + rng.normal(0, vol / 2, close.shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 2, close.shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 2, close.shape)))
+    volume = rng.lognormal(13, 1, close.shape).astype(int)
+    bars = INTRADAY_BARS
+    intraday = close[-1] * np.exp(np.cumsum(rng.normal(0, vol / np.sqrt(bars), (bars, n)), axis=0))
+    times = [f"{date.today()} {8 + (5 * k) // 60:02d}:{(5 * k) % 60:02d}:00" for k in range(bars)]
+
+    cache = {}
+    for j, t in enumerate(tickers):
+        cache[t] = {
+            "daily": {
+                "dates": days,
+                "close": close[:, j].round(2).tolist(),
+                "high": high[:, j].round(2).tolist(),
+                "low": low[:, j].round(2).tolist(),
+                "open": open_[:, j].round(2).tolist(),
+                "volume": volume[:, j].tolist()
+            },
+            "intraday": {"datetime": times, "price": intraday[:, j].round(2).tolist()}
+        }
+    return cache
+
+def synthetic_book(tickers, cache, days, rng):
+    """(trades, portfolio): open positions plus closed round trips, cash and history consistent with them."""
+    order = rng.permutation(len(tickers))
+    held = [tickers[i] for i in order[:max(1, int(len(tickers) * HELD_SHARE))]]
+    traded = [tickers[i] for i in order[len(held):len(held) + int(len(tickers) * ROUND_TRIPS)]]
+    notional = INITIAL_CASH * 0.9 / (len(held) + len(traded))
+    closes = lambda t, d: cache[t]["daily"]["close"][d]
+
+    trades = []
+    def trade(t, action, day, shares):
+        trades.append({"ticker": t, "action": action, "trigger": "synthetic",
+                       "date": f"{days[day]}T10:{len(trades) % 60:02d}:00",
+                       "price": closes(t, day), "shares": shares, "quote_price": closes(t, day)})
+    for t in held:
+        day = int(rng.integers(0, len(days) - 1))
+        trade(t, "BUY", day, round(notional / closes(t, day), 3))
+    for t in traded:
+        buy_day = int(rng.integers(0, len(days) - 2))
+        shares = round(notional / closes(t, buy_day), 3)
+        trade(t, "BUY", buy_day, shares)
+        trade(t, "SELL", int(rng.integers(buy_day + 1, len(days) - 1)), shares)
+    trades.sort(key=lambda tr: tr["date"])  # The journal is in date order
+
+    # Daily history entries replayed from the trades
+    portfolio, cash, holdings, i = {"cash": INITIAL_CASH, "holdings": {}, "history": []}, INITIAL_CASH, {}, 0
+    for d, day in enumerate(days[:-1]):
+        while i < len(trades) and trades[i]["date"][:10] == day:
+            tr = trades[i]
+            sign = 1 if tr["action"] == "BUY" else -1
+            cash -= sign * tr["shares"] * tr["price"]
+            holdings[tr["ticker"]] = round(holdings.get(tr["ticker"], 0) + sign * tr["shares"], 3)
+            if holdings[tr["ticker"]] <= 0:
+                del holdings[tr["ticker"]]
+            i += 1
+        value = cash + sum(s * closes(t, d) for t, s in holdings.items())
+        append_entry(portfolio, cash, value, holdings, when=f"{day}T16:30:00")
+    portfolio.update({"date": f"{days[-2]}T16:30:00", "cash": round(cash, 2), "holdings": holdings})
+    return trades, portfolio
+
+def generate(n, seed=SEED):
+    """Write a synthetic universe of n tickers into the working directory. Returns {file name: bytes} of the inputs."""
+    rng = np.random.default_rng(seed + n)
+    days = trading_days(DAYS)
+    stocks, tickers = synthetic_universe(n, rng)
+    cache = synthetic_prices(tickers, days, rng)
+    trades, portfolio = synthetic_book(tickers, cache, days, rng)
+    with open(DataManager.UNIVERSE_FILE, "w") as f:
+        json.dump(stocks, f, indent=4)
+    DataManager.save_cache(cache)
+    replace_all(trades)
+    write_json("portfolio_summary.json", portfolio)
+    inputs = {}
+    for name in os.listdir("."):
+        if not name.endswith(".lock"):
+            with open(name, "rb") as f:
+                inputs[name] = f.read()
+    return inputs
+
+def restore(inputs):
+    """Put the working directory back to the generated inputs and forget everything this process memoised."""
+    for name in os.listdir("."):
+        if name not in inputs:
+            os.remove(name)
+    for name, content in inputs.items():
+        with open(name, "wb") as f:
+            f.write(content)
+    GenerateSignals._indicators.clear()
+    DataManager._quotes.clear()
+    DataManager._offline[:] = [None, {}]
+    PerformanceMetrics._memo.clear()
+
+# ─── TIMING ─────────────────────────────────────────────────────────────────────
+
+def timed(fn):
+    """(result, {"wall_s", "cpu_s", "bytes_read", "bytes_written"}) of fn() with its output silenced."""
+    reset()
+    wall, cpu = time.perf_counter(), time.process_time()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = fn()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    counters = (snapshot() or {}).get("counters", {})
+    return result, {"wall_s": wall, "cpu_s": cpu,
+                    "bytes_read": counters.get("bytes.read"), "bytes_written": counters.get("bytes.written")}
+
+def run_chain():
+    """One pass over every stage (cwd = a restored workdir). Returns {stage: timing}."""
+    ctx, timings = PipelineContext(), {}
+    def stage(name, fn):
+        result, timings[name] = timed(fn)
+        return result
+
+    stage("LoadPrices", lambda: ctx.load_prices(fetch=False))
+    screen = stage("SelectStocks", lambda: select_stocks(ctx.daily, ctx.holdings, ctx.universe))
+    signals = stage("GenerateSignals", lambda: generate_signals(ctx.daily, ctx.holdings, ctx.trades, ctx.universe))
+    buys = {t: {"latest_price": ctx.intraday[t]["price"][-1], "signal": "BUY", "trigger": "synthetic"}
+            for t in screen["to_buy"]}
+    signals = {**signals, "buy_signals": {**buys, **signals["buy_signals"]}}
+    stage("ExecuteTrades", lambda: execute_trades(signals, screen, ctx.portfolio, ctx.daily, ctx.intraday,
+                                                  portfolio_version=ctx.portfolio_version))
+    ctx.reload_portfolio()
+    stage("TradeSummary", lambda: summarize(ctx.portfolio, ctx.daily))
+    stage("ValidateTrades", lambda: validate(ctx.portfolio))
+    return timings
+
+def bench_size(n, repeats=REPEATS):
+    cwd, workdir = os.getcwd(), tempfile.mkdtemp(prefix=f"bench-{n}-")
+    os.chdir(workdir)  # Every stage uses paths relative to the working directory
+    try:
+        inputs = generate(n)
+        runs = []
+        for _ in range(repeats):
+            restore(inputs)
+            runs.append(run_chain())
+        trades = inputs["trades_log.jsonl"].count(b"\n")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    stages = {}
+    for name in runs[0]:
+        walls = sorted(r[name]["wall_s"] for r in runs)
+        best = min(runs, key=lambda r: r[name]["wall_s"])[name]
+        stages[name] = {"best_s": round(walls[0], 4), "median_s": round(walls[len(walls) // 2], 4),
+                        "cpu_s": round(best["cpu_s"], 4), "bytes_read": best["bytes_read"],
+                        "bytes_written": best["bytes_written"]}
+    return {"stages": stages, "trades": trades, "peak_rss_mb": peak_rss_mb()}
+
+# ─── RESULTS ────────────────────────────────────────────────────────────────────
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def host_info():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+def run_suite(sizes=SIZES, repeats=REPEATS):
+    started = datetime.now()
+    results = {
+        "run_id": started.strftime("%Y%m%d-%H%M%S"),
+        "timestamp": started.isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": host_info(),
+        "repeats": repeats,
+        "sizes": {}
+    }
+    for n in sizes:
+        print(f"⏱️  {n} tickers …", flush=True)
+        results["sizes"][str(n)] = bench_size(n, repeats)
+        for name, s in results["sizes"][str(n)]["stages"].items():
+            print(f"   {name:<16} {s['best_s']:>8.3f}s  (median {s['median_s']:.3f}s, CPU {s['cpu_s']:.3f}s)")
+    return results
+
+def save_results(results, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"results-{results['run_id']}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+def compare(results, baseline, tolerance=TOLERANCE, min_delta=MIN_DELTA_S):
+    """Regressions as [(size, stage, baseline s, now s)] on the sizes and stages both runs have."""
+    regressions = []
+    if baseline["host"] != results["host"]:
+        print(f"⚠️  Baseline is from a different host ({baseline['host']['platform']}, "
+              f"Python {baseline['host']['python']}) – timings may not be comparable")
+    print(f"\nAgainst baseline {baseline['run_id']} ({baseline.get('commit') or 'unknown commit'}):")
+    for n, size in results["sizes"].items():
+        for name, s in size["stages"].items():
+            base = baseline["sizes"].get(n, {}).get("stages", {}).get(name)
+            if base is None:
+                continue
+            ratio = s["best_s"] / base["best_s"] if base["best_s"] else float("inf")
+            regressed = ratio > 1 + tolerance and s["best_s"] - base["best_s"] > min_delta
+            status = "❌" if regressed else "✅"
+            print(f"{status} {n:>6} {name:<16} {base['best_s']:>8.3f}s → {s['best_s']:>8.3f}s  ({ratio:.2f}x)")
+            if regressed:
+                regressions.append((n, name, base["best_s"], s["best_s"]))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the pipeline stages on synthetic universes (offline)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Tickers per universe")
+    parser.add_argument("-r", "--repeats", type=int, default=REPEATS, help="Best of N runs per size")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    args = parser.parse_args()
+
+    baseline_path = os.path.abspath(args.baseline)
+    results_dir = os.path.abspath(RESULTS_DIR)
+    results = run_suite(args.sizes, args.repeats)
+    print(f"\n💾 Saved results to {save_results(results, results_dir)}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📌 Saved as baseline ({baseline_path})")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print(f"\n❌ {len(regressions)} stage timings regressed by more than {TOLERANCE:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions against the baseline")
+    else:
+        print("No baseline yet – run with --save-baseline to store one")
@@ -0,0 +1,188 @@
+# BotDaemon.py
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta, time as dtime
+from RunLog import log_run
+from Instrumentation import snapshot, reset
+import Profiling
+from Pipeline import PipelineRunner
+from run_bot import (init_portfolio, ran_select_today, mark_select_ran, get_todays_sells,
+                     update_tickers_if_due, launch_monitor_if_needed, run_script)
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+MARKET_OPEN   = dtime(8, 0)    # LSE continuous trading (UK time)
+MARKET_CLOSE  = dtime(16, 30)
+SUMMARY_DELAY = timedelta(minutes=5)  # Summary once the closing auction has settled
+TICK_MINUTES  = 10             # Signal/execute cadence during the session
+
+# Timetable for each weekday (no exchange holiday calendar – a holiday just sees no new data):
+#   open            → quarterly ticker update, 60d daily download, daily screen
+#   open + k*tick   → intraday refresh, GenerateSignals, ExecuteTrades, monitor launch
+#   close + delay   → TradeSummary
+# Ticks sit on a fixed grid from the open. A cycle that overruns skips the ticks it
+# covered instead of running them back to back.
+
+# ─── TIMETABLE ──────────────────────────────────────────────────────────────────
+
+def is_trading_day(day):
+    return day.weekday() < 5
+
+def session_bounds(day):
+    return datetime.combine(day, MARKET_OPEN), datetime.combine(day, MARKET_CLOSE)
+
+def next_trading_open(now):
+    day = now.date() + timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return session_bounds(day)[0]
+
+def tick_index(now, tick):
+    """Number of whole ticks since today's open."""
+    open_dt, _ = session_bounds(now.date())
+    return int((now - open_dt) / tick)
+
+def next_wakeup(now, tick):
+    """When the daemon should next wake: the open, the next tick on the grid, the summary, or tomorrow."""
+    if not is_trading_day(now.date()):
+        return next_trading_open(now)
+    open_dt, close_dt = session_bounds(now.date())
+    if now < open_dt:
+        return open_dt
+    if now < close_dt:
+        return min(open_dt + (tick_index(now, tick) + 1) * tick, close_dt + SUMMARY_DELAY)
+    if now < close_dt + SUMMARY_DELAY:
+        return close_dt + SUMMARY_DELAY
+    return next_trading_open(now)
+
+# ─── CYCLES ─────────────────────────────────────────────────────────────────────
+
+def open_cycle(runner):
+    """Once per trading day: refresh the universe and daily history, run the daily screen."""
+    scripts_run = []
+    if not os.path.exists("ftse100_stocks.json"):
+        run_script("StockTickers.py")
+    if update_tickers_if_due():
+        scripts_run.append("StockTickers")
+    init_portfolio()
+
+    runner.ctx.screen = None  # Yesterday's screen
+    runner.ctx.load_prices()
+    scripts_run.append("LoadPrices")
+    if not ran_select_today():
+        runner.run("SelectStocks")
+        scripts_run.append("SelectStocks")
+        mark_select_ran()
+    else:
+        print("Skipping - SelectStocks.py already ran today")
+    return scripts_run
+
+def trade_cycle(runner):
+    """Every tick: refresh intraday prices only, then signals and execution on warm data."""
+    scripts_run = []
+    fetched = runner.ctx.refresh_intraday()
+    print(f"Refreshed intraday prices for {fetched} tickers")
+    scripts_run.append("RefreshIntraday")
+
+    sells_before = get_todays_sells()
+    runner.run("GenerateSignals")
+    runner.run("ExecuteTrades")
+    scripts_run += ["GenerateSignals", "ExecuteTrades"]
+
+    if launch_monitor_if_needed():
+        scripts_run.append("DEFERRED - MonitorDeferredSells STARTED")
+
+    # Real sells free up cash: re-run straight away rather than waiting a tick
+    if get_todays_sells() - sells_before:
+        print("Detected real sells for this tick.")
+        runner.run("GenerateSignals")
+        runner.run("ExecuteTrades")
+        scripts_run += ["NEW SELL - GenerateSignals", "NEW SELL - ExecuteTrades"]
+    return scripts_run
+
+def close_cycle(runner):
+    runner.run("TradeSummary")
+    return ["TradeSummary"]
+
+def run_cycle(name, cycle, runner, skipped_ticks=0):
+    """Run one cycle, log it to the run log and keep the daemon alive on errors."""
+    reset()  # Metrics and profiles are per cycle
+    Profiling.new_run()
+    start_time = datetime.now()
+    print(f"\n=== {name} cycle at {start_time.isoformat()} ===")
+    success, error_message, scripts_run = True, None, []
+    try:
+        with Profiling.profile(f"{name} cycle"):
+            scripts_run = cycle(runner)
+    except Exception as e:
+        success, error_message = False, str(e)
+        print(f"ERROR: {error_message}")
+    end_time = datetime.now()
+    print(f"=== {name} cycle done in {(end_time - start_time).total_seconds():.2f}s ===")
+
+    log_run({
+        "initiator": os.path.basename(__file__),
+        "cycle": name,
+        "timestamp": start_time.isoformat(),
+        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "cycle_seconds": round((end_time - start_time).total_seconds(), 3),
+        "skipped_ticks": skipped_ticks,
+        "success": success,
+        "error_message": error_message,
+        "scripts_run": scripts_run,
+        "stage_cache": runner.take_cache_log(),
+        "metrics": snapshot(),
+        "profile": Profiling.run_dir()
+    })
+
+# ─── MAIN LOOP ──────────────────────────────────────────────────────────────────
+
+def run_daemon(tick_minutes=TICK_MINUTES):
+    """
+    Stay resident and run the pipeline on the market timetable. Price data, the
+    daily indicators (GenerateSignals) and yfinance's HTTP session stay in memory
+    between cycles, so a tick only downloads today's intraday prices.
+    """
+    tick = timedelta(minutes=tick_minutes)
+    runner = PipelineRunner()
+    opened_on = closed_on = None
+    last_tick = None
+
+    print(f"🕒 Bot daemon started – ticking every {tick_minutes} min between "
+          f"{MARKET_OPEN:%H:%M} and {MARKET_CLOSE:%H:%M} on weekdays")
+    while True:
+        now = datetime.now()
+        today = now.date()
+        open_dt, close_dt = session_bounds(today)
+
+        if is_trading_day(today) and open_dt <= now < close_dt:
+            if opened_on != today:
+                run_cycle("open", open_cycle, runner)
+                opened_on, last_tick = today, None
+            now = datetime.now()
+            index = tick_index(now, tick)
+            skipped = max(0, index - last_tick - 1) if last_tick is not None else 0
+            if skipped:
+                print(f"⏭️ Skipped {skipped} missed tick(s)")
+            run_cycle("tick", trade_cycle, runner, skipped)
+            last_tick = index
+        elif opened_on == today and closed_on != today and now >= close_dt + SUMMARY_DELAY:
+            run_cycle("close", close_cycle, runner)
+            closed_on = today
+
+        wake = next_wakeup(datetime.now(), tick)
+        time.sleep(max(0.0, (wake - datetime.now()).total_seconds()))
+
+if __name__ == "__main__":
+    # Same working directory convention as run_bot.py
+    os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
+
+    parser = argparse.ArgumentParser(description="Run the trading bot as a resident daemon")
+    parser.add_argument("--tick", type=int, default=TICK_MINUTES, help="Minutes between signal/execute cycles")
+    args = parser.parse_args()
+    try:
+        run_daemon(args.tick)
+    except KeyboardInterrupt:
+        print("Bot daemon stopped.")
@@ -0,0 +1,364 @@
+# ChartRenderer.py
+import os
+import sys
+import json
+import random
+import hashlib
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from GenerateSignals import SHORT_W, LONG_W, calculate_macd
+from StateAccess import read_json, write_json
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+PORTFOLIO_FILE = "portfolio_summary.json"
+PRICE_CACHE_FILE = "price_cache.json"
+CHART_DIR      = "charts"
+MANIFEST_FILE  = os.path.join(CHART_DIR, "manifest.json")
+CHART_FORMAT   = "png"           # "png" or "svg"
+CHART_DPI      = 100
+WORKERS        = os.cpu_count() or 1
+CHART_VERSION  = 1               # Bump when a chart's drawing code changes → every chart re-renders
+
+# The chart builders below draw one figure from plain data and are shared by the
+# interactive scripts (VisauliseTrends.py, VisualiseProfits.py, ValidateTrades.py --plot)
+# and the headless batch renderer:
+#   python ChartRenderer.py [--format png|svg] [--workers N] [--force]
+# renders every holding, every fully closed position, the P&L per closed ticker, the
+# equity curve and the cash curve into charts/ on the Agg backend (no display), over a
+# process pool. charts/manifest.json keeps a fingerprint of each chart's inputs; charts
+# whose inputs haven't changed are skipped, and charts with no job any more are removed.
+
+# ─── CHART INPUTS ───────────────────────────────────────────────────────────────
+
+def _window(daily, start, end=None):
+    """(dates, closes) of a daily cache entry from start (YYYY-MM-DD) up to end (ISO date/datetime)."""
+    pairs = [(d, c) for d, c in zip(daily.get("dates", []), daily.get("close", []))
+             if d[:10] >= start and (end is None or d <= end)]
+    return [d for d, _ in pairs], [c for _, c in pairs]
+
+def holding_inputs(ticker, daily, first_held):
+    """Inputs of holding_figure: closes from 4×LONG_W days before the first buy (EMA warm-up)."""
+    if first_held is None:
+        raise ValueError(f"No history entry holds {ticker}")
+    start = str(first_held)
+    buffered = (datetime.fromisoformat(start) - timedelta(days=4 * LONG_W)).date().isoformat()
+    dates, closes = _window(daily, buffered)
+    if not dates:
+        raise ValueError(f"No price data available for {ticker}")
+    return {"ticker": ticker, "dates": dates, "closes": closes, "start": start}
+
+def closed_inputs(ticker, daily, ledger):
+    """Inputs of closed_figure: closes from 2×LONG_W days before the first buy to the last sell."""
+    first_buy, last_sell = ledger.closed_range(ticker)
+    if first_buy == last_sell:
+        raise ValueError(f"Cannot plot {ticker} — Buy and Sell occurred on the same day ({first_buy[:10]})")
+    buffered = (datetime.fromisoformat(first_buy) - timedelta(days=2 * LONG_W)).date().isoformat()
+    dates, closes = _window(daily, buffered, last_sell)
+    if not any(d >= first_buy for d in dates):
+        raise ValueError(f"No price data available between {first_buy[:10]} and {last_sell[:10]} for {ticker}")
+
+    # One price per buy lot / sell trade among the ticker's matches (a lot can be split over several sells)
+    matches = ledger.matches(ticker)
+    buy_prices = [price for _, price in dict.fromkeys((m["buy_date"], m["buy_price"]) for m in matches)]
+    sell_prices = [price for _, price in dict.fromkeys((m["sell_date"], m["sell_price"]) for m in matches)]
+    return {"ticker": ticker, "dates": dates, "closes": closes, "start": first_buy, "end": last_sell,
+            "buy_prices": buy_prices, "sell_prices": sell_prices}
+
+# ─── CHART BUILDERS ─────────────────────────────────────────────────────────────
+
+def holding_figure(ticker, dates, closes, start):
+    """Price, EMAs and MACD since the first buy of a current holding."""
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    start_date = pd.to_datetime(start)
+    df_ma = pd.DataFrame({"Close": closes}, index=pd.to_datetime(dates))
+    df_ma = calculate_macd(df_ma)
+    df_ma["Short_EMA"] = df_ma["Close"].ewm(span=SHORT_W, adjust=False).mean()
+    df_ma["Long_EMA"] = df_ma["Close"].ewm(span=LONG_W, adjust=False).mean()
+
+    start_plot_date = df_ma.index[df_ma.index.get_indexer([start_date], method='ffill')[0]]
+    df_plot = df_ma[df_ma.index >= start_plot_date]
+
+    fig, ax1 = plt.subplots(figsize=(12, 6))
+
+    # Plot price and EMAs on primary y-axis
+    ax1.plot(df_plot["Close"], label="Stock Price (£)", color="gray", alpha=0.6)
+    ax1.plot(df_plot["Short_EMA"], label=f"Short EMA ({SHORT_W}-day)", color="blue")
+    ax1.plot(df_plot["Long_EMA"], label=f"Long EMA ({LONG_W}-day)", color="red")
+    ax1.set_ylabel("Price (£)")
+    ax1.grid(True)
+
+    ax1.axvline(start_date, color='green', linestyle='--', alpha=0.5, label="Buy Date")
+
+    # Create secondary y-axis for MACD
+    ax2 = ax1.twinx()
+    ax2.plot(df_plot["MACD"], label="MACD Line", color="purple", linestyle="--")
+    ax2.plot(df_plot["Signal"], label="Signal Line (MACD)", color="orange", linestyle=":")
+    ax2.set_ylabel("MACD")
+    ax2.axhline(0, color="black", linestyle="--", linewidth=0.5)
+
+    # Combine legends from both axes
+    lines_1, labels_1 = ax1.get_legend_handles_labels()
+    lines_2, labels_2 = ax2.get_legend_handles_labels()
+    ax1.legend(
+        lines_1 + lines_2,
+        labels_1 + labels_2,
+        loc='upper left',
+        bbox_to_anchor=(1.05, 1),
+        borderaxespad=0.,
+        fontsize='small'
+    )
+
+    ax1.set_title(f"{ticker} Price, EMA & MACD (since {start_date.date()})")
+    ax1.set_xlabel("Date")
+    ax1.set_xlim(start_date - pd.Timedelta(days=0.5), df_plot.index[-1] + pd.Timedelta(days=1))
+    fig.tight_layout()
+    return fig
+
+def closed_figure(ticker, dates, closes, start, end, buy_prices, sell_prices):
+    """Price and MA crossover from first buy to last sell of a fully closed position."""
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    start_date, end_date = pd.to_datetime(start), pd.to_datetime(end)
+    df_ma = pd.DataFrame({"Close": closes}, index=pd.to_datetime(dates))
+    df_ma.index.name = "Date"
+    df_ma.sort_index(inplace=True)
+
+    # Moving averages over the buffered data, then slice the buy→sell window for display
+    df_ma["Short_MA"] = df_ma["Close"].rolling(SHORT_W).mean()
+    df_ma["Long_MA"] = df_ma["Close"].rolling(LONG_W).mean()
+    df_plot = df_ma[(df_ma.index >= start_date) & (df_ma.index <= end_date)]
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(df_plot["Close"], label="Stock Price (£)", color="gray", alpha=0.6)
+    ax.plot(df_plot["Short_MA"], label=f"Short MA ({SHORT_W}-day)", color="blue")
+    ax.plot(df_plot["Long_MA"], label=f"Long MA ({LONG_W}-day)", color="red")
+
+    # Add Buy/Sell lines
+    aligned_start_date = df_plot.index[df_plot.index.get_indexer([start_date], method="nearest")[0]]
+    ax.axvline(aligned_start_date, color='green', linestyle='--', alpha=0.5, label="Buy Date")
+    aligned_end_date = df_plot.index[df_plot.index.get_indexer([end_date], method="nearest")[0]]
+    ax.axvline(aligned_end_date, color='red', linestyle='--', alpha=0.5, label="Sell Date")
+
+    # Annotate Buy and Sell Dates
+    ax.text(aligned_start_date, df_plot["Close"].max(), " Buy", color='green', va='bottom', ha='left', fontweight='bold')
+    ax.text(aligned_end_date, df_plot["Close"].max(), " Sell", color='red', va='bottom', ha='left', fontweight='bold')
+
+    # Average BUY / SELL price if multiple trades
+    avg_buy_price = sum(buy_prices) / len(buy_prices) if buy_prices else None
+    avg_sell_price = sum(sell_prices) / len(sell_prices) if sell_prices else None
+
+    offset_x = 0.01
+    xlim = ax.get_xlim()
+    line_start = xlim[0] + 0.95 * (xlim[1] - xlim[0])
+    line_end = xlim[1]
+
+    if avg_buy_price is not None:
+        ax.hlines(avg_buy_price, xmin=line_start, xmax=line_end, colors='green', linewidth=2, label='Avg Buy Price')
+        ax.text(1 + offset_x, avg_buy_price, f'Buy Price £{avg_buy_price:.2f}', color='green',
+                va='center', ha='left', fontweight='bold', fontsize=9,
+                transform=ax.get_yaxis_transform())
+
+    if avg_sell_price is not None:
+        ax.hlines(avg_sell_price, xmin=line_start, xmax=line_end, colors='red', linewidth=2, label='Avg Sell Price')
+        ax.text(1 + offset_x, avg_sell_price, f'Sell Price £{avg_sell_price:.2f}', color='red',
+                va='center', ha='left', fontweight='bold', fontsize=9,
+                transform=ax.get_yaxis_transform())
+
+    ax.set_title(f"{ticker} Price & MA Crossover (BUY → SELL: {start_date.date()} → {end_date.date()})")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Price (£)")
+    ax.grid(True)
+    ax.legend(loc='upper left', bbox_to_anchor=(1.02, 1), borderaxespad=0.)
+
+    # Force x-axis ticks to include Buy and Sell dates
+    tick_positions = sorted(set(
+        list(df_plot.index[::max(1, len(df_plot) // 8)]) + [aligned_start_date, aligned_end_date]
+    ))
+    ax.set_xticks(tick_positions)
+    ax.set_xticklabels([tick.strftime('%Y-%m-%d') for tick in tick_positions], rotation=45, ha='right')
+    ax.set_xlim(df_plot.index.min() - pd.Timedelta(days=0.3), aligned_end_date + pd.Timedelta(days=0.3))
+    fig.tight_layout()
+    return fig
+
+def pnl_figure(differences):
+    """Realized P&L per fully closed ticker ({ticker: profit}) around the average."""
+    import matplotlib.pyplot as plt
+
+    diffs = list(differences.values())
+    average = statistics.mean(diffs) if diffs else 0
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.axhline(y=average, color='blue', linestyle='--', label=f'Average: {average:.2f}')
+    for ticker, diff in differences.items():
+        jitter = random.Random(ticker).uniform(-0.2, 0.2)  # Seeded per ticker: same chart for the same P&L
+        ax.scatter(jitter, diff, color='green' if diff > 0 else 'red', s=100)
+        ax.text(jitter, diff, f" {ticker}", va='center', ha='left', fontsize=9)
+
+    ax.set_xlim(-1, 1)
+    ax.set_xticks([])
+    ax.set_ylabel("Profit/Loss (£)")
+    ax.set_title("Profit/Loss per Fully Closed Stock Position (FIFO Matching)")
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+def series_figure(points, label, ylabel, title):
+    """Line chart of [(ISO date/datetime, value)] (cash balance, equity curve)."""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot([datetime.fromisoformat(d) for d, _ in points], [v for _, v in points], label=label)
+    ax.set_xlabel('Date')
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.grid(True)
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+def cash_figure(cash_history):
+    return series_figure(cash_history, 'Cash Over Time', 'Cash (£)', 'Cash Balance Over Time')
+
+def equity_figure(equity):
+    return series_figure(equity, 'Portfolio Value', 'Value (£)', 'Portfolio Value Over Time')
+
+BUILDERS = {
+    "holding": holding_figure,
+    "closed": closed_figure,
+    "pnl": pnl_figure,
+    "cash": cash_figure,
+    "equity": equity_figure,
+}
+
+# ─── BATCH JOBS ─────────────────────────────────────────────────────────────────
+
+def collect_jobs(fmt=CHART_FORMAT, chart_dir=CHART_DIR):
+    """{output path: (kind, kwargs)} for every chart of the current portfolio state."""
+    from PortfolioHistory import HistoryView
+    from PerformanceMetrics import equity_series
+    from ValidateTrades import validate
+    from LotLedger import LotLedger
+
+    portfolio = read_json(PORTFOLIO_FILE, default={})
+    prices = read_json(PRICE_CACHE_FILE, default={})
+    daily = {t: d.get("daily", {}) for t, d in prices.items()}
+    path = lambda *parts: os.path.join(chart_dir, *parts[:-1], f"{parts[-1]}.{fmt}")
+    jobs, skipped = {}, []
+
+    # ── Current holdings ──
+    view = HistoryView(portfolio)
+    for ticker, qty in portfolio.get("holdings", {}).items():
+        if qty <= 0:
+            continue
+        try:
+            jobs[path("holdings", ticker)] = ("holding", holding_inputs(ticker, daily.get(ticker, {}), view.first_held(ticker)))
+        except ValueError as e:
+            skipped.append(str(e))
+
+    # ── Fully closed positions and their P&L ──
+    ledger = LotLedger.load()
+    differences = ledger.realized_by_ticker(flat_only=True)
+    for ticker in differences:
+        try:
+            jobs[path("closed", ticker)] = ("closed", closed_inputs(ticker, daily.get(ticker, {}), ledger))
+        except ValueError as e:
+            skipped.append(str(e))
+    if differences:
+        jobs[path("pnl")] = ("pnl", {"differences": differences})
+
+    # ── Equity and cash curves ──
+    dates, equity = equity_series(portfolio, daily)
+    if len(dates):
+        jobs[path("equity")] = ("equity", {"equity": [[str(d), float(v)] for d, v in zip(dates, equity)]})
+    if portfolio:
+        _, _, checkpoint = validate(portfolio)  # Incremental: only trades since the last validation
+        if checkpoint["cash_history"]:
+            jobs[path("cash")] = ("cash", {"cash_history": checkpoint["cash_history"]})
+    return jobs, skipped
+
+def fingerprint(kind, kwargs):
+    raw = json.dumps([CHART_VERSION, kind, kwargs], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+# ─── RENDERING ──────────────────────────────────────────────────────────────────
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")  # Headless: no display, no GUI event loop
+
+def render(path, kind, kwargs):
+    """Draw one chart and save it to path (format from the extension). Runs in a worker."""
+    import matplotlib.pyplot as plt
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fig = BUILDERS[kind](**kwargs)
+    try:
+        fig.savefig(path, dpi=CHART_DPI)
+    finally:
+        plt.close(fig)
+    return path
+
+def render_all(fmt=CHART_FORMAT, workers=WORKERS, force=False, chart_dir=CHART_DIR):
+    """Render every chart whose inputs changed since the last run. Returns {"rendered", "unchanged", "failed", "removed"}."""
+    os.makedirs(chart_dir, exist_ok=True)
+    manifest_file = os.path.join(chart_dir, os.path.basename(MANIFEST_FILE))
+    manifest = read_json(manifest_file, default={})
+    jobs, skipped = collect_jobs(fmt, chart_dir)
+    for reason in skipped:
+        print(f"⛔ {reason}. Skipping.")
+
+    fingerprints = {p: fingerprint(kind, kwargs) for p, (kind, kwargs) in jobs.items()}
+    todo = [p for p in jobs if force or manifest.get(p) != fingerprints[p] or not os.path.exists(p)]
+    result = {"rendered": 0, "unchanged": len(jobs) - len(todo), "failed": 0, "removed": 0}
+
+    def done(p, error=None):
+        if error is None:
+            manifest[p] = fingerprints[p]
+            result["rendered"] += 1
+        else:
+            manifest.pop(p, None)
+            result["failed"] += 1
+            print(f"⚠️  Failed to render {p}: {error}")
+
+    _init_worker()
+    if len(todo) <= 1 or workers <= 1:
+        for p in todo:  # Not worth starting a pool
+            try:
+                render(p, *jobs[p])
+                done(p)
+            except Exception as e:
+                done(p, e)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo)), initializer=_init_worker) as pool:
+            futures = {pool.submit(render, p, *jobs[p]): p for p in todo}
+            for future in as_completed(futures):
+                error = future.exception()
+                done(futures[future], error)
+
+    # Charts with no job any more (position sold / reopened, format changed)
+    for p in [p for p in manifest if p not in jobs]:
+        if os.path.exists(p):
+            os.remove(p)
+        del manifest[p]
+        result["removed"] += 1
+
+    write_json(manifest_file, manifest)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every portfolio chart to files, headless.")
+    parser.add_argument("--format", choices=["png", "svg"], default=CHART_FORMAT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--force", action="store_true", help="re-render charts whose inputs haven't changed")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    result = render_all(args.format, args.workers, args.force)
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"🖼️  {result['rendered']} charts rendered, {result['unchanged']} unchanged, "
+          f"{result['removed']} removed → {CHART_DIR}/ in {elapsed:.1f}s")
+    sys.exit(1 if result["failed"] else 0)
@@ -0,0 +1,285 @@
+# Dashboard.py
+import os
+import sys
+import json
+import html
+import hashlib
+from datetime import date, datetime, timedelta
+import numpy as np
+from StateAccess import read_json, write_json, version_of
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+DASHBOARD_FILE   = "dashboard.html"
+PANELS_FILE      = "dashboard_panels.json"
+PORTFOLIO_FILE   = "portfolio_summary.json"
+PRICE_CACHE_FILE = "price_cache.json"
+SIGNALS_FILE     = "trade_signals.json"
+VIOLATIONS_FILE  = "violations_log.json"
+EQUITY_POINTS    = 600   # Points per equity curve after LTTB downsampling
+SPARK_POINTS     = 60    # Points per holding sparkline
+SPARK_DAYS       = 90    # Daily closes per holding sparkline (before downsampling)
+RUN_LOG_RUNS     = 15    # Most recent runs listed
+CHART_W, CHART_H = 860, 240
+
+# One self-contained static page (inline CSS and SVG, no scripts or external files):
+#   python Dashboard.py [--force]
+# Panels: holdings, equity curve (+ performance metrics), signals, run log health and
+# violations. Each panel is built from a version of its inputs; dashboard_panels.json
+# keeps every panel's version and HTML, so a rebuild only regenerates the panels whose
+# inputs changed and rewrites the page only if one did.
+# Time series are downsampled with largest-triangle-three-buckets (LTTB) before they
+# are drawn, so the page stays small however long the portfolio history gets.
+
+# ─── DOWNSAMPLING ───────────────────────────────────────────────────────────────
+
+def lttb(x, y, n_out):
+    """
+    Indices of the n_out points of (x, y) that keep the series' visual shape
+    (largest-triangle-three-buckets). x must be increasing. First and last points kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out - 2 buckets between first and last
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Next bucket's average (or the last point after the final bucket)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        # Point in this bucket forming the largest triangle with the previous pick and that average
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+# ─── SVG ────────────────────────────────────────────────────────────────────────
+
+def _scale(values, size, pad=0.0):
+    lo, hi = float(np.min(values)), float(np.max(values))
+    span = (hi - lo) or 1.0
+    return (np.asarray(values, dtype=float) - lo) / span * (size - 2 * pad) + pad
+
+def svg_line(x, y, width, height, stroke="#2b6cb0", labels=True):
+    """Inline SVG polyline of (x, y); y axis labelled with its min/max if labels."""
+    if len(x) < 2:
+        return '<p class="muted">Not enough data.</p>'
+    left = 60 if labels else 0
+    px = _scale(x, width - left) + left
+    py = height - _scale(y, height, pad=4)
+    points = " ".join(f"{a:.1f},{b:.1f}" for a, b in zip(px, py))
+    axis = ""
+    if labels:
+        axis = (f'<text x="0" y="12">£{max(y):,.0f}</text>'
+                f'<text x="0" y="{height - 2}">£{min(y):,.0f}</text>')
+    return (f'<svg viewBox="0 0 {width} {height}" width="{width}" height="{height}">{axis}'
+            f'<polyline fill="none" stroke="{stroke}" stroke-width="1.5" points="{points}"/></svg>')
+
+# ─── PANELS ─────────────────────────────────────────────────────────────────────
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def _table(headers, rows):
+    head = "".join(f"<th>{html.escape(str(h))}</th>" for h in headers)
+    body = "".join("<tr>" + "".join(f"<td>{c}</td>" for c in row) + "</tr>" for row in rows)
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+def _money(x):
+    return "" if x is None else f"£{x:,.2f}"
+
+def _pct(x):
+    return "N/A" if x is None else f"{x * 100:+.2f}%"
+
+def _signed(x):
+    cls = "up" if x >= 0 else "down"
+    return f'<span class="{cls}">£{x:+,.2f}</span>'
+
+def holdings_version():
+    from TradeJournal import JOURNAL_FILE
+    return [version_of(PORTFOLIO_FILE), _mtime(PRICE_CACHE_FILE), _mtime(JOURNAL_FILE)]
+
+def holdings_panel():
+    from LotLedger import LotLedger
+
+    portfolio = read_json(PORTFOLIO_FILE, default={})
+    prices = read_json(PRICE_CACHE_FILE, default={})
+    ledger = LotLedger.load()
+    rows, market_value = [], 0.0
+    for ticker, shares in sorted(portfolio.get("holdings", {}).items()):
+        if shares <= 0:
+            continue
+        daily = prices.get(ticker, {}).get("daily", {})
+        closes = daily.get("close", [])[-SPARK_DAYS:]
+        price = closes[-1] if closes else None
+        lots = ledger.open_lots(ticker)
+        lot_shares = sum(lot["shares"] for lot in lots)
+        cost = sum(lot["shares"] * lot["price"] for lot in lots) / lot_shares if lot_shares else None
+        value = shares * price if price is not None else None
+        market_value += value or 0.0
+        keep = lttb(np.arange(len(closes)), closes, SPARK_POINTS)
+        spark = svg_line(keep, [closes[i] for i in keep], 120, 28, labels=False) if len(closes) > 1 else ""
+        rows.append([
+            html.escape(ticker), f"{shares:,.3f}", _money(cost), _money(price), _money(value),
+            _signed((price - cost) * shares) if price is not None and cost is not None else "",
+            f"{max(lot['age_days'] for lot in lots):.0f} days" if lots else "", spark
+        ])
+    cash = portfolio.get("cash", 0.0)
+    summary = (f'<p>Cash {_money(cash)} · Holdings {_money(market_value)} · '
+               f'<strong>Total {_money(cash + market_value)}</strong></p>')
+    if not rows:
+        return summary + '<p class="muted">No current holdings.</p>'
+    return summary + _table(["Ticker", "Shares", "Avg cost", "Price", "Value", "Unrealized", "Held", f"Last {SPARK_DAYS} days"], rows)
+
+def equity_version():
+    from PerformanceMetrics import history_version
+    return history_version(PORTFOLIO_FILE)
+
+def equity_points(portfolio):
+    """[(datetime, total value)]: every retained history entry plus the daily closes of thinned days."""
+    from PortfolioHistory import HistoryView
+    view = HistoryView(portfolio)
+    points = {e["datetime"]: e["total_value"] for e in view.entries}
+    days_with_entries = {t[:10] for t in points}
+    for day, value in view.daily_closes():
+        if day not in days_with_entries:
+            points[day + "T16:30:00"] = value  # Thinned day: its close at the LSE close
+    return sorted((datetime.fromisoformat(t), v) for t, v in points.items())
+
+def equity_panel():
+    from PerformanceMetrics import get_metrics
+
+    points = equity_points(read_json(PORTFOLIO_FILE, default={}))
+    if len(points) < 2:
+        return '<p class="muted">Not enough portfolio history yet.</p>'
+    x = np.array([t.timestamp() for t, _ in points])
+    y = np.array([v for _, v in points])
+    keep = lttb(x, y, EQUITY_POINTS)
+    chart = svg_line(x[keep], y[keep], CHART_W, CHART_H)
+    caption = (f'<p class="muted">{points[0][0]:%Y-%m-%d} → {points[-1][0]:%Y-%m-%d %H:%M} · '
+               f'{len(points):,} points drawn as {len(keep):,}</p>')
+
+    m = get_metrics(PORTFOLIO_FILE)
+    num = lambda v: "N/A" if v is None else f"{v:.2f}"
+    metrics = _table(["Total return", "Annual return", "Volatility", "Sharpe", "Sortino", "Max drawdown", "Hit rate", "Avg holding"], [[
+        _pct(m.get("total_return")), _pct(m.get("annual_return")), _pct(m.get("annual_volatility")),
+        num(m.get("sharpe")), num(m.get("sortino")), _pct(m.get("max_drawdown")),
+        _pct(m.get("hit_rate")), "N/A" if m.get("avg_holding_days") is None else f"{m['avg_holding_days']:.1f} days"
+    ]])
+    return chart + caption + metrics
+
+def signals_version():
+    return version_of(SIGNALS_FILE)
+
+def signals_panel():
+    signals = read_json(SIGNALS_FILE, default={})
+    rows = []
+    for kind in ("buy_signals", "sell_signals"):
+        for ticker, s in sorted(signals.get(kind, {}).items()):
+            rows.append([html.escape(ticker), html.escape(str(s.get("signal", kind[:-8].upper()))),
+                         _money(s.get("latest_price")), html.escape(str(s.get("trigger") or ""))])
+    updated = _mtime(SIGNALS_FILE)
+    caption = f'<p class="muted">Generated {datetime.fromtimestamp(updated):%Y-%m-%d %H:%M}</p>' if updated else ""
+    if not rows:
+        return caption + '<p class="muted">No signals.</p>'
+    return caption + _table(["Ticker", "Signal", "Price", "Trigger"], rows)
+
+def run_log_version():
+    from RunLog import RUN_LOG_DIR
+    segments = sorted(os.listdir(RUN_LOG_DIR)) if os.path.isdir(RUN_LOG_DIR) else []
+    # The week boundary moves too ("failures this week")
+    return [str(date.today()), [(s, os.path.getsize(os.path.join(RUN_LOG_DIR, s))) for s in segments]]
+
+def run_log_panel():
+    from RunLog import last_runs, failures_this_week, average_duration
+
+    runs = last_runs(RUN_LOG_RUNS)
+    if not runs:
+        return '<p class="muted">No runs logged.</p>'
+    failures = failures_this_week()
+    since = str(date.today() - timedelta(days=30))
+    durations = ", ".join(f"{html.escape(s)} {d:.0f}s" for s, d in sorted(average_duration(since).items()))
+    status = (f'<p><span class="{"down" if failures else "up"}">{len(failures)} failed runs this week</span>'
+              f' · Average duration (30 days): {durations or "N/A"}</p>')
+    rows = [[
+        "✅" if run.get("success") else "❌", html.escape(str(run.get("start_time"))),
+        html.escape(str(run.get("initiator"))), html.escape(", ".join(run.get("scripts_run", []))),
+        html.escape(str(run.get("error_message") or ""))
+    ] for run in runs]
+    return status + _table(["", "Started", "Script", "Steps", "Error"], rows)
+
+def violations_version():
+    return version_of(VIOLATIONS_FILE)
+
+def violations_panel():
+    violations = read_json(VIOLATIONS_FILE, default=[])
+    if not violations:
+        return '<p class="up">No violations detected.</p>'
+    by_type = {}
+    for v in violations:
+        by_type.setdefault(v["type"], []).append(v.get("date") or "")
+    rows = [[html.escape(t), len(d), html.escape(min(d)[:10]), html.escape(max(d)[:10])] for t, d in sorted(by_type.items())]
+    latest = [[html.escape(str(v.get("date", ""))), html.escape(v["type"]), html.escape(str(v.get("ticker", ""))),
+               html.escape(str(v.get("detail", "")))] for v in violations[-10:]]
+    return (_table(["Type", "Count", "First", "Last"], rows) + "<h3>Latest</h3>"
+            + _table(["Date", "Type", "Ticker", "Detail"], latest))
+
+# name: (title, version of its inputs, builder) in page order
+PANELS = {
+    "holdings":   ("Holdings", holdings_version, holdings_panel),
+    "equity":     ("Equity curve", equity_version, equity_panel),
+    "signals":    ("Signals", signals_version, signals_panel),
+    "run_log":    ("Run log health", run_log_version, run_log_panel),
+    "violations": ("Violations", violations_version, violations_panel),
+}
+
+# ─── PAGE ───────────────────────────────────────────────────────────────────────
+
+STYLE = """
+body { font-family: -apple-system, Segoe UI, Roboto, sans-serif; margin: 24px; color: #222; background: #fafafa; }
+section { background: #fff; border: 1px solid #ddd; border-radius: 6px; padding: 12px 18px; margin-bottom: 18px; }
+h1 { font-size: 22px; } h2 { font-size: 17px; margin-top: 4px; } h3 { font-size: 14px; }
+table { border-collapse: collapse; font-size: 13px; } th, td { padding: 4px 10px; text-align: left; border-bottom: 1px solid #eee; }
+svg text { font-size: 11px; fill: #666; } .muted { color: #888; font-size: 12px; }
+.up { color: #2f855a; } .down { color: #c53030; }
+"""
+
+def render_page(panels):
+    sections = "".join(
+        f'<section id="{name}"><h2>{html.escape(title)}</h2>{panels[name]["html"]}'
+        f'<p class="muted">Updated {panels[name]["built_at"]}</p></section>'
+        for name, (title, _, _) in PANELS.items()
+    )
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Trading Bot Dashboard</title>'
+            f'<style>{STYLE}</style></head><body><h1>📊 Trading Bot Dashboard</h1>{sections}</body></html>')
+
+def build(force=False):
+    """Regenerate the panels whose inputs changed and rewrite dashboard.html if any did. Returns their names."""
+    cache = read_json(PANELS_FILE, default={})
+    changed = []
+    for name, (_, version_fn, builder) in PANELS.items():
+        version = hashlib.sha1(json.dumps(version_fn()).encode()).hexdigest()
+        if not force and cache.get(name, {}).get("version") == version:
+            continue
+        cache[name] = {"version": version, "html": builder(),
+                       "built_at": datetime.now().isoformat(sep=" ", timespec="seconds")}
+        changed.append(name)
+
+    if changed or not os.path.exists(DASHBOARD_FILE):
+        with open(DASHBOARD_FILE, "w", encoding="utf-8") as f:
+            f.write(render_page(cache))
+        write_json(PANELS_FILE, cache)
+    return changed
+
+if __name__ == "__main__":
+    # python Dashboard.py [--force]
+    started = datetime.now()
+    changed = build(force="--force" in sys.argv)
+    elapsed = (datetime.now() - started).total_seconds()
+    if changed:
+        print(f"📊 {DASHBOARD_FILE} updated ({', '.join(changed)}) in {elapsed:.2f}s")
+    else:
+        print(f"📊 {DASHBOARD_FILE} is up to date ({elapsed:.2f}s)")
@@ -1,12 +1,49 @@
 import json
 import os
-import yfinance as yf
 from datetime import datetime, time
-import pandas as pd
+from Instrumentation import timer, count
+# yfinance and pandas are imported inside the download functions: reading the cache
+# (every stage's hot path) shouldn't pay for them.
 
 CACHE_FILE = "price_cache.json"
+UNIVERSE_FILE = "ftse100_stocks.json"
 INTRADAY_VALID_FROM = time(8, 30)  # 08:30 AM
 
+# Quotes and intraday downloads go through MarketDataService.py (started on demand) so
+# every bot process shares one warm cache and one upstream request per ticker.
+# BOT_MARKET_DATA_SERVICE=0 talks to yfinance directly.
+# BOT_DATA_BACKEND=offline never touches the network: downloads return the price cache
+# file as it is, intraday bars come from it and a quote is a ticker's last intraday bar
+# (or last daily close). Used by BenchmarkSuite.py and for runs on a copied state dir.
+OFFLINE = os.environ.get("BOT_DATA_BACKEND", "yfinance") == "offline"
+USE_MARKET_DATA_SERVICE = not OFFLINE and os.environ.get("BOT_MARKET_DATA_SERVICE", "1") != "0"
+
+def yf_ticker(code):
+    """yfinance ticker of an LSE code from ftse100_stocks.json (e.g. 'BT.A' → 'BT-A.L')."""
+    return f"{code.rstrip('.').replace('.', '-')}.L"
+
+def load_universe(path=UNIVERSE_FILE):
+    """Return the list of yfinance tickers (e.g. 'BP.L') from ftse100_stocks.json."""
+    with open(path, "r", encoding="utf-8") as f:
+        ftse100 = json.load(f)
+    return list({
+        yf_ticker(stock['code'])
+        for stock in ftse100
+        if stock.get("code")
+    })
+
+def load_market_caps(path=UNIVERSE_FILE):
+    """{yfinance ticker: market cap (£m)} for constituents whose market cap was scraped."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        ftse100 = json.load(f)
+    return {
+        yf_ticker(stock['code']): stock['market_cap']
+        for stock in ftse100
+        if stock.get("code") and stock.get("market_cap")
+    }
+
 def fetch_and_cache_prices(tickers, period="60d", interval="1d", intraday=False, intraday_interval="5m", force=False): # force=True to force update to cahce
     """
     Downloads price history for given tickers in batches, caches into JSON.
@@ -14,20 +51,22 @@ def fetch_and_cache_prices(tickers, period="60d", interval="1d", intraday=False,
     Optional Intraday Download for assessing trends (defer sells)
     """
     # Load existing cache if present
-    if os.path.exists(CACHE_FILE) and not force:
-        with open(CACHE_FILE, 'r') as f:
-            cache = json.load(f)
-            return cache
+    if OFFLINE or (os.path.exists(CACHE_FILE) and not force):
+        return _read_cache()
+
+    import yfinance as yf
 
     # Fetch historical data in a single call to yfinance
-    raw = yf.download(
-        tickers=tickers,
-        period=period,
-        interval=interval,
-        auto_adjust=True,
-        progress=False,
-        group_by='ticker'
-    )
+    with timer("net.yfinance"):
+        raw = yf.download(
+            tickers=tickers,
+            period=period,
+            interval=interval,
+            auto_adjust=True,
+            progress=False,
+            group_by='ticker'
+        )
+    count("net.yfinance.tickers", len(tickers))
 
     # Determine which tickers returned data
     if hasattr(raw.columns, 'levels') and raw.columns.nlevels == 2:
@@ -62,61 +101,114 @@ def fetch_and_cache_prices(tickers, period="60d", interval="1d", intraday=False,
             }
         }
 
-        # Fetch intraday data if requested
-        now = datetime.now().time()
-        timeflag = False
-        if intraday & (now >= INTRADAY_VALID_FROM):
-            timeflag = True
-            try:
-                df_intra = yf.download(
-                    tickers=t,
-                    period="1d",
-                    interval=intraday_interval,
-                    auto_adjust=True,
-                    progress=False
-                )
-
-                if not df_intra.empty:
-                    close_prices = df_intra[('Close', t)]
-                    intraday_data = [
-                        (str(ts), round(float(close), 2))
-                        for ts, close in zip(df_intra.index, close_prices)
-                        if not pd.isna(close)
-                    ]
-
-                    cache[t]['intraday'] = {
-                        'datetime': [entry[0] for entry in intraday_data],
-                        'price':    [entry[1] for entry in intraday_data]
-                    }
-            except Exception as e:
-                print(f"[Warning] Could not fetch intraday for {t}: {e}")
-        
-    if timeflag == False:
+    # Fetch intraday data if requested (one batched call for every ticker)
+    if intraday and datetime.now().time() >= INTRADAY_VALID_FROM:
+        for t, data in fetch_intraday(tickers, intraday_interval).items():
+            cache[t]['intraday'] = data
+    elif intraday:
         print(f"⏳ Skipping - Intraday Logic (market opened recently)")
 
-    # Write cache file
-    with open(CACHE_FILE, 'w') as f:
+    save_cache(cache)
+    return cache
+
+def fetch_intraday(tickers, interval="5m", max_age=60):
+    """
+    Downloads today's intraday closes for all tickers in a single yfinance call
+    (via the market data service, where bars up to max_age seconds old are reused).
+    Returns {ticker: {"datetime": [...], "price": [...]}} for tickers with data.
+    """
+    if OFFLINE:
+        cache = _offline_cache()
+        return {t: cache[t]["intraday"] for t in tickers if cache.get(t, {}).get("intraday", {}).get("price")}
+    if USE_MARKET_DATA_SERVICE and interval == "5m":
+        import MarketDataService
+        try:
+            return MarketDataService.intraday(tickers, max_age)
+        except (OSError, ValueError) as e:
+            print(f"[Warning] Market data service unavailable ({e}) – downloading directly")
+    return _download_intraday(tickers, interval)
+
+def _download_intraday(tickers, interval="5m"):
+    import yfinance as yf
+    import pandas as pd
+    try:
+        with timer("net.yfinance"):
+            raw = yf.download(
+                tickers=tickers,
+                period="1d",
+                interval=interval,
+                auto_adjust=True,
+                progress=False,
+                group_by='ticker'
+            )
+        count("net.yfinance.tickers", len(tickers))
+    except Exception as e:
+        print(f"[Warning] Could not fetch intraday prices: {e}")
+        return {}
+    if raw.empty:
+        return {}
+
+    multi = hasattr(raw.columns, 'levels') and raw.columns.nlevels == 2
+    present = set(raw.columns.get_level_values(0)) if multi else set(tickers)
+    intraday = {}
+    for t in tickers:
+        if t not in present:
+            continue
+        close_prices = raw[(t, 'Close')] if multi else raw['Close']
+        points = [
+            (str(ts), round(float(close), 2))
+            for ts, close in zip(raw.index, close_prices)
+            if not pd.isna(close)
+        ]
+        if points:
+            intraday[t] = {
+                'datetime': [p[0] for p in points],
+                'price':    [p[1] for p in points]
+            }
+    return intraday
+
+def save_cache(cache):
+    """Write the full price cache to CACHE_FILE (read by the CLI scripts and the monitor)."""
+    with timer("json.price_cache.write"), open(CACHE_FILE, 'w') as f:
         json.dump(cache, f, indent=2)
+        count("bytes.written", f.tell())
 
+def _read_cache():
+    with timer("json.price_cache.read"), open(CACHE_FILE, 'rb') as f:
+        raw = f.read()
+        cache = json.loads(raw)
+    count("bytes.read", len(raw))
     return cache
 
+_offline = [None, {}]  # [price cache mtime, cache] for the offline backend
+
+def _offline_cache():
+    mtime = os.path.getmtime(CACHE_FILE) if os.path.exists(CACHE_FILE) else None
+    if mtime != _offline[0]:
+        _offline[:] = [mtime, _read_cache() if mtime else {}]
+    return _offline[1]
+
 # To assess trends in the day (if requested in cache)
 def get_intraday_prices(ticker, cache=None):
     """
     Returns intraday prices [(datetime, close)] from cache.
+    cache: already loaded intraday data (load_cached_prices(data_type="intraday")), else read from disk.
     """
-    if cache is None:
-        data = load_cached_prices(data_type="intraday")
-        if ticker in data:
-            inner_data = data[ticker]
-            if 'datetime' in inner_data and 'price' in inner_data:
-                return [(datetime.fromisoformat(ts), price) for ts, price in zip(inner_data['datetime'], inner_data['price'])]
-            else:
-                print("Missing keys in inner data:", inner_data)
+    data = cache if cache is not None else load_cached_prices(data_type="intraday")
+    if ticker in data:
+        inner_data = data[ticker]
+        if 'datetime' in inner_data and 'price' in inner_data:
+            return [(datetime.fromisoformat(ts), price) for ts, price in zip(inner_data['datetime'], inner_data['price'])]
         else:
-            print(f"Ticker '{ticker}' not found in data:", data)
+            print("Missing keys in inner data:", inner_data)
+    else:
+        print(f"Ticker '{ticker}' not found in intraday data")
 
-        return []
+    return []
+
+def split_cache(cache, data_type):
+    """Return only the daily or intraday part of a full cache ({ticker: {...}})."""
+    return {ticker: data.get(data_type, {}) for ticker, data in cache.items()}
 
 def load_cached_prices(data_type="both"):
     """
@@ -131,8 +223,7 @@ def load_cached_prices(data_type="both"):
     if not os.path.exists(CACHE_FILE):
         raise FileNotFoundError("Cache file not found. Call fetch_and_cache_prices first.")
     
-    with open(CACHE_FILE, 'r') as f:
-        cache = json.load(f)
+    cache = _read_cache()
 
     if data_type == "both":
         return cache
@@ -141,11 +232,7 @@ def load_cached_prices(data_type="both"):
         raise ValueError("data_type must be 'daily', 'intraday', or 'both'")
     
     # Return only the requested part
-    filtered = {}
-    for ticker, data in cache.items():
-        filtered[ticker] = data.get(data_type, {})
-    
-    return filtered
+    return split_cache(cache, data_type)
 
 
 def get_closes(ticker, cache=None):
@@ -156,12 +243,63 @@ def get_closes(ticker, cache=None):
         cache = load_cached_prices(data_type="daily")
     return cache.get(ticker, {}).get('close', [])
 
-def get_current_price(ticker):
+# Live quotes primed from a fresh intraday download (BotDaemon.py, get_current_prices): {ticker: (price, primed_at)}
+QUOTE_MAX_AGE = 90  # seconds a primed quote is used instead of asking yfinance
+_quotes = {}
+
+def prime_quotes(intraday):
+    """Use the last intraday close of each ticker as its live quote for QUOTE_MAX_AGE seconds."""
+    now = datetime.now().timestamp()
+    for ticker, data in intraday.items():
+        if data.get('price'):
+            _quotes[ticker] = (data['price'][-1], now)
+
+def get_current_prices(tickers):
+    """
+    Live quotes for many tickers with one bulk request (last intraday bar); tickers
+    without intraday data go straight to a direct quote (the service isn't asked
+    again one ticker at a time). Also primes the quote cache.
+    """
+    tickers = list(tickers)
+    if USE_MARKET_DATA_SERVICE:
+        import MarketDataService
+        try:
+            quotes = MarketDataService.quotes(tickers)
+        except (OSError, ValueError):
+            quotes = {}
+        now = datetime.now().timestamp()
+        for ticker, price in quotes.items():
+            _quotes[ticker] = (price, now)
+    else:
+        prime_quotes(fetch_intraday(tickers))
+    return {t: get_current_price(t, service=False) for t in tickers}
+
+def get_current_price(ticker, service=True):
+    quote = _quotes.get(ticker)
+    if quote and datetime.now().timestamp() - quote[1] <= QUOTE_MAX_AGE:
+        return quote[0]
+    if service and USE_MARKET_DATA_SERVICE:
+        import MarketDataService
+        try:
+            price = MarketDataService.quotes([ticker]).get(ticker)
+            if price:
+                return price
+        except (OSError, ValueError):
+            pass
+    if OFFLINE:
+        data = _offline_cache().get(ticker, {})
+        prices = data.get("intraday", {}).get("price") or data.get("daily", {}).get("close")
+        return prices[-1] if prices else None
+    import yfinance as yf
     t = yf.Ticker(ticker)
-    try:
-        return t.fast_info.last_price
-    except Exception:
-        return t.info.get('regularMarketPrice')
+    with timer("net.yfinance"):
+        try:
+            price = t.fast_info.last_price
+        except Exception:
+            price = t.info.get('regularMarketPrice')
+    if price:
+        _quotes[ticker] = (price, datetime.now().timestamp())  # Reused for QUOTE_MAX_AGE like bulk quotes
+    return price
 
 # For Debugging
 #ftse100 = pd.read_csv("ftse100_constituents.csv")
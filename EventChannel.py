@@ -0,0 +1,120 @@
+# EventChannel.py
+import os
+import json
+import time
+import socket
+from datetime import datetime
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+EVENTS_DIR = "events"
+USE_SOCKETS = hasattr(socket, "AF_UNIX") and os.name != "nt"
+FILE_POLL_SECONDS = 0.5  # Fallback only: how often a listener checks its events file
+
+# Channels used by the bot:
+#   "monitor"        → MonitorDeferredSells listens: {"event": "deferred", "ticker", "stock"}
+#   "monitor_events" → whoever waits on the monitor: {"event": "sold", "ticker", "price", "shares"},
+#                      {"event": "done", "success"}
+# Every message also carries "time" (ISO). Publishing to a channel nobody is listening
+# on is a no-op, so state that must survive (deferred_sells.json, the trade journal)
+# still lives in files; events only say "look now".
+
+# Transport: one Unix domain datagram socket per channel (events/<channel>.sock).
+# Where AF_UNIX isn't available (Windows) the listener owns events/<channel>.jsonl
+# instead and publishers append one line per event.
+
+def _path(channel):
+    return os.path.join(EVENTS_DIR, f"{channel}.sock" if USE_SOCKETS else f"{channel}.jsonl")
+
+# ─── PUBLISH ────────────────────────────────────────────────────────────────────
+
+def publish(channel, event, **data):
+    """Send an event to a channel. Returns True if a listener was there to receive it."""
+    path = _path(channel)
+    payload = json.dumps({"event": event, "time": datetime.now().isoformat(), **data}).encode()
+    if USE_SOCKETS:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.sendto(payload, path)
+            return True
+        except OSError:  # No socket file, or a stale one left by a dead listener
+            return False
+        finally:
+            sock.close()
+    if not os.path.exists(path):
+        return False
+    with open(path, "ab") as f:
+        f.write(payload + b"\n")  # Single append: concurrent publishers don't interleave
+    return True
+
+# ─── LISTEN ─────────────────────────────────────────────────────────────────────
+
+class Listener:
+    """
+    Receiving end of a channel. Create it *before* starting whatever will publish
+    to it so no event is missed; only one listener per channel at a time.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.path = _path(channel)
+        os.makedirs(EVENTS_DIR, exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left over from a listener that didn't close
+        if USE_SOCKETS:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(self.path)
+        else:
+            open(self.path, "wb").close()
+            self._offset = 0
+            self._pending = []
+
+    def get(self, timeout=None):
+        """Wait up to timeout seconds (None = forever) for the next event; None on timeout."""
+        if USE_SOCKETS:
+            self._sock.settimeout(timeout)
+            try:
+                return json.loads(self._sock.recv(65536))
+            except (socket.timeout, BlockingIOError):  # timeout=0 makes the socket non-blocking
+                return None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._read_file()
+            if self._pending:
+                return self._pending.pop(0)
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(FILE_POLL_SECONDS if deadline is None
+                       else max(0, min(FILE_POLL_SECONDS, deadline - time.monotonic())))
+
+    def drain(self):
+        """Return every event already waiting, without blocking."""
+        events = []
+        while True:
+            event = self.get(timeout=0)
+            if event is None:
+                return events
+            events.append(event)
+
+    def _read_file(self):
+        if os.path.getsize(self.path) <= self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Publisher still writing
+                self._offset += len(line)
+                if line.strip():
+                    self._pending.append(json.loads(line))
+
+    def close(self):
+        if USE_SOCKETS:
+            self._sock.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
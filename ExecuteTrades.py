@@ -1,17 +1,18 @@
 # ExecuteTrades.py
-import time
-import json
-import os
+import math
 from datetime import date, datetime, time
 #import yfinance as yf
-from DataManager import get_current_price, get_closes, get_intraday_prices 
-import tempfile # Writing JSON files (avoid issues when run multiple instances of script)
-from sklearn.linear_model import LinearRegression
-import numpy as np
+from DataManager import get_current_price, get_current_prices, get_intraday_prices, load_cached_prices, split_cache, OFFLINE
+from PaperBroker import PaperBroker, InlineBroker, make_order, cost_bps, average_daily_volumes
+from TradeJournal import append_trades
+from PortfolioHistory import append_entry
+from EventChannel import publish
+from Trend import minutes_since_first, trend_batch
+from StateAccess import read_json, read_versioned, write_json, update_json, VersionConflict  # Locked, versioned JSON state
+from Instrumentation import timer, count
 
 # ─── 1) SETTINGS ────────────────────────────────────────────────────────────────
 PORTFOLIO_FILE = "portfolio_summary.json"
-TRADES_LOG     = "trades_log.json"
 SIGNALS_FILE   = "trade_signals.json"
 SCREEN_FILE    = "daily_screen.json"
 DEFERRED_SELLS_FILE = "deferred_sells.json"
@@ -23,333 +24,426 @@ ALLOW_FRACTIONAL = True  # Toggle for fractional share buying
 TREND_SLOPE_THRESHOLD = 0.05  # Change to suit trends
 INTRADAY_VALID_FROM = time(8, 30)  # 08:30 AM
 
-# Load File - Check if currently being written to
-def load_json_with_retry(filepath, retries=5, delay=5):
-    """Attempt to load JSON from a file, retrying on failure."""
-    for attempt in range(retries):
-        try:
-            with open(filepath) as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError, OSError) as e:
-            print(f"⚠️ Error reading {filepath}: {e}. Retrying in {delay}s...")
-            time.sleep(delay)
-    raise RuntimeError(f"❌ Failed to load {filepath} after {retries} attempts.")
-
-# Tempfile Writing (save issues with concurrency)
-def atomic_write_json(data, filepath):
-    """Write JSON to a temporary file, then replace the original file atomically."""
-    dir_name = os.path.dirname(os.path.abspath(filepath)) or "."
-    with tempfile.NamedTemporaryFile('w', delete=False, dir=dir_name, suffix=".tmp") as tmp:
-        json.dump(data, tmp, indent=2)
-        tempname = tmp.name
-    os.replace(tempname, filepath)
-
-# ─── 2) LOAD OR INIT PORTFOLIO ──────────────────────────────────────────────────
-if os.path.exists(PORTFOLIO_FILE):
-    summary = load_json_with_retry(PORTFOLIO_FILE)
-    cash     = summary.get("cash", INITIAL_CASH)
-    holdings = summary.get("holdings", {})
-    history  = summary.get("history", [])
-else:
-    cash     = INITIAL_CASH
-    holdings = {}
-    history  = []
-
-# ─── 3) LOAD SIGNALS & SCREEN ───────────────────────────────────────────────────
-sigs = load_json_with_retry(SIGNALS_FILE)
-buy_sigs  = sigs.get("buy_signals", {})
-sell_sigs = sigs.get("sell_signals", {})
-
-screen = load_json_with_retry(SCREEN_FILE)
-momentum_map = screen.get("momentum", {})
-
-# ─── 3B) CREATE PRICE CACHE ─────────────────────────────────────────────────────
-tickers_needed = set(buy_sigs) | set(sell_sigs) | set(holdings)
-price_cache = {t: get_current_price(t) for t in tickers_needed}
-
-# ─── 4) LOAD OR INIT TRADE LOG ──────────────────────────────────────────────────
-if os.path.exists(TRADES_LOG):
-    trade_log = load_json_with_retry(TRADES_LOG)
-else:
-    trade_log = []
-
-# ─── 5) EXECUTE SELLS (WITH DEFERRED IF MOMENTUM POSITIVE) ──────────────────────
-
-def is_trending_up(intraday_prices):
+def load_portfolio():
+    """Return (portfolio, version) – a fresh portfolio (version None) if there is no file yet."""
+    portfolio, version = read_versioned(PORTFOLIO_FILE)
+    if portfolio is None:
+        portfolio = {"cash": INITIAL_CASH, "holdings": {}, "history": []}
+    return portfolio, version
+
+def rebase_portfolio(trades, latest, prices, kept):
     """
-    Estimate trend using linear regression.
-    intraday_prices: list of (timestamp, price) tuples
-    Returns True if the slope indicates upward trend.
+    Replay this run's trades one at a time on a portfolio someone else has changed
+    in the meantime (latest), e.g. MonitorDeferredSells selling a deferred ticker.
+    A fill latest can no longer cover – a SELL of shares it doesn't hold, a BUY
+    its cash doesn't pay for – is dropped with its cash; the trades that were
+    applied go into kept (for the journal). One history entry is added.
     """
-    if len(intraday_prices) < 5:
-        return False  # not enough data
-
-    # Convert times to numeric values (minutes since open)
-    times = np.array([(dt - intraday_prices[0][0]).total_seconds() / 60 for dt, _ in intraday_prices]).reshape(-1, 1)
-    prices = np.array([p for _, p in intraday_prices])
-
-    # Linear regression
-    model = LinearRegression()
-    model.fit(times, prices)
-    slope = model.coef_[0]
-
-    return slope >= TREND_SLOPE_THRESHOLD
-
-
-# Load existing deferred sells (if any)
-if os.path.exists(DEFERRED_SELLS_FILE):
-    deferred_sells = load_json_with_retry(DEFERRED_SELLS_FILE)
-else:
-    deferred_sells = {}
+    latest = latest or {"cash": INITIAL_CASH, "holdings": {}, "history": []}
+    cash = latest.get("cash", INITIAL_CASH)
+    holdings = dict(latest.get("holdings", {}))
+    for trade in trades:
+        t, shares = trade["ticker"], trade["shares"]
+        value = shares * trade["price"]
+        if trade["action"] == "BUY":
+            if value > cash + 0.005:
+                print(f"🔀 Dropped BUY {shares} of {t}: not enough cash left in the latest portfolio")
+                continue
+            cash -= value
+            holdings[t] = round(holdings.get(t, 0) + shares, 3)
+        else:
+            held = holdings.get(t, 0)
+            if shares > held + 1e-9:
+                print(f"🔀 Dropped SELL {shares} of {t}: the latest portfolio holds {held}")
+                continue
+            cash += value
+            remaining = round(held - shares, 3)
+            if remaining > 0:
+                holdings[t] = remaining
+            else:
+                holdings.pop(t, None)
+        kept.append(trade)
+    rebased = {**latest, "date": datetime.now().isoformat(), "cash": round(cash, 2), "holdings": holdings}
+    total_val = cash + sum(prices.get(t, 0) * s for t, s in holdings.items())
+    append_entry(rebased, cash, total_val, holdings)
+    return rebased
+
+def floor_shares(amount, price):
+    """Shares (3 dp) that amount buys at price, rounded down so they never cost more than amount."""
+    return math.floor(amount / price * 1000) / 1000 if price > 0 else 0
+
+def clamp_to_cash(fill, cash):
+    """Cut a BUY fill down to what cash pays for: cash never goes below zero."""
+    if fill["status"] != "REJECTED" and fill["filled_shares"] * fill["fill_price"] > cash:
+        fill["filled_shares"] = floor_shares(cash, fill["fill_price"])
+    return fill
+
+def execute_trades(sigs, screen, portfolio=None, daily_cache=None, intraday_cache=None, portfolio_version=None):
+    """
+    Execute sells (deferring those still trending up) and momentum-weighted buys.
+    sigs: trade signals, screen: daily screen, portfolio: portfolio summary dict,
+    daily_cache / intraday_cache: price cache parts (loaded from disk if not given),
+    portfolio_version: StateAccess version the given portfolio was read at.
+    Writes deferred sells, the trade journal and the portfolio file.
+    Returns (new portfolio summary, list of new trades).
+    """
+    # ─── 2) LOAD OR INIT PORTFOLIO ──────────────────────────────────────────────
+    if portfolio is None:
+        portfolio, portfolio_version = load_portfolio()
+    cash     = portfolio.get("cash", INITIAL_CASH)
+    holdings = dict(portfolio.get("holdings", {}))
+    history  = portfolio.get("history", [])
+    history_meta = {k: portfolio[k] for k in ("daily_closes", "history_downsampled") if k in portfolio}
+
+    # ─── 3) SIGNALS & SCREEN ────────────────────────────────────────────────────────
+    buy_sigs  = sigs.get("buy_signals", {})
+    sell_sigs = sigs.get("sell_signals", {})
+    momentum_map = screen.get("momentum", {})
+
+    # ─── 3B) CREATE PRICE CACHE ─────────────────────────────────────────────────────
+    tickers_needed = set(buy_sigs) | set(sell_sigs) | set(holdings)
+    with timer("execute.quotes"):
+        price_cache = get_current_prices(tickers_needed)  # One bulk request
+
+    # ─── 3C) START PAPER BROKER ─────────────────────────────────────────────────────
+    # Orders are filled by the paper-broker process (spread, slippage, partial fills),
+    # or in-process on the offline data backend
+    if daily_cache is None or intraday_cache is None:
+        try:
+            full_cache = load_cached_prices()
+        except FileNotFoundError:
+            full_cache = {}
+        daily_cache = split_cache(full_cache, "daily") if daily_cache is None else daily_cache
+        intraday_cache = split_cache(full_cache, "intraday") if intraday_cache is None else intraday_cache
+    broker = (InlineBroker if OFFLINE else PaperBroker)(volumes=average_daily_volumes(daily_cache, tickers_needed))
+    est_cost = 1 + cost_bps(broker.config) / 10_000  # Expected fill price / quote for sizing buys
+    execution_cost = 0.0
+
+    # ─── 4) NEW TRADES (APPENDED TO THE JOURNAL IN STEP 9) ──────────────────────────
+    new_trades = []
+
+    def apply_fill(fill, note=""):
+        """Book a broker fill into cash, holdings and the new trades list. Returns shares filled."""
+        nonlocal cash, execution_cost
+        t, shares, price = fill["ticker"], fill["filled_shares"], fill["fill_price"]
+        if fill["status"] == "REJECTED" or shares <= 0:
+            print(f"⚠️ {fill['side']} {t} rejected by broker")
+            return 0
+        if fill["side"] == "BUY":
+            cash -= shares * price
+            holdings[t] = round(holdings.get(t, 0) + shares, 3)
+        else:
+            cash += shares * price
+            remaining = round(holdings.get(t, 0) - shares, 3)
+            if remaining > 0:
+                holdings[t] = remaining
+            else:
+                holdings.pop(t, None)
+        execution_cost += fill["cost"]
+        new_trades.append({
+            "ticker": t,
+            "action": fill["side"],
+            "trigger": fill["trigger"],
+            "date":   datetime.now().isoformat(),
+            "price":  price,
+            "shares": shares,
+            "quote_price": fill["quote_price"]
+        })
+        partial = f" (partial {shares}/{fill['shares']})" if fill["status"] == "PARTIAL" else ""
+        verb = "Bought" if fill["side"] == "BUY" else "Sold"
+        print(f"{verb} {shares} of {t} @ ${price:.2f}{partial}{note}")
+        return shares
 
+    # ─── 5) EXECUTE SELLS (WITH DEFERRED IF MOMENTUM POSITIVE) ──────────────────────
+    # Load existing deferred sells (if any)
+    deferred_sells = read_json(DEFERRED_SELLS_FILE, default={})
 
-now = datetime.now().time()
+    now = datetime.now().time()
+    sell_orders = []
+    newly_deferred = []
 
-for tkr, info in sell_sigs.items():
-    
-    # Momentum Only Updated Daily
-    momentum = momentum_map.get(tkr, 0)
+    # Intraday trend of every sell candidate in one batched pass (slope per minute since first bar)
+    intraday_series = {}
+    if now >= INTRADAY_VALID_FROM:
+        for tkr in sell_sigs:
+            try:
+                points = get_intraday_prices(tkr, intraday_cache)  # List of (datetime, price)
+            except Exception as e:
+                print(f"Skipping {tkr}: failed to load intraday prices ({e})")
+                continue
+            if points and all(len(p) == 2 for p in points):
+                intraday_series[tkr] = points
+    trends = trend_batch(
+        {t: [p for _, p in pts] for t, pts in intraday_series.items()},
+        xs={t: minutes_since_first([dt for dt, _ in pts]) for t, pts in intraday_series.items()}
+    )
 
-    # Reason for Sell
-    trigger = info.get("trigger", "unspecified")  
+    for tkr, info in sell_sigs.items():
 
-    # Get today's current and last close price
-    current_price = get_current_price(tkr)
-    closes = get_closes(tkr)
-    last_close_price = closes[-1] if closes else 0
+        # Momentum Only Updated Daily
+        momentum = momentum_map.get(tkr, 0)
 
-    if now >= INTRADAY_VALID_FROM:
+        # Reason for Sell
+        trigger = info.get("trigger", "unspecified")  
 
-        # Optional: Load intraday price data
-        try:
-            intraday_prices = get_intraday_prices(tkr)  # List of (datetime, price)
-        except Exception as e:
-            print(f"Skipping {tkr}: failed to load intraday prices ({e})")
-            continue
+        # Get today's current and last close price
+        current_price = get_current_price(tkr)
+        closes = daily_cache.get(tkr, {}).get("close", [])
+        last_close_price = closes[-1] if closes else 0
 
-        # Skip if intraday_prices is missing or invalid
-        if not intraday_prices or not all(len(p) == 2 for p in intraday_prices):
-            print(f"Skipping {tkr}: intraday data is missing or invalid")
-            continue
+        if now >= INTRADAY_VALID_FROM:
 
-        try:
-            if current_price > last_close_price * 1.01 and is_trending_up(intraday_prices): # Delay if >1% threshold increase and slope trending up
-                percent_change = ((current_price - last_close_price) / last_close_price) * 100
-                # Defer selling stocks still trending upward
-                deferred_sells[tkr] = {
-                    "latest_price": current_price,
-                    "momentum": momentum,
-                    "date_flagged": str(date.today())
-                }
-                print(f"⏩ Deferred selling {tkr}: positive momentum ({momentum:.2f})")
+            # Skip if intraday_prices is missing or invalid
+            if tkr not in trends:
+                print(f"Skipping {tkr}: intraday data is missing or invalid")
                 continue
-        except Exception as e:
-            print(f"Error processing {tkr}: {e}")
-    else:
-        print(f"⏳ Skipping - Intraday Logic ({tkr} (market just opened)")
-
-    # Otherwise, sell normally
-    if tkr in holdings:
-        shares = holdings.pop(tkr)
-        price  = current_price
-        cash  += shares * price
-        trade_log.append({
-            "ticker": tkr,
-            "action": "SELL",
-            "trigger": trigger,
-            "date":   datetime.now().isoformat(),
-            "price":  price,
-            "shares": shares
-        })
-        print(f"Sold {shares} of {tkr} @ ${price:.2f}")
-    else:
-        print(f"⚠️ Tried to sell {tkr}, but it's not in holdings.")
-
-# Save updated deferred sells
-atomic_write_json(deferred_sells, DEFERRED_SELLS_FILE)
-print(f"\n📄 Deferred sells updated in {DEFERRED_SELLS_FILE} ({len(deferred_sells)} tickers)")
 
-# ─── 5B) AUTO-CLEAN OLD OR INVALID DEFERRED SELLS ───────────────────────────────
-cleaned_deferred_sells = {}
-today = date.today()
+            try:
+                trend = trends[tkr]
+                trending_up = trend["slope"] is not None and trend["slope"] >= TREND_SLOPE_THRESHOLD
+                if current_price > last_close_price * 1.01 and trending_up: # Delay if >1% threshold increase and slope trending up
+                    percent_change = ((current_price - last_close_price) / last_close_price) * 100
+                    # Defer selling stocks still trending upward
+                    deferred_sells[tkr] = {
+                        "latest_price": current_price,
+                        "momentum": momentum,
+                        "date_flagged": str(date.today())
+                    }
+                    newly_deferred.append(tkr)
+                    print(f"⏩ Deferred selling {tkr}: positive momentum ({momentum:.2f})")
+                    continue
+            except Exception as e:
+                print(f"Error processing {tkr}: {e}")
+        else:
+            print(f"⏳ Skipping - Intraday Logic ({tkr} (market just opened)")
 
-for tkr, record in deferred_sells.items():
-    try:
-        flagged_date = datetime.strptime(record["date_flagged"], "%Y-%m-%d").date()
-    except Exception as e:
-        print(f"⚠️ Skipping {tkr} due to invalid date format: {e}")
-        continue
-
-    age_days = (today - flagged_date).days
-
-    # Only keep deferred sells if:
-    # 1) Ticker is still in holdings
-    # 2) Flagged within CLEAN_THRESHOLD_DAYS
-    if tkr in holdings and age_days <= CLEAN_THRESHOLD_DAYS:
-        cleaned_deferred_sells[tkr] = record
-    else:
-        reason = []
-        if tkr not in holdings:
-            reason.append("not in holdings")
-        if age_days > CLEAN_THRESHOLD_DAYS:
-            reason.append(f"deferred {age_days} days ago")
-        print(f"🧹 Removing {tkr} from deferred sells ({' and '.join(reason)})")
-
-# Save cleaned deferred sells
-atomic_write_json(cleaned_deferred_sells, DEFERRED_SELLS_FILE)
-print(f"\n🧽 Deferred sells cleaned: {len(cleaned_deferred_sells)} active tickers remain")
-
-# ─── 6) EXECUTE BUYS (MOMENTUM WEIGHTED + CAP + MIN + GREEDY) ──────────────────
-buy_list = [t for t in buy_sigs if t in momentum_map and momentum_map[t] > 0]
-start_cash = cash
-
-summary = {
-    "bought": [],
-    "skipped": [],
-    "opportunistic": [],
-    "no_alloc": False,
-    "no_signals": False,
-}
-
-if buy_list:
-    m_vals = {t: momentum_map[t] for t in buy_list}
-    total_m = sum(m_vals.values())
-    raw_w = {t: m_vals[t] / total_m for t in buy_list}
-
-    # Cap weights at MAX_ALLOC
-    capped, overflow = {}, 0.0
-    for t, w in raw_w.items():
-        if w > MAX_ALLOC:
-            capped[t] = MAX_ALLOC
-            overflow += w - MAX_ALLOC
+        # Otherwise, sell normally
+        if tkr in holdings:
+            sell_orders.append(make_order(tkr, "SELL", holdings[tkr], current_price, trigger))
         else:
-            capped[t] = w
-
-    # Redistribute overflow
-    uncapped = {t: w for t, w in capped.items() if w < MAX_ALLOC}
-    unc_total = sum(uncapped.values())
-    if uncapped and overflow > 0:
-        for t in uncapped:
-            capped[t] += (capped[t] / unc_total) * overflow
-
-    # Normalize and apply MIN_ALLOC
-    tot_w = sum(capped.values())
-    final_w = {t: w / tot_w for t, w in capped.items()}
-    alloc_univ = {t: w for t, w in final_w.items() if w >= MIN_ALLOC}
-
-    if alloc_univ:
-        s = sum(alloc_univ.values())
-        final_w = {t: w / s for t, w in alloc_univ.items()}
-
-        for t, w in final_w.items():
-            info = buy_sigs[t]
-            trigger = info.get("trigger", "unspecified") # Reason for Buy
-            alloc = w * start_cash
-            price = info["latest_price"]
-
-            if ALLOW_FRACTIONAL:
-                shares = round(alloc/price,6)
-                shares = round(shares,3) if shares>=0.001 else 0
-            else:
-                shares = int(alloc//price)
-            if shares<=0 or shares*price>cash:
-                summary['skipped'].append((t,alloc,price))
+            print(f"⚠️ Tried to sell {tkr}, but it's not in holdings.")
+
+    # Submit all sells as one batch
+    if sell_orders:
+        with timer("broker.batch"):
+            fills = broker.submit_batch(sell_orders).result()
+        for fill in fills:
+            apply_fill(fill)
+
+    # ─── 5B) SAVE + AUTO-CLEAN OLD OR INVALID DEFERRED SELLS ────────────────────────
+    # Merged into the file under its write lock: the monitor may have removed (sold)
+    # or updated entries since we read it.
+    today = date.today()
+
+    def merge_and_clean(current):
+        merged = {**(current or {}), **{t: deferred_sells[t] for t in newly_deferred}}
+        cleaned = {}
+        for tkr, record in merged.items():
+            try:
+                flagged_date = datetime.strptime(record["date_flagged"], "%Y-%m-%d").date()
+            except Exception as e:
+                print(f"⚠️ Skipping {tkr} due to invalid date format: {e}")
                 continue
 
-            cash -= shares*price
-            holdings[t] = round(holdings.get(t, 0) + shares, 3)
-            trade_log.append({
-                "ticker": t,
-                "action": "BUY",
-                "trigger": trigger,
-                "date": datetime.now().isoformat(),
-                "price": price,
-                "shares": shares
-            })
-            print(f"Bought {shares} of {t} @ ${price:.2f}")
-            summary["bought"].append((t, shares, price))
-
-        # Opportunistic buys
-        price_map = {t:price_cache[t] for t in set(holdings)|set(buy_list)}
-
-        while True:
-            total_val = cash + sum(get_current_price(t)*s for t,s in holdings.items())
-            viable = {t:p for t,p in price_map.items() if p>0 and cash>=(0.01 if ALLOW_FRACTIONAL else p)}
-            if not viable: break
-            pick,price = min(viable.items(),key=lambda kv:kv[1])
-            if ALLOW_FRACTIONAL:
-                max_inv = min(cash,(MAX_ALLOC*total_val)-holdings.get(pick,0)*price)
-                shares = round(max_inv/price,3) if max_inv/price>=0.001 else 0
+            age_days = (today - flagged_date).days
+
+            # Only keep deferred sells if:
+            # 1) Ticker is still in holdings
+            # 2) Flagged within CLEAN_THRESHOLD_DAYS
+            if tkr in holdings and age_days <= CLEAN_THRESHOLD_DAYS:
+                cleaned[tkr] = record
+            else:
+                reason = []
+                if tkr not in holdings:
+                    reason.append("not in holdings")
+                if age_days > CLEAN_THRESHOLD_DAYS:
+                    reason.append(f"deferred {age_days} days ago")
+                print(f"🧹 Removing {tkr} from deferred sells ({' and '.join(reason)})")
+        return cleaned
+
+    cleaned_deferred_sells = update_json(DEFERRED_SELLS_FILE, merge_and_clean, default={})
+    print(f"\n🧽 Deferred sells saved to {DEFERRED_SELLS_FILE}: {len(cleaned_deferred_sells)} active tickers")
+
+    # Hand new deferrals straight to a running MonitorDeferredSells (no-op if it isn't running)
+    for tkr in newly_deferred:
+        if tkr in cleaned_deferred_sells:
+            publish("monitor", "deferred", ticker=tkr, stock=cleaned_deferred_sells[tkr])
+
+    # ─── 6) EXECUTE BUYS (MOMENTUM WEIGHTED + CAP + MIN + GREEDY) ──────────────────
+    buy_list = [t for t in buy_sigs if t in momentum_map and momentum_map[t] > 0]
+    start_cash = cash
+
+    summary = {
+        "bought": [],
+        "skipped": [],
+        "opportunistic": [],
+        "no_alloc": False,
+        "no_signals": False,
+    }
+
+    if buy_list:
+        m_vals = {t: momentum_map[t] for t in buy_list}
+        total_m = sum(m_vals.values())
+        raw_w = {t: m_vals[t] / total_m for t in buy_list}
+
+        # Cap weights at MAX_ALLOC
+        capped, overflow = {}, 0.0
+        for t, w in raw_w.items():
+            if w > MAX_ALLOC:
+                capped[t] = MAX_ALLOC
+                overflow += w - MAX_ALLOC
             else:
-                shares = 1 if price<=cash else 0
-            if shares<=0 or shares*price>cash: break
-            cash-=shares*price
-            holdings[pick]=round(holdings.get(pick,0)+shares,3)
-            trade_log.append({
-                "ticker":pick,
-                "action":"BUY",
-                "trigger": "opportunistic",
-                "date": datetime.now().isoformat(),
-                "price":price,
-                "shares":shares
-            })
-            print(f"Bought {shares} of {pick} @ ${price:.2f} (opportunistic)")
-            summary['opportunistic'].append((pick,price,shares))
+                capped[t] = w
+
+        # Redistribute overflow
+        uncapped = {t: w for t, w in capped.items() if w < MAX_ALLOC}
+        unc_total = sum(uncapped.values())
+        if uncapped and overflow > 0:
+            for t in uncapped:
+                capped[t] += (capped[t] / unc_total) * overflow
+
+        # Normalize and apply MIN_ALLOC
+        tot_w = sum(capped.values())
+        final_w = {t: w / tot_w for t, w in capped.items()}
+        alloc_univ = {t: w for t, w in final_w.items() if w >= MIN_ALLOC}
+
+        if alloc_univ:
+            s = sum(alloc_univ.values())
+            final_w = {t: w / s for t, w in alloc_univ.items()}
+
+            buy_orders = []
+            budget = cash
+            for t, w in final_w.items():
+                info = buy_sigs[t]
+                trigger = info.get("trigger", "unspecified") # Reason for Buy
+                alloc = w * start_cash
+                price = info["latest_price"]
+                sizing_price = price * est_cost  # Leave room for spread/slippage
+
+                if ALLOW_FRACTIONAL:
+                    shares = round(alloc/sizing_price,6)
+                    shares = round(shares,3) if shares>=0.001 else 0
+                else:
+                    shares = int(alloc//sizing_price)
+                if shares<=0 or shares*sizing_price>budget:
+                    summary['skipped'].append((t,alloc,price))
+                    continue
+
+                budget -= shares*sizing_price
+                buy_orders.append(make_order(t, "BUY", shares, price, trigger))
+
+            # Submit the whole rebalance as one batch
+            if buy_orders:
+                with timer("broker.batch"):
+                    fills = broker.submit_batch(buy_orders).result()
+                for fill in fills:
+                    filled = apply_fill(clamp_to_cash(fill, cash))
+                    if filled:
+                        summary["bought"].append((fill["ticker"], filled, fill["fill_price"]))
+
+            # Opportunistic buys
+            price_map = {t:price_cache[t] for t in set(holdings)|set(buy_list)}
+
+            while True:
+                count("execute.opportunistic_rounds")
+                total_val = cash + sum(get_current_price(t)*s for t,s in holdings.items())
+                viable = {t:p for t,p in price_map.items() if p>0 and cash>=(0.01 if ALLOW_FRACTIONAL else p)}
+                if not viable: break
+                pick,price = min(viable.items(),key=lambda kv:kv[1])
+                adv = broker.volumes.get(pick)
+                if ALLOW_FRACTIONAL:
+                    max_inv = min(cash,(MAX_ALLOC*total_val)-holdings.get(pick,0)*price)
+                    shares = floor_shares(max_inv, price * est_cost)
+                    # Market impact grows with size: re-size at the impact of that (larger) first estimate
+                    sizing_price = price * (1 + cost_bps(broker.config, shares, adv) / 10_000)
+                    shares = floor_shares(max_inv, sizing_price)
+                else:
+                    sizing_price = price * (1 + cost_bps(broker.config, 1, adv) / 10_000)
+                    shares = 1 if sizing_price<=cash else 0
+                if shares<=0 or shares*sizing_price>cash: break
+                with timer("broker.order"):
+                    fill = broker.submit(make_order(pick, "BUY", shares, price, "opportunistic")).result()
+                filled = apply_fill(clamp_to_cash(fill, cash), note=" (opportunistic)")
+                if fill["status"] != "FILLED" or not filled:
+                    price_map.pop(pick)  # Don't keep re-ordering a name the market can't fill
+                if filled:
+                    summary['opportunistic'].append((pick,fill["fill_price"],filled))
+        else:
+            summary['no_alloc'] = True
     else:
-        summary['no_alloc'] = True
-else:
-    summary['no_signals'] = True
-
-# ─── PRINT SUMMARY ──────────────────────────────────────────────────────────────
-# print("\n=== Buy Summary ===")
-# if summary["no_signals"]:
-#     print("No positive-momentum buy signals to execute.")
-# elif summary["no_alloc"]:
-#     print("⚠️ No tickers met the 1% min allocation threshold.")
-# else:
-#     if summary["bought"]:
-#         print(f"✅ Bought: {len(summary['bought'])} tickers")
-#         for t, s, p in summary["bought"]:
-#             print(f"  - {t}: {s} shares @ ${p:.2f}")
-#     if summary["skipped"]:
-#         print(f"⚠️ Skipped (alloc < price): {len(summary['skipped'])}")
-#         for t, alloc, price in summary["skipped"]:
-#             print(f"  - {t}: alloc ${alloc:.2f} < price ${price:.2f}")
-#     if summary["opportunistic"]:
-#         print(f"💡 Opportunistic buys: {len(summary['opportunistic'])}")
-#         for t, p, s in summary["opportunistic"]:
-#             print(f"  - {t}: {s:.3f} shares @ ${p:.2f}")
-
-
-# ─── 7) SAVE TRADE LOG ──────────────────────────────────────────────────────────
-atomic_write_json(trade_log, TRADES_LOG)
-
-# ─── 8) UPDATE PORTFOLIO VALUE & HISTORY ───────────────────────────────────────
-# Fetch live price via fast_info for current holdings
-total_val = cash + sum(price_cache[t]*s for t,s in holdings.items())
-
-history.append({
-    "datetime":    datetime.now().isoformat(),
-    "cash":        round(cash, 2),
-    "total_value": round(total_val, 2),
-    "holdings":    holdings
-})
-
-# ─── 9) SAVE UPDATED PORTFOLIO SUMMARY ─────────────────────────────────────────
-new_summary = {
-    "date":     datetime.now().isoformat(),
-    "cash":     round(cash, 2),
-    "holdings": holdings,
-    "history":  history
-}
-
-atomic_write_json(new_summary, PORTFOLIO_FILE)
-
-# ─── 10) PRINT STATUS ───────────────────────────────────────────────────────────
-print("\n✅ Trades executed.")
-print(f"Cash: ${new_summary['cash']:.2f}")
-# print("Holdings:")
-# for t, s in holdings.items():
-#     print(f" • {t}: {s} shares  (live @ ${get_current_price(t):.2f})")
-print(f"Portfolio total value: ${total_val:.2f}")
-print(f"History entries: {len(history)}")
\ No newline at end of file
+        summary['no_signals'] = True
+
+    # ─── PRINT SUMMARY ──────────────────────────────────────────────────────────────
+    # print("\n=== Buy Summary ===")
+    # if summary["no_signals"]:
+    #     print("No positive-momentum buy signals to execute.")
+    # elif summary["no_alloc"]:
+    #     print("⚠️ No tickers met the 1% min allocation threshold.")
+    # else:
+    #     if summary["bought"]:
+    #         print(f"✅ Bought: {len(summary['bought'])} tickers")
+    #         for t, s, p in summary["bought"]:
+    #             print(f"  - {t}: {s} shares @ ${p:.2f}")
+    #     if summary["skipped"]:
+    #         print(f"⚠️ Skipped (alloc < price): {len(summary['skipped'])}")
+    #         for t, alloc, price in summary["skipped"]:
+    #             print(f"  - {t}: alloc ${alloc:.2f} < price ${price:.2f}")
+    #     if summary["opportunistic"]:
+    #         print(f"💡 Opportunistic buys: {len(summary['opportunistic'])}")
+    #         for t, p, s in summary["opportunistic"]:
+    #             print(f"  - {t}: {s:.3f} shares @ ${p:.2f}")
+
+
+    broker.close()
+
+    # ─── 7) UPDATE PORTFOLIO VALUE & HISTORY ───────────────────────────────────────
+    # Fetch live price via fast_info for current holdings
+    total_val = cash + sum(price_cache[t]*s for t,s in holdings.items())
+
+    # ─── 8) SAVE UPDATED PORTFOLIO SUMMARY ─────────────────────────────────────────
+    new_summary = {
+        "date":     datetime.now().isoformat(),
+        "cash":     round(cash, 2),
+        "holdings": holdings,
+        "history":  history,
+        **history_meta
+    }
+    append_entry(new_summary, cash, total_val, holdings)  # Delta-encoded, downsamples old entries
+
+    try:
+        write_json(PORTFOLIO_FILE, new_summary, expected_version=portfolio_version)
+    except VersionConflict:
+        count("execute.version_conflicts")
+        # The portfolio changed while we were trading (the monitor sold something):
+        # replay our trades on top of the latest version instead of overwriting it
+        print("🔀 Portfolio changed during execution – merging these trades into the latest version")
+        kept = []
+        new_summary = update_json(
+            PORTFOLIO_FILE, lambda latest: rebase_portfolio(new_trades, latest, price_cache, kept)
+        )
+        new_trades = kept
+        holdings = new_summary["holdings"]
+        total_val = new_summary["cash"] + sum(price_cache.get(t, 0) * s for t, s in holdings.items())
+
+    # ─── 9) SAVE TRADE LOG (AFTER THE PORTFOLIO: A REBASE MAY DROP FILLS) ──────────
+    append_trades(new_trades)
+
+    # ─── 10) PRINT STATUS ───────────────────────────────────────────────────────────
+    print("\n✅ Trades executed.")
+    print(f"Cash: ${new_summary['cash']:.2f}")
+    # print("Holdings:")
+    # for t, s in holdings.items():
+    #     print(f" • {t}: {s} shares  (live @ ${get_current_price(t):.2f})")
+    print(f"Portfolio total value: ${total_val:.2f}")
+    print(f"Execution cost (spread/slippage): ${execution_cost:.2f} over {len(new_trades)} trades")
+    print(f"History entries: {len(new_summary['history'])}")
+
+    return new_summary, new_trades
+
+def main():
+    sigs = read_json(SIGNALS_FILE)
+    screen = read_json(SCREEN_FILE)
+    return execute_trades(sigs, screen)
+
+if __name__ == "__main__":
+    main()
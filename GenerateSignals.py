@@ -1,5 +1,7 @@
 #import yfinance as yf
-from DataManager import load_cached_prices, get_current_price
+from DataManager import load_cached_prices, get_current_price, get_current_prices, load_universe
+from TradeJournal import load_trades, cost_basis_map as journal_cost_basis
+from Instrumentation import timer, count
 import pandas as pd
 import json
 from datetime import datetime, timedelta
@@ -16,10 +18,16 @@ TRAIL_STOP_PCT = 0.05  # sell if price falls 5% from peak
 STOP_LOSS_PCT   = 0.10   # e.g. 10% drop
 TAKE_PROFIT_PCT= 0.15   # e.g. 15% gain
 
-price_cache = load_cached_prices(data_type="daily")
+price_cache = None  # Daily cache, loaded on first use unless a caller passes one in
 
-def df_from_cache(ticker):
-    data = price_cache.get(ticker)
+def get_price_cache():
+    global price_cache
+    if price_cache is None:
+        price_cache = load_cached_prices(data_type="daily")
+    return price_cache
+
+def df_from_cache(ticker, cache=None):
+    data = (cache if cache is not None else get_price_cache()).get(ticker)
     if not data:
         return pd.DataFrame()
     df = pd.DataFrame({
@@ -68,30 +76,25 @@ def calculate_adx(df, period=14): # Average Directional Index = Indicator of Tre
 
     return adx
 
-def last_signal(ticker, cost_basis_map=None):
-    """Compute the Cost Basis for ticker."""
-    if cost_basis_map is None:
-        try:
-            with open("trades_log.json") as f:
-                trades = json.load(f)
-            data_trades = pd.DataFrame(trades)
-            cost_basis_map = {}
-            if not data_trades.empty and "ticker" in data_trades.columns:
-                for ticker_name, sub in data_trades.groupby("ticker"):
-                    buys = sub[sub["action"] == "BUY"]
-                    sells = sub[sub["action"] == "SELL"]
-                    net_shares = buys["shares"].sum() - sells["shares"].sum()
-                    net_cost = (buys["shares"] * buys["price"]).sum() - (sells["shares"] * sells["price"]).sum()
-                    if net_shares > 0:
-                        cost_basis_map[ticker_name] = net_cost / net_shares
-        except (FileNotFoundError, ValueError):
-            cost_basis_map = {}
-
-    """Compute the Signlas for ticker."""
-    df = df_from_cache(ticker)
+# Daily indicators only change when the daily data does, so a long-running process
+# (BotDaemon.py) computes them once per ticker per day: {ticker: (data_key, df, extras)}
+_indicators = {}
+
+def daily_indicators(ticker, cache=None):
+    """
+    Return (df, extras) with every daily indicator for ticker, or (None, None) if
+    there isn't enough history. extras holds the MACD crossovers, market type and ATR.
+    """
+    data = (cache if cache is not None else get_price_cache()).get(ticker) or {}
+    key = (len(data.get('close', [])), (data.get('dates') or [None])[-1], (data.get('close') or [None])[-1])
+    memo = _indicators.get(ticker)
+    if memo and memo[0] == key:
+        return memo[1], memo[2]
+
+    df = df_from_cache(ticker, cache)
     if df.empty or len(df) < REQUIRED_LOOKBACK:
         print(f"{ticker}: Insufficient data ({len(df)} rows)")
-        return None, None, None, None
+        return None, None
 
     # ----  EMA Signals
     df['Short_EMA'] = df['Close'].ewm(span=SHORT_W, adjust=False).mean()
@@ -121,12 +124,7 @@ def last_signal(ticker, cost_basis_map=None):
     # Decide Market Type
     df['ADX'] = calculate_adx(df)
     market_type = "TRENDING" if df['ADX'].iloc[-1] >= 20 else "SIDEWAYS" # threshold of <20 for Sideways Market
-    
-    # use current live price for signals
-    current_price = get_current_price(ticker)
-    cb = cost_basis_map.get(ticker)
 
-    # ─── SELL LOGIC ─────────────────────────────────────
     # Dynamnic Stop Percentages
     df['TR'] = pd.concat([
         df['High'] - df['Low'],
@@ -143,6 +141,38 @@ def last_signal(ticker, cost_basis_map=None):
     if atr is None or pd.isna(atr):
         atr = 0  # fallback
 
+    extras = {
+        "macd_cross_up": macd_cross_up,
+        "macd_cross_down": macd_cross_down,
+        "market_type": market_type,
+        "atr": atr
+    }
+    _indicators[ticker] = (key, df, extras)
+    return df, extras
+
+def last_signal(ticker, cost_basis_map=None, cache=None):
+    """Compute the Cost Basis for ticker."""
+    if cost_basis_map is None:
+        try:
+            cost_basis_map = journal_cost_basis()  # Snapshot + tail, no full log replay
+        except (OSError, ValueError):
+            cost_basis_map = {}
+
+    """Compute the Signlas for ticker."""
+    with timer("signals.indicators"):
+        df, extras = daily_indicators(ticker, cache)
+    if df is None:
+        return None, None, None, None
+    macd_cross_up = extras["macd_cross_up"]
+    macd_cross_down = extras["macd_cross_down"]
+    market_type = extras["market_type"]
+    atr = extras["atr"]
+
+    # use current live price for signals
+    current_price = get_current_price(ticker)
+    cb = cost_basis_map.get(ticker)
+
+    # ─── SELL LOGIC ─────────────────────────────────────
     if cb is not None:
         peak = df['Close'].max()
 
@@ -206,23 +236,18 @@ def last_signal(ticker, cost_basis_map=None):
     return None, current_price, market_type, None
 
 
-def main():
-
-    # ─── 1) LOAD CURRENT HOLDINGS ───────────────────────────────────────────────────
-    with open("ftse100_stocks.json", "r") as f:
-        ftse100 = json.load(f)
-
-    TICKERS = [
-        f"{stock['code'].rstrip('.').replace('.', '-')}.L"
-        for stock in ftse100
-        if stock.get("code")
-    ]
-    
-    try:
-        with open("portfolio_summary.json") as f:
-            holdings = set(json.load(f).get("holdings", {}).keys())
-    except FileNotFoundError:
-        holdings = set()
+def generate_signals(cache, holdings, trades, tickers, cost_basis_map=None):
+    """
+    Build BUY/SELL signals for every ticker.
+    cache: daily price cache, holdings: set of held tickers, trades: full trade history.
+    Returns the signals dict (same shape as trade_signals.json).
+    """
+    # ─── 1) COST BASIS (ONCE FOR ALL TICKERS) ───────────────────────────────────────
+    if cost_basis_map is None:
+        try:
+            cost_basis_map = journal_cost_basis()
+        except (OSError, ValueError):
+            cost_basis_map = {}
 
     # ─── 2) LOAD TRADES  ────────────────────────────────────
     market_type_count = {
@@ -236,39 +261,42 @@ def main():
     recent_losses = {}
 
     try:
-        with open("trades_log.json") as f:
-            trades = json.load(f)
-            for trade in trades:
-                trade_date = datetime.fromisoformat(trade["date"]).date()
-                ticker = trade["ticker"]
-                if trade["action"] == "BUY" and trade_date == today:
-                    buys_today[ticker] = trade["price"]
-                elif trade["action"] == "SELL":
-                    # Track recent sells for price comparison
-                    if (today - trade_date).days <= 3:
-                        if ticker not in recent_sells:
-                            recent_sells[ticker] = []
-                        recent_sells[ticker].append(trade["price"])
-
-                    # Identify if the SELL was at a loss 
-                    all_buys = [
-                        t for t in trades 
-                        if t["ticker"] == ticker and t["action"] == "BUY" 
-                        and datetime.fromisoformat(t["date"]).date() <= trade_date
-                    ]
-                    if all_buys:
-                        last_buy = max(all_buys, key=lambda t: datetime.fromisoformat(t["date"]))
-                        pnl = trade["price"] - last_buy["price"]
-                        if pnl < 0:
-                            # Save the loss date for cool-off logic
-                            recent_losses[ticker] = trade_date
+        for trade in trades:
+            trade_date = datetime.fromisoformat(trade["date"]).date()
+            ticker = trade["ticker"]
+            if trade["action"] == "BUY" and trade_date == today:
+                buys_today[ticker] = trade["price"]
+            elif trade["action"] == "SELL":
+                # Track recent sells for price comparison
+                if (today - trade_date).days <= 3:
+                    if ticker not in recent_sells:
+                        recent_sells[ticker] = []
+                    recent_sells[ticker].append(trade["price"])
+
+                # Identify if the SELL was at a loss 
+                all_buys = [
+                    t for t in trades 
+                    if t["ticker"] == ticker and t["action"] == "BUY" 
+                    and datetime.fromisoformat(t["date"]).date() <= trade_date
+                ]
+                if all_buys:
+                    last_buy = max(all_buys, key=lambda t: datetime.fromisoformat(t["date"]))
+                    pnl = trade["price"] - last_buy["price"]
+                    if pnl < 0:
+                        # Save the loss date for cool-off logic
+                        recent_losses[ticker] = trade_date
     except (FileNotFoundError, ValueError):
         pass
 
     # ─── 3) LOAD TODAY'S SCREEN & SELLS ─────────────────────────────────────────────────
-    to_buy = [t for t in TICKERS if t not in holdings]
+    to_buy = [t for t in tickers if t not in holdings]
     to_sell = list(holdings) # Use Current Holdings (not daily_screen)
 
+    # Live quotes for every candidate in one bulk request; last_signal() then reads them from the quote cache
+    with timer("signals.quotes"):
+        get_current_prices(to_buy + to_sell)
+    count("signals.candidates", len(to_buy) + len(to_sell))
+
     print(f"Candidates to BUY : {to_buy}")
     print(f"Candidates to SELL (from current holdings): {to_sell}\n")
 
@@ -278,7 +306,7 @@ def main():
 
     # ─── 5) CHECK BUY CANDIDATES ────────────────────────────────────────────────────
     for t in to_buy:
-        sig, price, market_type, trigger = last_signal(t)
+        sig, price, market_type, trigger = last_signal(t, cost_basis_map, cache)
         if market_type:
             market_type_count["BUY"][market_type] += 1
 
@@ -296,7 +324,7 @@ def main():
                     print(f"{t}: recent loss detected ({days_since_loss}d ago) → cool-off satisfied")
 
             # Rule 2: Price jump can't be more than 10% from today's open
-            closes = price_cache.get(t, {}).get("close", [])
+            closes = cache.get(t, {}).get("close", [])
             if len(closes) < 2:
                 print(f"Skipping {t}: not enough price history")
                 continue
@@ -317,7 +345,7 @@ def main():
     # ─── 6) CHECK ALL CURRENT HOLDINGS FOR SELL SIGNALS ─────────────────────────────
     if holdings:
         for t in holdings:
-            sig, price, market_type, trigger = last_signal(t)
+            sig, price, market_type, trigger = last_signal(t, cost_basis_map, cache)
             if market_type:
                 market_type_count["SELL"][market_type] += 1
 
@@ -346,11 +374,26 @@ def main():
         for mtype in ["TRENDING", "SIDEWAYS"]:
             print(f"    {mtype}: {market_type_count[category][mtype]} stocks")
 
+    return out
+
+def save_signals(out):
     with open("trade_signals.json", "w") as f:
         json.dump(out, f, indent=4)
 
     print("\n✅ trade_signals.json written")
 
+def load_holdings():
+    try:
+        with open("portfolio_summary.json") as f:
+            return set(json.load(f).get("holdings", {}).keys())
+    except FileNotFoundError:
+        return set()
+
+def main():
+    out = generate_signals(get_price_cache(), load_holdings(), load_trades(), load_universe())
+    save_signals(out)
+    return out
+
 
 # ─── 8) RUN FUNCTION  ─────────────────────────────────────────────────────────────
 if __name__ == "__main__":
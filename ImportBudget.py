@@ -0,0 +1,70 @@
+# ImportBudget.py
+# Cold-start check for the pipeline stages: each module is imported in a fresh
+# interpreter and must stay within its time budget without pulling in heavy
+# libraries it doesn't need. Exits with status 1 if any stage regresses.
+#   python ImportBudget.py            (check all stages)
+#   python ImportBudget.py -v         (also list each stage's heavy imports)
+import sys
+import json
+import argparse
+import subprocess
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+RUNS = 3  # Best of N fresh imports (the first one also warms the OS file cache)
+
+# module: (max seconds to import, libraries it must not import)
+IMPORT_BUDGETS = {
+    "DataManager":          (0.15, ["yfinance", "pandas", "sklearn", "matplotlib"]),
+    "SelectStocks":         (0.15, ["yfinance", "pandas", "sklearn", "matplotlib"]),
+    "ExecuteTrades":        (0.25, ["yfinance", "pandas", "sklearn", "matplotlib"]),
+    "MonitorDeferredSells": (0.30, ["yfinance", "pandas", "sklearn", "matplotlib"]),
+    "GenerateSignals":      (1.00, ["yfinance", "sklearn", "matplotlib"]),
+    "TradeSummary":         (0.15, ["yfinance", "pandas", "sklearn", "matplotlib"]),
+    "run_bot":              (1.20, ["yfinance", "sklearn", "matplotlib"]),
+}
+HEAVY = ["yfinance", "pandas", "numpy", "sklearn", "matplotlib", "scipy"]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module, runs=RUNS):
+    """Best-of-runs cold import time (seconds) and the heavy libraries it loaded."""
+    best = None
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            capture_output=True, text=True, check=True
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+def check(verbose=False):
+    failures = []
+    for module, (budget, forbidden) in IMPORT_BUDGETS.items():
+        result = measure(module)
+        banned = [m for m in result["heavy"] if m in forbidden]
+        ok = result["seconds"] <= budget and not banned
+        status = "✅" if ok else "❌"
+        print(f"{status} {module:<22} {result['seconds'] * 1000:>7.0f} ms  (budget {budget * 1000:.0f} ms)"
+              + (f"  imports {', '.join(banned)}" if banned else "")
+              + (f"  [{', '.join(result['heavy'])}]" if verbose and result["heavy"] else ""))
+        if not ok:
+            failures.append(module)
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check cold-start import time of the pipeline stages")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    failures = check(args.verbose)
+    if failures:
+        print(f"\n❌ Import budget exceeded: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n✅ All stages within their import budget")
@@ -0,0 +1,176 @@
+# IndexBenchmark.py
+import json
+import numpy as np
+from DataManager import load_cached_prices, load_universe, load_market_caps
+from PerformanceMetrics import equity_series, TRADING_DAYS, RISK_FREE_RATE
+from StateAccess import read_json, write_json
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+BENCHMARK_FILE = "benchmark.json"
+PORTFOLIO_FILE = "portfolio_summary.json"
+BASE_LEVEL     = 100.0
+
+# FTSE 100 proxies built from the cached constituent closes (price_cache.json), as
+# daily index levels in benchmark.json: {"dates", "equal", "cap", "weighting"}.
+#  - equal: every constituent with a close on both days weighted equally (rebalanced daily)
+#  - cap:   weighted by market cap (ftse100_stocks.json, see StockTickers.py), drifting with
+#           price between days; without scraped market caps the average daily traded
+#           value (close × volume) stands in for cap ("weighting" says which)
+# The price cache only holds a rolling window, so levels are chained and kept: each
+# update only computes the days after the last stored one (plus that day again, since
+# its close may have been a partial bar). Constituents are columns of one price matrix.
+EMPTY_BENCHMARK = {"dates": [], "equal": [], "cap": [], "weighting": None}
+
+# ─── INDEX LEVELS ───────────────────────────────────────────────────────────────
+
+def price_matrix(daily, tickers, start=None):
+    """(dates, closes[day, ticker]) from start (inclusive), forward-filled over missing days."""
+    dates = sorted({d for t in tickers for d in daily.get(t, {}).get("dates", []) if start is None or d >= start})
+    row = {d: i for i, d in enumerate(dates)}
+    prices = np.full((len(dates), len(tickers)), np.nan)
+    for j, t in enumerate(tickers):
+        data = daily.get(t, {})
+        for d, close in zip(data.get("dates", []), data.get("close", [])):
+            if d in row and close:
+                prices[row[d], j] = close
+            elif close and dates and d < dates[0]:
+                prices[0, j] = close  # Latest close before start, until the first day's own close (if any)
+    # Forward fill: a day without a close carries the previous one (its move lands on the next close)
+    last_seen = np.maximum.accumulate(np.where(np.isfinite(prices), np.arange(len(dates))[:, None], 0), axis=0)
+    return dates, prices[last_seen, np.arange(len(tickers))]
+
+def weight_basis(daily, tickers):
+    """(weighting, per-ticker cap or its stand-in, NaN if unknown)."""
+    caps = load_market_caps()
+    if sum(t in caps for t in tickers) >= len(tickers) / 2:
+        return "market_cap", np.array([caps.get(t, np.nan) for t in tickers], dtype=float)
+    traded = []
+    for t in tickers:
+        data = daily.get(t, {})
+        n = min(len(data.get("close", [])), len(data.get("volume", [])))
+        values = [c * v for c, v in zip(data["close"][:n], data["volume"][:n]) if c and v] if n else []
+        traded.append(sum(values) / len(values) if values else np.nan)
+    return "traded_value", np.array(traded, dtype=float)
+
+def index_returns(prices, basis):
+    """Daily (equal-weighted, cap-weighted) returns of a closes[day, ticker] matrix."""
+    returns = prices[1:] / prices[:-1] - 1
+    valid = np.isfinite(returns)
+    returns = np.where(valid, returns, 0.0)
+    counts = valid.sum(axis=1)
+    equal = returns.sum(axis=1) / np.maximum(counts, 1)
+
+    # Units held = cap / latest close; a day's weight is units × the previous close
+    latest = prices[-1]
+    units = np.where(np.isfinite(basis) & np.isfinite(latest), basis / np.where(np.isfinite(latest), latest, 1), 0.0)
+    weights = np.where(valid, units * np.nan_to_num(prices[:-1]), 0.0)
+    total = weights.sum(axis=1)
+    cap = (weights * returns).sum(axis=1) / np.where(total > 0, total, 1)
+    return equal, cap
+
+def constituents(daily):
+    try:
+        universe = set(load_universe())
+    except (OSError, ValueError):
+        universe = set()
+    return sorted(t for t in daily if (not universe or t in universe) and daily[t].get("dates"))
+
+def update_benchmark(daily=None, path=BENCHMARK_FILE):
+    """Extend benchmark.json with the days in the price cache after its last one. Returns the state."""
+    if daily is None:
+        daily = load_cached_prices(data_type="daily")
+    state = read_json(path) or json.loads(json.dumps(EMPTY_BENCHMARK))
+    tickers = constituents(daily)
+    latest = max((daily[t]["dates"][-1] for t in tickers), default=None)
+    if latest is None or (state["dates"] and latest < state["dates"][-1]):
+        return state
+
+    # Re-do the last stored day from the one before it
+    keep = max(len(state["dates"]) - 1, 1) if state["dates"] else 0
+    for key in ("dates", "equal", "cap"):
+        del state[key][keep:]
+    anchor = state["dates"][-1] if state["dates"] else None
+
+    dates, prices = price_matrix(daily, tickers, start=anchor)
+    if anchor is not None and dates[0] != anchor:
+        # The cache window no longer reaches back to the anchor: chain on from its first day
+        print(f"⚠️  Price cache starts {dates[0]}, after the last benchmark day {anchor} – the gap counts as flat")
+        dates = [anchor] + dates
+        prices = np.vstack([prices[:1], prices])
+    weighting, basis = weight_basis(daily, tickers)
+    equal, cap = index_returns(prices, basis)
+
+    equal_base = state["equal"][-1] if anchor else BASE_LEVEL
+    cap_base = state["cap"][-1] if anchor else BASE_LEVEL
+    state["dates"] = (state["dates"] or dates[:1]) + dates[1:]
+    state["equal"] = (state["equal"] or [BASE_LEVEL]) + [round(v, 6) for v in equal_base * np.cumprod(1 + equal)]
+    state["cap"] = (state["cap"] or [BASE_LEVEL]) + [round(v, 6) for v in cap_base * np.cumprod(1 + cap)]
+    state["weighting"] = weighting
+    write_json(path, state)
+    return state
+
+# ─── COMPARISON ─────────────────────────────────────────────────────────────────
+
+def _num(x):
+    return None if x is None or not np.isfinite(x) else round(float(x), 6)
+
+def compare(dates, equity, bench_dates, bench_levels):
+    """Alpha, beta, tracking error and relative drawdown of an equity curve vs an index, on their common days."""
+    bench_dates = np.array(bench_dates, dtype="datetime64[D]")
+    common, i, j = np.intersect1d(dates, bench_dates, return_indices=True)
+    if len(common) < 3:
+        return {"days": len(common)}
+    portfolio, index = equity[i], np.asarray(bench_levels, dtype=float)[j]
+    rp = np.diff(portfolio) / portfolio[:-1]
+    rb = np.diff(index) / index[:-1]
+    rf = RISK_FREE_RATE / TRADING_DAYS
+    var = rb.var(ddof=1)
+    beta = np.cov(rp, rb, ddof=1)[0, 1] / var if var > 0 else None
+    alpha = ((rp - rf).mean() - beta * (rb - rf).mean()) * TRADING_DAYS if beta is not None else None
+
+    # Relative curve: growth of the portfolio over growth of the index
+    relative = (portfolio / portfolio[0]) / (index / index[0])
+    relative_drawdown = relative / np.maximum.accumulate(relative) - 1
+    return {
+        "start": str(common[0]),
+        "end": str(common[-1]),
+        "days": len(common),
+        "portfolio_return": _num(portfolio[-1] / portfolio[0] - 1),
+        "benchmark_return": _num(index[-1] / index[0] - 1),
+        "excess_return": _num(relative[-1] - 1),
+        "alpha": _num(alpha),
+        "beta": _num(beta),
+        "tracking_error": _num((rp - rb).std(ddof=1) * np.sqrt(TRADING_DAYS)),
+        "max_relative_drawdown": _num(relative_drawdown.min()),
+        "relative_drawdown": _num(relative_drawdown[-1])
+    }
+
+def benchmark_report(portfolio, daily=None):
+    """Our daily equity curve against both FTSE 100 proxies (benchmark brought up to date first)."""
+    if daily is None:
+        daily = load_cached_prices(data_type="daily")
+    state = update_benchmark(daily)
+    dates, equity = equity_series(portfolio, daily)
+    return {
+        "weighting": state["weighting"],
+        "equal_weight": compare(dates, equity, state["dates"], state["equal"]),
+        "cap_weight": compare(dates, equity, state["dates"], state["cap"])
+    }
+
+def print_report(report):
+    pct = lambda x: "N/A" if x is None else f"{x * 100:+.2f}%"
+    num = lambda x: "N/A" if x is None else f"{x:.2f}"
+    te = lambda x: "N/A" if x is None else f"{x * 100:.2f}%"
+    print(f"Benchmark (FTSE 100 proxies, cap weights by {report['weighting'] or 'N/A'}):")
+    for label, key in (("Equal-weighted", "equal_weight"), ("Cap-weighted", "cap_weight")):
+        c = report[key]
+        if c["days"] < 3:
+            print(f" • {label:<15} not enough common days ({c['days']})")
+            continue
+        print(f" • {label:<15} index {pct(c['benchmark_return'])} vs us {pct(c['portfolio_return'])} "
+              f"(excess {pct(c['excess_return'])}) · alpha {pct(c['alpha'])} a year · beta {num(c['beta'])} · "
+              f"tracking error {te(c['tracking_error'])} · relative drawdown {pct(c['relative_drawdown'])} "
+              f"(max {pct(c['max_relative_drawdown'])})")
+
+if __name__ == "__main__":
+    print_report(benchmark_report(read_json(PORTFOLIO_FILE, default={})))
@@ -0,0 +1,138 @@
+# Instrumentation.py
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+try:
+    import resource  # Peak RSS (not on Windows)
+except ImportError:
+    resource = None
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+ENABLED = os.environ.get("BOT_INSTRUMENTATION", "1") != "0"  # BOT_INSTRUMENTATION=0 turns every call into a no-op
+
+# Process-wide metrics for the current run, stored in its run log record (RunLog.py):
+#  - count(name, n):   counters, e.g. "net.yfinance.tickers", "bytes.read", "monitor.polls"
+#  - gauge(name, v):   last value; gauge_max(name, v) keeps the largest
+#  - timer(name):      context manager → call count, total and max seconds, e.g. "net.yfinance"
+#  - stage(name):      context manager → wall and CPU seconds, peak RSS, and the counters
+#                      and timers that moved while it ran (what a slow stage spent its time on)
+# snapshot() returns all of it for the run record; reset() starts the next run.
+# A timer or counter costs a lock and a couple of clock reads (~1 µs).
+
+_lock = threading.Lock()
+_counters = {}  # name → number
+_gauges = {}    # name → value
+_timers = {}    # name → [calls, total seconds, max seconds]
+_stages = []    # finished stage records, in the order they finished
+_started = [time.perf_counter(), time.process_time()]
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timers.clear()
+        _stages.clear()
+        _started[:] = [time.perf_counter(), time.process_time()]
+
+# ─── RECORDING ──────────────────────────────────────────────────────────────────
+
+def count(name, n=1):
+    if ENABLED:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+def gauge(name, value):
+    if ENABLED:
+        with _lock:
+            _gauges[name] = value
+
+def gauge_max(name, value):
+    if ENABLED:
+        with _lock:
+            if value > _gauges.get(name, value - 1):
+                _gauges[name] = value
+
+def add_time(name, seconds):
+    with _lock:
+        entry = _timers.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+
+@contextmanager
+def timer(name):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far (MB), or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _delta(after, before):
+    return {k: v - before.get(k, 0) for k, v in after.items() if v != before.get(k, 0)}
+
+@contextmanager
+def stage(name):
+    """Time a stage (nested stages are recorded separately) and what it spent its time on."""
+    if not ENABLED:
+        yield
+        return
+    with _lock:
+        counters = dict(_counters)
+        timers = {k: (v[0], v[1]) for k, v in _timers.items()}
+    wall, cpu = time.perf_counter(), time.process_time()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        with _lock:
+            moved = {
+                k: {"calls": v[0] - timers.get(k, (0, 0.0))[0], "seconds": round(v[1] - timers.get(k, (0, 0.0))[1], 4)}
+                for k, v in _timers.items() if v[0] != timers.get(k, (0, 0.0))[0]
+            }
+            _stages.append({
+                "stage": name, "ok": ok, "wall_s": round(wall, 4), "cpu_s": round(cpu, 4),
+                "peak_rss_mb": peak_rss_mb(), "counters": _delta(_counters, counters), "timers": moved
+            })
+
+# ─── REPORTING ──────────────────────────────────────────────────────────────────
+
+def snapshot():
+    """Everything recorded since reset(), for the run log record (None if disabled)."""
+    if not ENABLED:
+        return None
+    with _lock:
+        return {
+            "wall_s": round(time.perf_counter() - _started[0], 4),
+            "cpu_s": round(time.process_time() - _started[1], 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": list(_stages),
+            "timers": {k: {"calls": n, "seconds": round(total, 4), "max_s": round(longest, 4)}
+                       for k, (n, total, longest) in _timers.items()},
+            "counters": dict(_counters),
+            "gauges": dict(_gauges)
+        }
+
+def print_snapshot(metrics):
+    """Print a snapshot() – wall/CPU time and per-stage timings; nothing if instrumentation is off."""
+    if not metrics:
+        return
+    print(f"⏱️  {metrics['wall_s']:.2f}s wall, {metrics['cpu_s']:.2f}s CPU, peak RSS {metrics['peak_rss_mb']} MB")
+    for s in metrics["stages"]:
+        network = ", ".join(f"{k} {v['calls']}× {v['seconds']:.2f}s" for k, v in s["timers"].items() if k.startswith("net."))
+        print(f"  {s['stage']:<32} {s['wall_s']:>7.2f}s wall {s['cpu_s']:>7.2f}s CPU"
+              f"{'  ' + network if network else ''}")
@@ -0,0 +1,185 @@
+# LotLedger.py
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from TradeJournal import read_since, journal_mark, mark_matches, JOURNAL_FILE
+from StateAccess import read_json, write_json
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+LEDGER_FILE = "lot_ledger.json"
+EPSILON     = 1e-9  # Shares below this are treated as zero (float drift)
+
+# FIFO lot ledger of the trade journal, kept up to date incrementally (lot_ledger.json):
+#  - open:      {ticker: [{"date", "price", "shares"}]}  buy lots not yet sold, oldest first
+#  - matches:   [{"ticker", "buy_date", "sell_date", "buy_price", "sell_price", "shares", "profit"}]
+#               one per (buy lot, sell) pair, in close order
+#  - positions: [{"ticker", "opened", "closed", "shares", "realized"}] – a position runs
+#               from the first buy while flat until the sell that empties it again
+#  - current:   {ticker: {"opened", "shares", "realized"}} positions still open
+#  - unmatched: [{"seq", "ticker", "date", "shares"}] sells (or parts) with no open lot
+#  - seq / offset / mark: trades applied, journal byte offset and TradeJournal.journal_mark
+# Only trades appended after "offset" are read; a rewritten journal rebuilds the ledger.
+EMPTY_LEDGER = {"seq": 0, "offset": 0, "mark": None, "open": {}, "matches": [],
+                "positions": [], "current": {}, "unmatched": []}
+
+def _iso(when):
+    if when is None or isinstance(when, str):
+        return when
+    return when.isoformat()
+
+def _days(start, end):
+    return (datetime.fromisoformat(str(end)) - datetime.fromisoformat(str(start))).total_seconds() / 86400
+
+class LotLedger:
+    """Open lots, closed matches and positions, indexed by ticker and close date."""
+
+    def __init__(self, state=None):
+        self.state = state or json.loads(json.dumps(EMPTY_LEDGER))
+        self._index()
+
+    # ── Load / update ──
+    @classmethod
+    def load(cls, path=LEDGER_FILE, journal=JOURNAL_FILE, save=True, rebuild=False):
+        """
+        The ledger brought up to date with the journal (only new trades are read).
+        rebuild=True replays the whole journal (e.g. ValidateTrades found an edited prefix).
+        """
+        ledger = cls(None if rebuild else read_json(path))
+        if not mark_matches(ledger.state["offset"], ledger.state["mark"], journal):
+            print(f"⚠️  {journal} was rewritten – rebuilding {path}")
+            ledger = cls()
+        if ledger.update(journal) and save:
+            write_json(path, ledger.state)
+        return ledger
+
+    def update(self, journal=JOURNAL_FILE):
+        """Apply trades appended since the ledger's offset. Returns how many were applied."""
+        trades, offset = read_since(self.state["offset"], journal)
+        for trade in trades:
+            self.apply(trade)
+        if trades:
+            self.state["offset"] = offset
+            self.state["mark"] = journal_mark(offset, journal)
+        return len(trades)
+
+    def apply(self, trade):
+        seq = self.state["seq"]
+        self.state["seq"] += 1
+        ticker, when = trade.get("ticker"), str(trade.get("date"))
+        if trade.get("action") == "BUY":
+            self.state["open"].setdefault(ticker, []).append(
+                {"date": when, "price": trade["price"], "shares": trade["shares"]})
+            current = self.state["current"].setdefault(ticker, {"opened": when, "shares": 0.0, "realized": 0.0})
+            current["shares"] += trade["shares"]
+        elif trade.get("action") == "SELL":
+            self._sell(seq, ticker, when, trade["price"], trade["shares"])
+
+    def _sell(self, seq, ticker, when, price, shares):
+        lots = self.state["open"].get(ticker, [])
+        current = self.state["current"].get(ticker)
+        while shares > EPSILON and lots:
+            lot = lots[0]
+            matched = min(lot["shares"], shares)
+            profit = (price - lot["price"]) * matched
+            self.state["matches"].append({
+                "ticker": ticker, "buy_date": lot["date"], "sell_date": when,
+                "buy_price": lot["price"], "sell_price": price, "shares": matched, "profit": profit
+            })
+            self._index_match(len(self.state["matches"]) - 1)
+            current["realized"] += profit
+            lot["shares"] -= matched
+            shares -= matched
+            if lot["shares"] <= EPSILON:
+                lots.pop(0)
+        if shares > EPSILON:
+            self.state["unmatched"].append({"seq": seq, "ticker": ticker, "date": when, "shares": shares})
+        if current is not None and not lots:
+            self.state["positions"].append({"ticker": ticker, "closed": when, **current})
+            del self.state["current"][ticker]
+            self.state["open"].pop(ticker, None)
+
+    # ── Indexes (rebuilt on load, extended as matches are added) ──
+    def _index(self):
+        self._by_ticker = {}
+        self._close_dates = []
+        for i in range(len(self.state["matches"])):
+            self._index_match(i)
+
+    def _index_match(self, i):
+        match = self.state["matches"][i]
+        self._by_ticker.setdefault(match["ticker"], []).append(i)
+        self._close_dates.append(match["sell_date"])  # Journal is in date order, so this stays sorted
+
+    # ── Queries ──
+    def matches(self, ticker=None, start=None, end=None):
+        """Closed (buy lot, sell) matches, optionally for one ticker and/or closed in [start, end]."""
+        lo = bisect_left(self._close_dates, _iso(start)) if start else 0
+        # "\uffff" sorts after any time suffix, so a plain date end includes that whole day
+        hi = bisect_right(self._close_dates, _iso(end) + "\uffff") if end else len(self._close_dates)
+        if ticker is None:
+            indices = range(lo, hi)
+        else:
+            ids = self._by_ticker.get(ticker, [])
+            indices = ids[bisect_left(ids, lo):bisect_left(ids, hi)]
+        return [self.state["matches"][i] for i in indices]
+
+    def holding_periods(self, ticker=None, start=None, end=None):
+        """[{"ticker", "buy_date", "sell_date", "shares", "days"}] for every closed match."""
+        return [
+            {"ticker": m["ticker"], "buy_date": m["buy_date"], "sell_date": m["sell_date"],
+             "shares": m["shares"], "days": _days(m["buy_date"], m["sell_date"])}
+            for m in self.matches(ticker, start, end)
+        ]
+
+    def closed_positions(self, ticker=None):
+        """Realized P&L per closed position: [{"ticker", "opened", "closed", "shares", "realized", "days"}]."""
+        return [
+            {**p, "days": _days(p["opened"], p["closed"])}
+            for p in self.state["positions"] if ticker is None or p["ticker"] == ticker
+        ]
+
+    def open_lots(self, ticker=None, as_of=None):
+        """Unsold buy lots with their age: [{"ticker", "date", "price", "shares", "age_days"}]."""
+        as_of = _iso(as_of) or datetime.now().isoformat()
+        tickers = [ticker] if ticker else list(self.state["open"])
+        return [
+            {"ticker": t, **lot, "age_days": _days(lot["date"], as_of)}
+            for t in tickers for lot in self.state["open"].get(t, [])
+        ]
+
+    def net_shares(self):
+        """{ticker: shares held} according to the journal."""
+        return {t: sum(lot["shares"] for lot in lots) for t, lots in self.state["open"].items() if lots}
+
+    def is_flat(self, ticker):
+        return not self.state["open"].get(ticker)
+
+    def realized_by_ticker(self, flat_only=True):
+        """Total realized P&L per ticker (only tickers with no shares left if flat_only)."""
+        totals = {}
+        for t, ids in self._by_ticker.items():
+            if flat_only and not self.is_flat(t):
+                continue
+            totals[t] = sum(self.state["matches"][i]["profit"] for i in ids)
+        return totals
+
+    def closed_range(self, ticker):
+        """(first buy date, last sell date) over all of ticker's closed matches, or None."""
+        matched = self.matches(ticker)
+        if not matched:
+            return None
+        return min(m["buy_date"] for m in matched), max(m["sell_date"] for m in matched)
+
+    def unmatched_sells(self):
+        """Sells (or the part of a sell) with no open lot to match: [{"seq", "ticker", "date", "shares"}]."""
+        return list(self.state["unmatched"])
+
+if __name__ == "__main__":
+    ledger = LotLedger.load()
+    positions = ledger.closed_positions()
+    print(f"📒 {ledger.state['seq']} trades: {len(ledger.state['matches'])} matches, "
+          f"{len(positions)} closed positions, {len(ledger.open_lots())} open lots, "
+          f"{len(ledger.unmatched_sells())} unmatched sells")
+    for p in positions[-10:]:
+        print(f"  {p['ticker']:<8} {p['opened'][:10]} → {p['closed'][:10]} "
+              f"({p['days']:.1f} days)  £{p['realized']:+.2f}")
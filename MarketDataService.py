@@ -0,0 +1,204 @@
+# MarketDataService.py
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Instrumentation import timer, count
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+HOST          = "127.0.0.1"
+PORT          = int(os.environ.get("BOT_MARKET_DATA_PORT", 8765))
+IDLE_TIMEOUT  = 900   # Shut down after this many seconds without a request
+QUOTE_MAX_AGE = 60    # Seconds a quote (last intraday bar) is served without asking yfinance
+START_TIMEOUT = 15    # Seconds a client waits for an on-demand start
+
+# One local process owns the quote cache for every bot process. Only quotes and fresh
+# intraday bars go through it; daily bars and indicators are read from price_cache.json
+# by each stage. Protocol: GET requests, compact JSON replies.
+#   /health                               → {"ok": true, "pid"}
+#   /quotes?tickers=A.L,B.L&max_age=60    → {ticker: price}
+#   /intraday?tickers=A.L&max_age=60      → {ticker: {"datetime": [...], "price": [...]}}
+#   /stats                                → request / upstream counters
+# Misses for the same ticker from concurrent clients share one upstream download.
+
+# ─── PRICE STORE ────────────────────────────────────────────────────────────────
+
+class PriceStore:
+    """Fresh intraday bars and quotes, shared by every client."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.intraday = {}   # ticker → (fetched_at, {"datetime", "price"}), {} if upstream had no bars
+        self.inflight = {}   # ticker → Future of the download that will cover it
+        self.stats = {"requests": 0, "upstream_calls": 0, "upstream_tickers": 0, "quote_hits": 0, "quote_misses": 0}
+
+    def fresh_intraday(self, tickers, max_age=QUOTE_MAX_AGE):
+        """
+        Intraday bars no older than max_age, downloading only what no one else is already
+        fetching. Tickers upstream had no bars for are remembered as such for max_age too.
+        """
+        from DataManager import fetch_intraday
+        now = time.time()
+        with self.lock:
+            fresh = {t: self.intraday[t][1] for t in tickers
+                     if t in self.intraday and now - self.intraday[t][0] <= max_age}
+            result = {t: data for t, data in fresh.items() if data}
+            misses = [t for t in tickers if t not in fresh]
+            mine = [t for t in misses if t not in self.inflight]
+            theirs = {t: self.inflight[t] for t in misses if t in self.inflight}
+            future = Future()
+            for t in mine:
+                self.inflight[t] = future
+            self.stats["quote_hits"] += len(fresh)
+            self.stats["quote_misses"] += len(misses)
+
+        if mine:
+            try:
+                fetched = fetch_intraday(mine)
+                with self.lock:
+                    self.stats["upstream_calls"] += 1
+                    self.stats["upstream_tickers"] += len(mine)
+                    for t in mine:
+                        self.intraday[t] = (time.time(), fetched.get(t, {}))
+                future.set_result(fetched)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    for t in mine:
+                        self.inflight.pop(t, None)
+            result.update({t: d for t, d in future.result().items() if t in mine})
+
+        for t, other in theirs.items():
+            data = other.result().get(t)
+            if data:
+                result[t] = data
+        return result
+
+    def quotes(self, tickers, max_age=QUOTE_MAX_AGE):
+        intraday = self.fresh_intraday(tickers, max_age)
+        return {t: data["price"][-1] for t, data in intraday.items() if data.get("price")}
+
+# ─── HTTP SERVER ────────────────────────────────────────────────────────────────
+
+def make_handler(store, server_state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server_state["last_request"] = time.monotonic()
+            url = urllib.parse.urlparse(self.path)
+            params = urllib.parse.parse_qs(url.query)
+            tickers = [t for t in params.get("tickers", [""])[0].split(",") if t]
+            max_age = float(params.get("max_age", [QUOTE_MAX_AGE])[0])
+            with store.lock:
+                store.stats["requests"] += 1
+            try:
+                if url.path == "/health":
+                    body = {"ok": True, "pid": os.getpid()}
+                elif url.path == "/quotes":
+                    body = store.quotes(tickers, max_age)
+                elif url.path == "/intraday":
+                    body = store.fresh_intraday(tickers, max_age)
+                elif url.path == "/stats":
+                    body = dict(store.stats)
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(body, separators=(",", ":")).encode()
+                self.send_response(200)
+            except Exception as e:
+                payload = json.dumps({"error": str(e)}).encode()
+                self.send_response(500)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass  # Quiet: clients log what they need
+
+    return Handler
+
+def serve(port=PORT, idle_timeout=IDLE_TIMEOUT):
+    """Run the service until it has been idle for idle_timeout seconds."""
+    import DataManager
+    DataManager.USE_MARKET_DATA_SERVICE = False  # This process *is* the service: go upstream directly
+
+    store = PriceStore()
+    state = {"last_request": time.monotonic()}
+    server = ThreadingHTTPServer((HOST, port), make_handler(store, state))
+    server.daemon_threads = True
+
+    def watchdog():
+        while time.monotonic() - state["last_request"] < idle_timeout:
+            time.sleep(min(10, idle_timeout))
+        server.shutdown()
+
+    threading.Thread(target=watchdog, daemon=True).start()
+    print(f"📡 Market data service on http://{HOST}:{port} (pid {os.getpid()})")
+    server.serve_forever()
+    server.server_close()
+    print(f"📡 Market data service idle for {idle_timeout}s – stopped. Stats: {store.stats}")
+
+# ─── CLIENT ─────────────────────────────────────────────────────────────────────
+
+def _get(path, timeout=30, **params):
+    query = urllib.parse.urlencode({k: ",".join(v) if isinstance(v, (list, tuple, set)) else v
+                                    for k, v in params.items()})
+    with timer("net.market_data_service"), urllib.request.urlopen(f"http://{HOST}:{PORT}{path}?{query}", timeout=timeout) as resp:
+        body = resp.read()
+    count("net.bytes", len(body))
+    return json.loads(body)
+
+def is_running():
+    try:
+        return _get("/health", timeout=0.5).get("ok", False)
+    except (OSError, ValueError):
+        return False
+
+def ensure_service():
+    """Start the service in the background if it isn't running, and wait until it answers."""
+    if is_running():
+        return True
+    kwargs = {"start_new_session": True} if os.name != "nt" else {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve"],
+        cwd=os.getcwd(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if is_running():
+            return True
+        time.sleep(0.1)
+    return False
+
+def request(path, **params):
+    """GET from the service, starting it on demand. Raises OSError if it can't be reached."""
+    try:
+        return _get(path, **params)
+    except urllib.error.HTTPError:
+        raise
+    except OSError:
+        if not ensure_service():
+            raise OSError("Market data service did not start")
+    return _get(path, **params)
+
+def quotes(tickers, max_age=QUOTE_MAX_AGE):
+    return request("/quotes", tickers=list(tickers), max_age=max_age)
+
+def intraday(tickers, max_age=QUOTE_MAX_AGE):
+    return request("/intraday", tickers=list(tickers), max_age=max_age)
+
+if __name__ == "__main__":
+    if "--serve" in sys.argv:
+        serve()
+    elif "--stats" in sys.argv:
+        print(json.dumps(_get("/stats"), indent=2) if is_running() else "Market data service is not running.")
+    else:
+        print("Usage: python MarketDataService.py --serve | --stats")
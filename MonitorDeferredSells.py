@@ -1,20 +1,22 @@
 import time
+import asyncio
 import datetime
-import json
-import yfinance as yf
 import os
 import sys
 import portalocker # Lock File so only run one instance
 import logging
-import tempfile # Writing JSON files (avoid issues when run multiple instances of script)
-from DataManager import get_intraday_prices
-from sklearn.linear_model import LinearRegression
-import numpy as np
+from StateAccess import read_json, update_json  # Locked JSON state shared with ExecuteTrades
+from DataManager import fetch_intraday, get_current_price, get_current_prices, load_cached_prices
+from TradeJournal import append_trade
+from PortfolioHistory import append_entry
+from RunLog import log_run
+from EventChannel import Listener, publish
+from Trend import trend_batch
+from Instrumentation import timer, count, gauge_max, stage, snapshot
+from Profiling import profile
 
 # ───────── Script Variables ───────────────────────────────────────────────────────────────────
-RUN_LOG_FILE = "run_log.json"
 PORTFOLIO_FILE = "portfolio_summary.json"
-TRADE_LOG_FILE = "trades_log.json"
 TRADE_SIGNALS_FILE = "trade_signals.json"
 DEFERRED_FILE = "deferred_sells.json"
 
@@ -23,44 +25,22 @@ SLOPE_THRESHOLD = -0.005       # Downward slope threshold (e.g., -0.005 means ~0
 DROP_FROM_PEAK_PCT = 2.5       # % drop from recent peak that triggers a sell even if slope is ambiguous
 PRICE_WINDOW = 10              # Number of intraday price points to use (~last 50 minutes if 5-min interval)
 MIN_DROP_BELOW_PEAK_PCT = 0.5  # Minimum % drop below peak to consider a downtrend actionable
+SELL_BY = datetime.time(15, 50)  # Sell whatever is still deferred from here on
+
+# === Polling ===
+MIN_POLL_SECONDS = 30          # Interval for a ticker right at its exit conditions (or close to SELL_BY)
+MAX_POLL_SECONDS = 300         # Interval for a ticker far from them
+COALESCE_SECONDS = 2           # Quote requests arriving within this window share one bulk download
+MIN_FETCH_GAP = 30             # Never download more often than this; requests in between get the last batch
 
 
 # IF running on Windows and ANSI sequences don’t work, enable ANSI support like this
 if os.name == 'nt':
     os.system('')
 
-# Helper Function - Load JSON but check if already in use & retry
-def load_json_with_retry(filepath, retries=5, delay=5):
-    for attempt in range(retries):
-        try:
-            with open(filepath) as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError, OSError) as e:
-            print(f"⚠️ Error reading {filepath}: {e}. Retrying in {delay}s...")
-            time.sleep(delay)
-    raise RuntimeError(f"❌ Failed to load {filepath} after {retries} attempts.")
-
-# Helper function to save JSON files
-def atomic_write_json(data, filepath):
-    """Write JSON to a temporary file, then replace the original file atomically."""
-    dir_name = os.path.dirname(os.path.abspath(filepath)) or "."
-    with tempfile.NamedTemporaryFile('w', delete=False, dir=dir_name, suffix=".tmp") as tmp:
-        json.dump(data, tmp, indent=2)
-        tempname = tmp.name
-    os.replace(tempname, filepath)
-
 # ───────── Logging of Script Performance (meta-data) ─────────────────────────────────────────
 
-def load_run_log():
-    if not os.path.exists(RUN_LOG_FILE):
-        return []
-    return load_json_with_retry(RUN_LOG_FILE)
-
-def save_run_log(log):
-    atomic_write_json(log, RUN_LOG_FILE)
-
-def log_run_entry(start_time, end_time, success=True, error_message=None, scripts_run=None):
-    log = load_run_log()
+def log_run_entry(start_time, end_time, success=True, error_message=None, scripts_run=None, metrics=None):
     run_entry = {
         "initiator": os.path.basename(__file__),
         "timestamp": start_time.isoformat(),
@@ -68,10 +48,10 @@ def log_run_entry(start_time, end_time, success=True, error_message=None, script
         "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
         "success": success,
         "error_message": error_message,
-        "scripts_run": scripts_run or []
+        "scripts_run": scripts_run or [],
+        "metrics": metrics
     }
-    log.append(run_entry)
-    save_run_log(log)
+    log_run(run_entry)  # Append-only, rotating (see RunLog.py)
 
 
 # ───────── Lock Script (single dynamic instance) ──────────────────────────────────────────────
@@ -84,141 +64,221 @@ def is_already_running(lock_file_path="monitor.lock"):
     except portalocker.LockException:
         return True, None
 
-def load_portfolio():
-    if not os.path.exists(PORTFOLIO_FILE):
-        return {"cash": 0, "holdings": {}, "history": []}
-    return load_json_with_retry(PORTFOLIO_FILE)
-
-def save_portfolio(portfolio):
-    atomic_write_json(portfolio, PORTFOLIO_FILE)
-
 def load_deferred():
-    if not os.path.exists(DEFERRED_FILE):
-        return []
-    return load_json_with_retry(DEFERRED_FILE)
+    return read_json(DEFERRED_FILE, default={})
 
-def save_deferred(deferred):
-    atomic_write_json(deferred, DEFERRED_FILE)
+# deferred_sells.json is also written by ExecuteTrades: change single entries under the
+# file's write lock instead of saving our whole copy over theirs
+def update_deferred(ticker, record):
+    update_json(DEFERRED_FILE, lambda current: {**(current or {}), ticker: record}, default={})
 
-def load_trade_log():
-    if not os.path.exists(TRADE_LOG_FILE):
-        return []
-    return load_json_with_retry(TRADE_LOG_FILE)
-
-def save_trade_log(trade_log):
-    atomic_write_json(trade_log, TRADE_LOG_FILE)
+def remove_deferred(ticker):
+    update_json(DEFERRED_FILE, lambda current: {t: r for t, r in (current or {}).items() if t != ticker}, default={})
 
 def load_trade_signals():
-    if not os.path.exists(TRADE_SIGNALS_FILE):
-        return {"buy_signals": {}, "sell_signals": {}}
-    return load_json_with_retry(TRADE_SIGNALS_FILE)
+    return read_json(TRADE_SIGNALS_FILE, default={"buy_signals": {}, "sell_signals": {}})
+
+# ───────── Bulk Quotes ────────────────────────────────────────────────────────────────────────
+
+class QuoteBatcher:
+    """
+    Coalesces concurrent per-ticker requests into one bulk intraday download and
+    evaluates the trends of the whole batch in one trend_batch() call. At most one
+    upstream request per MIN_FETCH_GAP, however many tickers are being watched.
+    """
+
+    def __init__(self):
+        self.waiting = {}      # ticker → [futures]
+        self.trends = {}       # ticker → latest trend_batch() result
+        self.fetched_at = {}   # ticker → monotonic time of its last download
+        self.last_fetch = 0.0
+        self.requests = 0
+        self._flush = None
+
+    async def trend(self, ticker):
+        if time.monotonic() - self.fetched_at.get(ticker, -MIN_FETCH_GAP) < MIN_FETCH_GAP:
+            return self.trends.get(ticker)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(ticker, []).append(future)
+        if self._flush is None:
+            self._flush = asyncio.create_task(self._fetch_batch())
+        return await future
+
+    async def _fetch_batch(self):
+        gap = self.last_fetch + MIN_FETCH_GAP - time.monotonic()
+        await asyncio.sleep(max(COALESCE_SECONDS, gap))
+        waiting, self.waiting, self._flush = self.waiting, {}, None
+        tickers = list(waiting)
+        self.last_fetch = time.monotonic()  # Requests made during the download wait a full gap
+
+        try:
+            trends = await self._download(tickers)
+        except Exception as e:  # Hand the error to every waiting watcher instead of leaving them hanging
+            for futures in waiting.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for t in tickers:
+            self.trends[t] = trends[t]
+            self.fetched_at[t] = self.last_fetch
+            for future in waiting[t]:
+                if not future.done():
+                    future.set_result(trends[t])
+
+    async def _download(self, tickers):
+        with timer("monitor.download"):
+            intraday = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: fetch_intraday(tickers, max_age=MIN_FETCH_GAP))
+        self.requests += 1
+        count("monitor.batches")
+        gauge_max("monitor.batch_tickers", len(tickers))
+        self.last_fetch = time.monotonic()
+        if not intraday:  # Offline or rate-limited: fall back to the shared price cache
+            try:
+                intraday = load_cached_prices(data_type="intraday")
+            except FileNotFoundError:
+                intraday = {}
+
+        with timer("monitor.trend_batch"):
+            return trend_batch(
+                {t: intraday.get(t, {}).get("price", []) for t in tickers},
+                window=PRICE_WINDOW,  # last 10 prices (~last 50 mins if 5-min interval)
+                slope_threshold=SLOPE_THRESHOLD,
+                large_drop_pct=DROP_FROM_PEAK_PCT,
+                min_drop_pct=MIN_DROP_BELOW_PEAK_PCT
+            )
+
+def seconds_to_sell_by(now):
+    return (datetime.datetime.combine(now.date(), SELL_BY) - now).total_seconds()
+
+def next_poll_seconds(trend, now):
+    """
+    Adaptive interval: MIN_POLL_SECONDS when a ticker is at its exit conditions,
+    MAX_POLL_SECONDS when far away, never sleeping past SELL_BY.
+    """
+    closeness = 0.0
+    if trend and trend["slope"] is not None:
+        closeness = trend["drop_pct"] / DROP_FROM_PEAK_PCT
+        if trend["slope"] < SLOPE_THRESHOLD:
+            closeness = max(closeness, 0.75)  # Falling: only the min-drop condition is missing
+    interval = MAX_POLL_SECONDS - (MAX_POLL_SECONDS - MIN_POLL_SECONDS) * min(1.0, closeness)
+
+    to_close = seconds_to_sell_by(now)
+    interval = min(interval, max(MIN_POLL_SECONDS, to_close / 4))  # Speed up into the close
+    return max(1.0, min(interval, to_close)) if to_close > 0 else 0.0
 
 # ───────── Main Function ───────────────────────────────────────────────────────────────────
 
 def monitor_deferred():
-    portfolio = load_portfolio()
+    # Listen before reading deferred_sells.json so no deferral sent in between is missed
+    with Listener("monitor") as events:
+        asyncio.run(_monitor(events))
+
+async def _monitor(events):
     deferred = load_deferred()
-    trade_log = load_trade_log()
     trade_signals = load_trade_signals()
+    quotes = QuoteBatcher()
+    sell_lock = asyncio.Lock()  # Sells update the shared portfolio one at a time
+    loop = asyncio.get_running_loop()
+    watchers = {}
 
-    seen_tickers = set(deferred.keys())
-    
     print(f"Monitoring {len(deferred)} deferred sells...")
-    
-    # initial values for help function
-    loop_count = 0
-    countdown = 600  
-
-    # helper function (print timer and loop number)
-    def print_status_line():
-        msg = f"Total Check = {loop_count} / Time to next check = {countdown}s"
-        sys.stdout.write(f"\r{msg}{' ' * 10}")
-        sys.stdout.flush()
-
-    while deferred:
-        loop_count += 1
-
-        # Reload deferred list in case new tickers were added by run_bot.py
-        updated_deferred = load_deferred()
-        new_tickers = set(updated_deferred.keys()) - seen_tickers
-        deferred = updated_deferred
-
-        if new_tickers:
-            seen_tickers.update(new_tickers)
-            sys.stdout.write("\n")  # move to next line to not overwrite status
-            print(f"New deferred tickers detected: {', '.join(sorted(new_tickers))}")
-            print_status_line()  # reprint status line at bottom
-
-        now = datetime.datetime.now()
-
-        for ticker, stock in list(deferred.items()):
-            intraday = get_intraday_prices(ticker)
-            if len(intraday) < 5:
-                continue  # Not enough data yet
-
-            prices = np.array(intraday[-PRICE_WINDOW:])  # last 10 prices (~last 50 mins if 5-min interval)
-            X = np.arange(len(prices)).reshape(-1, 1)
-            y = np.array(prices).reshape(-1, 1)
-
-            model = LinearRegression().fit(X, y)
-            slope = model.coef_[0][0]
-            current_price = prices[-1]
-            peak_price = max(prices)
-            drop_from_peak_pct = ((peak_price - current_price) / peak_price) * 100
-
-            time_close = now.hour >= 15 and now.minute >= 50
-            downtrend = slope < SLOPE_THRESHOLD  
-            large_drop = drop_from_peak_pct > DROP_FROM_PEAK_PCT
-
-            min_drop_factor = 1 - (MIN_DROP_BELOW_PEAK_PCT / 100)
-            
-            if (downtrend and current_price < peak_price * min_drop_factor) or large_drop or time_close:
-                sell(ticker, portfolio, trade_log, current_price, trade_signals)
-                deferred.pop(ticker)
-
-                if not deferred:
-                    sys.stdout.write("\n")
-                    print("All deferred sells processed. Exiting.")
-                    save_deferred(deferred)
-                    save_portfolio(portfolio)
-                    save_trade_log(trade_log)
-                    if os.path.exists("monitor_started.txt"):
-                        os.remove("monitor_started.txt")
-                    return
-
-            elif current_price > stock["latest_price"]:
-                stock["latest_price"] = current_price
 
-        save_deferred(deferred)
-        save_portfolio(portfolio)
-        save_trade_log(trade_log)
-        
-        countdown = 600  # 10 minutes
-
-        while countdown > 0:
-            print_status_line()
+    async def sell_and_remove(ticker, price):
+        async with sell_lock:
+            with timer("monitor.sell"):
+                await loop.run_in_executor(None, sell, ticker, price, trade_signals)
+            deferred.pop(ticker, None)  # Only once the sale is recorded
+            remove_deferred(ticker)
+
+    async def watch(ticker):
+        while ticker in deferred:
+            count("monitor.polls")
+            trend = await quotes.trend(ticker)
+            now = datetime.datetime.now()
+            time_close = now.time() >= SELL_BY
+
+            if trend and trend["slope"] is not None:  # Otherwise not enough data yet
+                current_price = trend["last"]
+                if trend["sell"] or time_close:
+                    await sell_and_remove(ticker, current_price)
+                    return
+                if current_price > deferred[ticker]["latest_price"]:
+                    deferred[ticker]["latest_price"] = current_price
+                    update_deferred(ticker, deferred[ticker])
+            elif time_close:
+                # No usable intraday trend, but the SELL signal still stands: sell at the last known price
+                price = await loop.run_in_executor(None, get_current_price, ticker) or deferred[ticker]["latest_price"]
+                print(f"{ticker}: no intraday trend at close – selling at last known price ${price:.2f}")
+                await sell_and_remove(ticker, price)
+                return
+
+            wait = next_poll_seconds(trend, now)
+            if trend and trend["slope"] is not None:
+                print(f"{ticker}: {trend['last']:.2f} ({trend['drop_pct']:.2f}% below peak, "
+                      f"slope {trend['slope']:.4f}) → next check in {wait:.0f}s")
+            await asyncio.sleep(wait)
+
+    def start_watching(tickers):
+        for t in tickers:
+            if t not in watchers or watchers[t].done():
+                watchers[t] = asyncio.create_task(watch(t))
+
+    start_watching(list(deferred))
+
+    # New tickers deferred by ExecuteTrades arrive as events (no re-reading deferred_sells.json)
+    while deferred or any(not w.done() for w in watchers.values()):
+        event = await loop.run_in_executor(None, events.get, 1.0)
+        if event and event.get("event") == "deferred" and event["ticker"] not in deferred:
+            deferred[event["ticker"]] = event["stock"]
+            print(f"New deferred ticker detected: {event['ticker']}")
+            start_watching([event["ticker"]])
+        for t, w in watchers.items():
+            if w.done() and w.exception():
+                raise w.exception()
+
+    print(f"All deferred sells processed ({quotes.requests} bulk quote requests). Exiting.")
+    if os.path.exists("monitor_started.txt"):
+        os.remove("monitor_started.txt")
+
+def sell(ticker, price, trade_signals):
+    """
+    Sell the whole position in ticker at price. The portfolio is re-read and
+    written under its write lock, so trades ExecuteTrades made meanwhile are kept.
+    """
+    # One bulk quote request (shared market data service) for valuing the remaining holdings
+    live = get_current_prices(read_json(PORTFOLIO_FILE, default={}).get("holdings", {}))
+    sold = {}
+
+    def apply_sale(portfolio):
+        portfolio = portfolio or {"cash": 0, "holdings": {}, "history": []}
+        shares = portfolio["holdings"].pop(ticker, 0)
+        if shares <= 0:
+            return portfolio  # Already sold (e.g. by ExecuteTrades)
+        portfolio["cash"] += shares * price
+        sold["shares"] = shares
 
-            time.sleep(10)
-            countdown -= 10
+        # Use the same logic as ExecuteTrades.py for updating total value
+        total_val = portfolio["cash"]
+        for t, s in portfolio["holdings"].items():
+            total_val += s * (live.get(t) or 0)
 
-            # Check for new deferred tickers again
-            updated_deferred = load_deferred()
-            new_tickers = set(updated_deferred.keys()) - seen_tickers
-            if new_tickers:
-                seen_tickers.update(new_tickers)
-                sys.stdout.write("\n")
-                print(f"New deferred tickers detected: {', '.join(sorted(new_tickers))}")
-                print_status_line()  # ensure the status line is reprinted at bottom
+        # Update history (delta-encoded, see PortfolioHistory.py)
+        append_entry(portfolio, portfolio["cash"], total_val, portfolio["holdings"])
+        return {
+            **portfolio,
+            "date":     str(datetime.date.today()),
+            "cash":     round(portfolio["cash"], 2)
+        }
 
-def sell(ticker, portfolio, trade_log, price, trade_signals):
-    shares = portfolio["holdings"].pop(ticker, 0)
+    update_json(PORTFOLIO_FILE, apply_sale)
+    shares = sold.get("shares", 0)
     if shares > 0:
-        portfolio["cash"] += shares * price
-
         raw_trigger = trade_signals.get("sell_signals", {}).get(ticker, {}).get("trigger", "unspecified")
         trigger = f"deferred_{raw_trigger}"
 
-        trade_log.append({
+        append_trade({
             "ticker": ticker,
             "action": "SELL",
             "trigger": trigger,
@@ -227,45 +287,8 @@ def sell(ticker, portfolio, trade_log, price, trade_signals):
             "shares": shares
         })
         print(f"Sold {shares} of {ticker} @ ${price:.2f}")
-
-        # Use the same logic as ExecuteTrades.py for updating total value
-        total_val = portfolio["cash"]
-        for t, shares in portfolio["holdings"].items():
-            tk = yf.Ticker(t)
-            lp = tk.fast_info.last_price or 0
-            total_val += shares * lp
-
-        # Update history
-        portfolio["history"].append({
-            "datetime":    datetime.datetime.now().isoformat(),
-            "cash":        round(portfolio["cash"], 2),
-            "total_value": round(total_val, 2),
-            "holdings":    portfolio["holdings"]
-        })
-
-        # Save the updated portfolio summary
-        new_summary = {
-            "date":     str(datetime.date.today()),
-            "cash":     round(portfolio["cash"], 2),
-            "holdings": portfolio["holdings"],
-            "history":  portfolio["history"]
-        }
-        save_portfolio(new_summary)
-
-def get_current_price(ticker):
-    stock = yf.Ticker(ticker)
-    price = stock.fast_info.get("last_price", None)
-
-    if price is None or price == 0:
-        try:
-            hist = stock.history(period="1d")
-            if not hist.empty:
-                price = hist["Close"].iloc[-1]
-        except Exception as e:
-            print(f"Error fetching historical price for {ticker}: {e}")
-            price = 0
-
-    return price or 0
+        publish("monitor_events", "sold", ticker=ticker, price=price, shares=shares)
+    return shares
 
 # ───────── Execute Script ───────────────────────────────────────────────────────────────────
 
@@ -281,7 +304,8 @@ if __name__ == "__main__":
     success = True
 
     try:
-        monitor_deferred()
+        with stage("Monitor"), profile("Monitor"):
+            monitor_deferred()
     except Exception as e:
         success = False
         error_message = str(e)
@@ -291,7 +315,9 @@ if __name__ == "__main__":
     finally:
         scripts_run.append("MonitorDeferredSells - END")
         end_time = datetime.datetime.now()
-        log_run_entry(start_time, end_time, success=success, error_message=error_message, scripts_run=scripts_run)
+        log_run_entry(start_time, end_time, success=success, error_message=error_message, scripts_run=scripts_run,
+                      metrics=snapshot())
         lock_file.close()
         if os.path.exists("monitor_started.txt"):
             os.remove("monitor_started.txt")
+        publish("monitor_events", "done", success=success)  # Wakes run_bot.py if it is waiting
@@ -0,0 +1,195 @@
+# PaperBroker.py
+import sys
+import json
+import time
+import threading
+import subprocess
+from concurrent.futures import Future
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+BROKER_CONFIG = {
+    "spread_bps":        10,    # Full bid/ask spread: buys pay half above quote, sells receive half below
+    "slippage_bps":      5,     # Fixed adverse move per order
+    "impact_bps_per_pct": 2,    # Extra slippage per 1% of average daily volume taken
+    "max_participation": 0.10,  # Max fraction of average daily volume filled per order (rest = partial)
+    "latency_ms":        250,   # Delay between submission and fills coming back
+}
+
+# Orders:  {"ticker", "side": "BUY"/"SELL", "shares", "quote_price", "trigger"}
+# Fills:   order fields + {"status": FILLED/PARTIAL/REJECTED, "filled_shares", "fill_price", "cost"}
+# "cost" is the execution cost vs the quote in currency (spread + slippage + impact).
+
+# ─── FILL MODEL ─────────────────────────────────────────────────────────────────
+
+def make_order(ticker, side, shares, quote_price, trigger="unspecified"):
+    return {
+        "ticker": ticker,
+        "side": side,
+        "shares": shares,
+        "quote_price": quote_price,
+        "trigger": trigger
+    }
+
+def cost_bps(config, shares=0, adv=None):
+    """Adverse price move (basis points) an order of this size is expected to pay."""
+    bps = config["spread_bps"] / 2 + config["slippage_bps"]
+    if adv:
+        bps += config["impact_bps_per_pct"] * 100 * shares / adv
+    return bps
+
+def simulate_fill(order, config=BROKER_CONFIG, adv=None):
+    """Apply spread, slippage, market impact and the participation cap to one order."""
+    quote = order.get("quote_price") or 0
+    shares = order.get("shares") or 0
+    if quote <= 0 or shares <= 0:
+        return {**order, "status": "REJECTED", "filled_shares": 0, "fill_price": None, "cost": 0.0}
+
+    filled = shares
+    if adv:
+        filled = min(shares, round(adv * config["max_participation"], 3))
+
+    move = cost_bps(config, filled, adv) / 10_000
+    fill_price = quote * (1 + move) if order["side"] == "BUY" else quote * (1 - move)
+    fill_price = round(fill_price, 4)
+    return {
+        **order,
+        "status": "FILLED" if filled >= shares else ("PARTIAL" if filled > 0 else "REJECTED"),
+        "filled_shares": filled,
+        "fill_price": fill_price if filled > 0 else None,
+        "cost": round(abs(fill_price - quote) * filled, 4)
+    }
+
+def simulate_batch(orders, config=BROKER_CONFIG, volumes=None):
+    """Fill a batch of orders. volumes: {ticker: average daily volume} (optional)."""
+    volumes = volumes or {}
+    return [simulate_fill(o, config, volumes.get(o["ticker"])) for o in orders]
+
+def average_daily_volumes(cache, tickers, window=20):
+    """{ticker: mean volume over the last window days} from a daily price cache."""
+    volumes = {}
+    for t in tickers:
+        vols = [v for v in cache.get(t, {}).get("volume", [])[-window:] if v]
+        if vols:
+            volumes[t] = sum(vols) / len(vols)
+    return volumes
+
+# ─── BROKERS ────────────────────────────────────────────────────────────────────
+
+class InlineBroker:
+    """
+    Same interface as PaperBroker, filled synchronously in this process with no
+    latency. Used for backtests and offline runs.
+    """
+
+    def __init__(self, config=None, volumes=None):
+        self.config = {**BROKER_CONFIG, **(config or {})}
+        self.volumes = volumes or {}
+
+    def submit_batch(self, orders):
+        future = Future()
+        future.set_result(simulate_batch(orders, self.config, self.volumes))
+        return future
+
+    def submit(self, order):
+        """Submit a single order; the Future resolves to its fill."""
+        future = Future()
+        batch = self.submit_batch([order])
+        batch.add_done_callback(
+            lambda f: future.set_exception(f.exception()) if f.exception() else future.set_result(f.result()[0])
+        )
+        return future
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PaperBroker(InlineBroker):
+    """
+    Broker backed by a local paper-broker process (python PaperBroker.py --serve).
+    Batches are sent as one JSON line on stdin; fills come back asynchronously on
+    stdout and resolve the Future returned by submit_batch().
+    """
+
+    def __init__(self, config=None, volumes=None):
+        super().__init__(config, volumes)
+        self._futures = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            [sys.executable, __file__, "--serve", json.dumps(self.config)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+        self._reader = threading.Thread(target=self._read_fills, daemon=True)
+        self._reader.start()
+
+    def _read_fills(self):
+        for line in self._proc.stdout:
+            reply = json.loads(line)
+            with self._lock:
+                future = self._futures.pop(reply["id"], None)
+            if future is not None:
+                future.set_result(reply["fills"])
+        with self._lock:  # Broker process exited: fail anything still pending
+            for future in self._futures.values():
+                future.set_exception(RuntimeError("Paper broker process exited"))
+            self._futures.clear()
+
+    def submit_batch(self, orders):
+        future = Future()
+        with self._lock:
+            batch_id = self._next_id
+            self._next_id += 1
+            self._futures[batch_id] = future
+        volumes = {o["ticker"]: self.volumes[o["ticker"]] for o in orders if o["ticker"] in self.volumes}
+        self._proc.stdin.write(json.dumps({"id": batch_id, "orders": orders, "volumes": volumes}) + "\n")
+        self._proc.stdin.flush()
+        return future
+
+    def close(self):
+        if self._proc.poll() is None:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=10)
+
+# ─── BROKER PROCESS ─────────────────────────────────────────────────────────────
+
+def serve(config):
+    """Read order batches from stdin and write fills to stdout after the configured latency."""
+    write_lock = threading.Lock()
+    timers = []
+
+    def respond(batch):
+        fills = simulate_batch(batch["orders"], config, batch.get("volumes"))
+        with write_lock:
+            sys.stdout.write(json.dumps({"id": batch["id"], "fills": fills}) + "\n")
+            sys.stdout.flush()
+
+    for line in sys.stdin:
+        if line.strip():
+            timer = threading.Timer(config["latency_ms"] / 1000, respond, args=(json.loads(line),))
+            timer.start()
+            timers.append(timer)
+    for timer in timers:  # Client closed stdin: deliver outstanding fills, then exit
+        timer.join()
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--serve":
+        serve({**BROKER_CONFIG, **(json.loads(sys.argv[2]) if len(sys.argv) > 2 else {})})
+    else:
+        # Quick demo of the fill model
+        with PaperBroker(volumes={"DEMO.L": 50_000}) as broker:
+            start = time.time()
+            fills = broker.submit_batch([
+                make_order("DEMO.L", "BUY", 1_000, 100.0),
+                make_order("DEMO.L", "BUY", 10_000, 100.0),
+                make_order("DEMO.L", "SELL", 500, 100.0),
+            ]).result()
+            for f in fills:
+                print(f"{f['side']:<4} {f['shares']:>7} → {f['status']:<8} {f['filled_shares']:>7} "
+                      f"@ {f['fill_price']} (cost £{f['cost']:.2f})")
+            print(f"Batch round trip: {(time.time() - start) * 1000:.0f} ms")
@@ -0,0 +1,177 @@
+# PerformanceMetrics.py
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PortfolioHistory import HistoryView
+from TradeJournal import JOURNAL_FILE
+from StateAccess import read_json, write_json, version_of
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+PORTFOLIO_FILE     = "portfolio_summary.json"
+PRICE_CACHE_FILE   = "price_cache.json"
+METRICS_CACHE_FILE = "metrics_cache.json"
+TRADING_DAYS       = 252   # Annualisation factor for daily returns
+RISK_FREE_RATE     = 0.0   # Annual, for Sharpe / Sortino
+ROLLING_WINDOW     = 20    # Trading days per rolling volatility window
+
+# Metrics are computed from a daily equity series:
+#  - the exact daily closes in the portfolio history (HistoryView.daily_closes), plus
+#  - trading days in the price store with no portfolio close, valued from the holdings
+#    and cash of the latest history entry at the price store's close for that day.
+# Results are cached (in memory and metrics_cache.json) by a version of their inputs:
+# portfolio file content, trade journal length and price cache modification time.
+
+_memo = {}  # version → metrics (this process)
+
+# ─── EQUITY SERIES ──────────────────────────────────────────────────────────────
+
+def equity_series(portfolio, price_cache=None):
+    """
+    Daily equity curve as (dates: datetime64[D] array, equity: float array), oldest first.
+    price_cache: daily price cache {ticker: {"dates", "close"}} used to fill missing days.
+    """
+    view = HistoryView(portfolio)
+    closes = dict(view.daily_closes())
+    if closes and price_cache:
+        first, last = min(closes), max(closes)
+        trading_days = sorted({d for data in price_cache.values() for d in data.get("dates", [])
+                               if first < d < last and d not in closes})
+        by_date = {}
+        for day in trading_days:
+            entry = view.at(day + "T23:59:59")
+            if entry is None or entry.get("cash") is None:
+                continue
+            value = entry["cash"]
+            for t, shares in entry["holdings"].items():
+                if t not in by_date:
+                    data = price_cache.get(t, {})
+                    by_date[t] = dict(zip(data.get("dates", []), data.get("close", [])))
+                price = by_date[t].get(day)
+                if price is None:
+                    break  # Can't value this day
+                value += shares * price
+            else:
+                closes[day] = value
+    days = sorted(closes)
+    return np.array(days, dtype="datetime64[D]"), np.array([closes[d] for d in days], dtype=float)
+
+# ─── METRICS ────────────────────────────────────────────────────────────────────
+
+def _num(x):
+    return None if x is None or not np.isfinite(x) else round(float(x), 6)
+
+def compute_metrics(dates, equity, traded_value=0.0, positions=()):
+    """
+    Performance statistics of a daily equity curve (vectorised).
+    traded_value: buy cost + sell proceeds over the period (turnover),
+    positions: closed positions [{"realized", "days"}] (hit rate, holding period).
+    """
+    n = len(equity)
+    realized = np.array([p["realized"] for p in positions], dtype=float)
+    held_days = np.array([p["days"] for p in positions], dtype=float)
+    result = {
+        "start": str(dates[0]) if n else None,
+        "end": str(dates[-1]) if n else None,
+        "days": n,
+        "closed_positions": len(realized),
+        "hit_rate": _num((realized > 0).mean()) if len(realized) else None,
+        "avg_holding_days": _num(held_days.mean()) if len(held_days) else None,
+        "turnover": _num(traded_value / equity.mean()) if n and equity.mean() > 0 else None,
+    }
+    if n < 2:
+        return {**result, "total_return": None, "annual_return": None, "annual_volatility": None,
+                "sharpe": None, "sortino": None, "max_drawdown": None, "max_drawdown_days": None,
+                "max_drawdown_trough": None, "annual_turnover": None, "rolling_volatility": []}
+
+    returns = np.diff(equity) / equity[:-1]
+    excess = returns - RISK_FREE_RATE / TRADING_DAYS
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))
+    years = len(returns) / TRADING_DAYS
+
+    # Drawdown: distance below the running peak; duration = calendar days since that peak
+    peak = np.maximum.accumulate(equity)
+    drawdown = equity / peak - 1
+    idx = np.arange(n)
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, idx, 0))
+    under_water = (dates - dates[last_peak]).astype(int)
+
+    rolling = []
+    if len(returns) >= ROLLING_WINDOW:
+        vol = sliding_window_view(returns, ROLLING_WINDOW).std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+        rolling = [[str(d), _num(v)] for d, v in zip(dates[ROLLING_WINDOW:], vol)]
+
+    return {
+        **result,
+        "total_return": _num(equity[-1] / equity[0] - 1),
+        "annual_return": _num((equity[-1] / equity[0]) ** (1 / years) - 1) if equity[0] > 0 else None,
+        "annual_volatility": _num(std * np.sqrt(TRADING_DAYS)),
+        "sharpe": _num(excess.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else None,
+        "sortino": _num(excess.mean() / downside * np.sqrt(TRADING_DAYS)) if downside > 0 else None,
+        "max_drawdown": _num(drawdown.min()),
+        "max_drawdown_days": int(under_water.max()),
+        "max_drawdown_trough": str(dates[drawdown.argmin()]),
+        "annual_turnover": _num(traded_value / equity.mean() / years) if equity.mean() > 0 else None,
+        "rolling_volatility": rolling
+    }
+
+# ─── CACHED ENTRY POINT ─────────────────────────────────────────────────────────
+
+def history_version(portfolio_file=PORTFOLIO_FILE):
+    """Changes whenever the portfolio history, the trade journal or the price store changes."""
+    parts = [
+        version_of(portfolio_file),
+        os.path.getsize(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0,
+        os.path.getmtime(PRICE_CACHE_FILE) if os.path.exists(PRICE_CACHE_FILE) else None
+    ]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+def get_metrics(portfolio_file=PORTFOLIO_FILE, force=False):
+    """Performance metrics of the live portfolio, recomputed only when their inputs changed."""
+    version = history_version(portfolio_file)
+    if not force:
+        if version in _memo:
+            return _memo[version]
+        cached = read_json(METRICS_CACHE_FILE)
+        if cached and cached.get("version") == version:
+            _memo[version] = cached["metrics"]
+            return cached["metrics"]
+
+    from DataManager import load_cached_prices
+    from TradeSummary import update_aggregates
+    from LotLedger import LotLedger
+
+    portfolio = read_json(portfolio_file, default={})
+    try:
+        price_cache = load_cached_prices(data_type="daily")
+    except FileNotFoundError:
+        price_cache = {}
+    aggregates = update_aggregates()
+    traded_value = sum(a["buy_cost"] + a["sell_proceeds"] for a in aggregates["tickers"].values())
+
+    dates, equity = equity_series(portfolio, price_cache)
+    metrics = compute_metrics(dates, equity, traded_value, LotLedger.load().closed_positions())
+    write_json(METRICS_CACHE_FILE, {"version": version, "computed_at": datetime.now().isoformat(timespec="seconds"),
+                                    "metrics": metrics})
+    _memo[version] = metrics
+    return metrics
+
+if __name__ == "__main__":
+    m = get_metrics()
+    if m["days"] < 2:
+        print(f"Not enough history for performance metrics ({m['days']} daily closes).")
+    else:
+        pct = lambda x: "N/A" if x is None else f"{x * 100:+.2f}%"
+        num = lambda x: "N/A" if x is None else f"{x:.2f}"
+        print(f"Performance {m['start']} → {m['end']} ({m['days']} daily closes)")
+        print(f" • Total return:      {pct(m['total_return'])}  (annualised {pct(m['annual_return'])})")
+        print(f" • Volatility:        {pct(m['annual_volatility'])} a year")
+        print(f" • Sharpe / Sortino:  {num(m['sharpe'])} / {num(m['sortino'])}")
+        print(f" • Max drawdown:      {pct(m['max_drawdown'])} (trough {m['max_drawdown_trough']}, "
+              f"{m['max_drawdown_days']} days under water)")
+        print(f" • Turnover:          {num(m['turnover'])}x  ({num(m['annual_turnover'])}x a year)")
+        print(f" • Hit rate:          {pct(m['hit_rate'])} of {m['closed_positions']} closed positions")
+        print(f" • Avg holding:       {num(m['avg_holding_days'])} days")
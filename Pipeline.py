@@ -0,0 +1,388 @@
+# Pipeline.py
+import os
+import json
+import hashlib
+from datetime import date, datetime, timedelta
+from DataManager import (fetch_and_cache_prices, fetch_intraday, load_cached_prices, load_universe,
+                         prime_quotes, save_cache, split_cache, INTRADAY_VALID_FROM)
+from TradeJournal import read_since
+from StateAccess import read_json, read_versioned, write_json
+from SelectStocks import select_stocks, save_screen
+from GenerateSignals import generate_signals, save_signals
+from ExecuteTrades import execute_trades
+from TradeSummary import summarize, print_summary, AGGREGATES_FILE
+from ValidateTrades import validate, VIOLATIONS_FILE
+from Instrumentation import stage
+from Profiling import profile
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+PORTFOLIO_FILE = "portfolio_summary.json"
+DAILY_SCREEN   = "daily_screen.json"
+SIGNALS_FILE   = "trade_signals.json"
+SUMMARY_FILE   = "trade_summary.json"
+DEFERRED_FILE  = "deferred_sells.json"
+STAGE_CACHE_FILE = "stage_cache.json"
+CHECKPOINT_FILE  = "job_checkpoint.json"
+RESUME_MAX_AGE   = timedelta(minutes=30)  # A failed job is resumed (prices reused) only this soon after
+INITIAL_CASH   = 10_000
+
+def fingerprint(obj):
+    """Content hash of any JSON-serialisable value."""
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+# ─── SHARED STATE ───────────────────────────────────────────────────────────────
+
+class PipelineContext:
+    """
+    State shared by every stage of one bot run: the universe, price data,
+    portfolio, trade history, screen and signals. Each is loaded once and
+    handed from stage to stage in memory. The portfolio and trades are only
+    re-read when another process (MonitorDeferredSells) has changed them on disk.
+    """
+
+    def __init__(self):
+        self.universe = None
+        self.prices   = None  # Full price cache {ticker: {"daily": ..., "intraday": ...}}
+        self.daily    = None
+        self.intraday = None
+        self.daily_version    = None  # Content hashes of the price data, set when it is (re)loaded
+        self.intraday_version = None
+        self.screen   = None
+        self.signals  = None
+        self.summary  = None
+        self._portfolio = None
+        self._portfolio_mtime = None
+        self.portfolio_version = None  # StateAccess version of the portfolio file as read
+        self._trades = []
+        self._trades_offset = 0
+
+    # ── Prices ──
+    def load_prices(self, fetch=True):
+        """Download (fetch=True) or read the cached price data once for the whole run."""
+        with stage("Prices" if fetch else "Prices (cached)"):
+            self.universe = load_universe()
+            if fetch:
+                # Cache 60 days daily history for all symbols (force = ensure latest values)
+                self.prices = fetch_and_cache_prices(self.universe, period="60d", interval="1d", force=True, intraday=True)
+            else:
+                self.prices = load_cached_prices()
+            self.daily    = split_cache(self.prices, "daily")
+            self.intraday = split_cache(self.prices, "intraday")
+            self.daily_version    = fingerprint(self.daily)
+            self.intraday_version = fingerprint(self.intraday)
+
+    def refresh_intraday(self):
+        """
+        Re-download only today's intraday prices (one batched call) and keep the daily
+        history in memory. The last intraday price of each ticker becomes its live quote.
+        """
+        if self.prices is None:
+            return self.load_prices()
+        with stage("Intraday prices"):
+            fresh = fetch_intraday(self.universe)
+            for ticker, data in fresh.items():
+                self.prices.setdefault(ticker, {})["intraday"] = data
+                self.intraday[ticker] = data
+            save_cache(self.prices)  # MonitorDeferredSells reads the cache file
+        prime_quotes(fresh)
+        self.intraday_version = fingerprint(self.intraday)
+        return len(fresh)
+
+    # ── Portfolio ──
+    @property
+    def portfolio(self):
+        mtime = os.path.getmtime(PORTFOLIO_FILE) if os.path.exists(PORTFOLIO_FILE) else None
+        if self._portfolio is None or mtime != self._portfolio_mtime:
+            self._portfolio, self.portfolio_version = read_versioned(PORTFOLIO_FILE)
+            if self._portfolio is None:
+                self._portfolio = {"cash": INITIAL_CASH, "holdings": {}, "history": []}
+            self._portfolio_mtime = mtime
+        return self._portfolio
+
+    def reload_portfolio(self):
+        """Re-read the portfolio (and its version) after a stage has written it."""
+        self._portfolio = None
+
+    @property
+    def holdings(self):
+        return set(self.portfolio.get("holdings", {}))
+
+    # ── Trades ──
+    @property
+    def trades(self):
+        """Full trade history; only trades appended since the last access are read."""
+        new, self._trades_offset = read_since(self._trades_offset)
+        self._trades.extend(new)
+        return self._trades
+
+    # ── Files written by other processes ──
+    def load_screen(self):
+        if self.screen is None:
+            with open(DAILY_SCREEN) as f:
+                self.screen = json.load(f)
+        return self.screen
+
+    def load_signals(self):
+        if self.signals is None:
+            with open(SIGNALS_FILE) as f:
+                self.signals = json.load(f)
+        return self.signals
+
+    # ── Artifact fingerprints (stage cache inputs) ──
+    def artifact(self, name):
+        if name == "date":
+            return str(date.today())
+        if name == "session":  # ExecuteTrades only uses intraday logic after INTRADAY_VALID_FROM
+            return [str(date.today()), datetime.now().time() >= INTRADAY_VALID_FROM]
+        if name == "universe":
+            return fingerprint(self.universe)
+        if name == "daily_prices":
+            return self.daily_version
+        if name == "intraday_prices":
+            return self.intraday_version
+        if name == "positions":  # Cash and holdings only: every execute run appends to history
+            p = self.portfolio
+            return fingerprint([p.get("cash"), p.get("holdings", {})])
+        if name == "portfolio":
+            return fingerprint(self.portfolio)
+        if name == "trades":  # The journal is append-only, so its length and offset identify it
+            return [len(self.trades), self._trades_offset]
+        if name == "screen":
+            return file_hash(DAILY_SCREEN)
+        if name == "signals":
+            return file_hash(SIGNALS_FILE)
+        if name == "deferred":
+            return file_hash(DEFERRED_FILE)
+        raise KeyError(f"Unknown pipeline artifact: {name}")
+
+# ─── STAGES ─────────────────────────────────────────────────────────────────────
+# Each stage takes the context, reads its inputs from it and stores its outputs on it.
+# Output files are still written so the CLI scripts and MonitorDeferredSells see them.
+
+def run_select(ctx):
+    ctx.screen = select_stocks(ctx.daily, ctx.holdings, ctx.universe)
+    save_screen(ctx.screen)
+    print(f"Screened {len(ctx.universe)} tickers → buy {len(ctx.screen['to_buy'])}, "
+          f"sell {len(ctx.screen['to_sell'])}.")
+
+def run_signals(ctx):
+    ctx.signals = generate_signals(ctx.daily, ctx.holdings, ctx.trades, ctx.universe)
+    save_signals(ctx.signals)
+
+def run_execute(ctx):
+    execute_trades(ctx.load_signals(), ctx.load_screen(), ctx.portfolio, ctx.daily, ctx.intraday,
+                   portfolio_version=ctx.portfolio_version)
+    ctx.reload_portfolio()  # MonitorDeferredSells may have sold in between
+    # Incremental: only the trades just made are validated
+    violations, validated, _ = validate(ctx.portfolio)
+    print(f"🔍 Validated {validated} new trades: {len(violations)} violations (see {VIOLATIONS_FILE})")
+
+def run_summary(ctx):
+    ctx.summary, last_buy_time, last_sell_time = summarize(ctx.portfolio, ctx.daily)  # Trade aggregates: new trades only
+    if ctx.summary["total_trades"]:
+        print_summary(ctx.summary, last_buy_time, last_sell_time)
+
+# On a cache hit the stage's output file is read back instead of recomputed
+def _reuse_screen(ctx):
+    ctx.screen = None
+    ctx.load_screen()
+
+def _reuse_signals(ctx):
+    ctx.signals = None
+    ctx.load_signals()
+
+def _reuse_summary(ctx):
+    with open(SUMMARY_FILE) as f:
+        ctx.summary = json.load(f)
+
+STAGES = {
+    "SelectStocks":    run_select,
+    "GenerateSignals": run_signals,
+    "ExecuteTrades":   run_execute,
+    "TradeSummary":    run_summary,
+}
+
+# name: (input artifacts, output files, reuse function). Only stages with a reuse
+# function are cached; the others (ExecuteTrades: it trades) run every time.
+STAGE_IO = {
+    "SelectStocks":    (["date", "universe", "daily_prices", "positions"],
+                        [DAILY_SCREEN], _reuse_screen),
+    "GenerateSignals": (["date", "universe", "daily_prices", "intraday_prices", "positions", "trades"],
+                        [SIGNALS_FILE], _reuse_signals),
+    "ExecuteTrades":   (["session", "signals", "screen", "daily_prices", "intraday_prices", "positions", "deferred"],
+                        [PORTFOLIO_FILE, DEFERRED_FILE], None),
+    "TradeSummary":    (["date", "daily_prices", "portfolio", "trades"],
+                        [SUMMARY_FILE, AGGREGATES_FILE], _reuse_summary),
+}
+
+# ─── JOB CHECKPOINT ─────────────────────────────────────────────────────────────
+
+class JobCheckpoint:
+    """
+    The steps one run_bot job has finished, with the artifact versions they left
+    (job_checkpoint.json). If the job fails, the next job started within
+    RESUME_MAX_AGE on the same day resumes it: finished steps are not repeated.
+    Steps with side effects (ExecuteTrades) are never repeated; steps that only
+    produce a file are redone if that file has changed since.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE, max_age=RESUME_MAX_AGE):
+        self.path = path
+        previous = read_json(path)
+        self.resumed = bool(
+            previous and previous.get("status") != "complete"
+            and previous.get("date") == str(date.today())
+            and datetime.now() - datetime.fromisoformat(previous["updated"]) <= max_age
+        )
+        if self.resumed:
+            self.state = previous
+            self.state["resumes"] = previous.get("resumes", 0) + 1
+        else:
+            self.state = {"started": datetime.now().isoformat(timespec="seconds"), "date": str(date.today()),
+                          "steps": {}, "values": {}}
+        self.state["status"] = "running"
+        self._save()
+
+    @property
+    def failed_step(self):
+        """The step the interrupted job was in when it failed (None if between steps)."""
+        return self.state.get("current") if self.resumed else None
+
+    def done(self, step, verify=()):
+        """
+        Did the job finish step, with each file in verify still as it left it?
+        Files a later finished step has rewritten (signals after a sell) aren't checked.
+        """
+        steps = self.state["steps"]
+        if step not in steps:
+            return False
+        order = list(steps)
+        rewritten = {path for later in order[order.index(step) + 1:] for path in steps[later]["outputs"]}
+        return all(file_hash(path) == steps[step]["outputs"].get(path) for path in verify if path not in rewritten)
+
+    def begin(self, step):
+        self.state["current"] = step
+        self._save()
+
+    def record(self, step, outputs=(), inputs=None, **data):
+        """Mark step finished: hashes of its output files, its input fingerprint and any extra data."""
+        self.state["steps"].pop(step, None)  # Keep steps in the order they (last) finished
+        self.state["steps"][step] = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "inputs": inputs,
+            "outputs": {path: file_hash(path) for path in outputs},
+            **data
+        }
+        if self.state.get("current") == step:
+            del self.state["current"]
+        self._save()
+
+    def data(self, step):
+        return self.state["steps"][step]
+
+    def remember(self, key, compute):
+        """compute() once per job: a resumed job gets the value the failed one computed."""
+        if key not in self.state["values"]:
+            self.state["values"][key] = compute()
+            self._save()
+        return self.state["values"][key]
+
+    def fail(self, error):
+        self.state.update(status="failed", error=str(error))
+        self._save()
+
+    def complete(self):
+        self.state["status"] = "complete"
+        self.state.pop("current", None)
+        self._save()
+
+    def _save(self):
+        self.state["updated"] = datetime.now().isoformat(timespec="seconds")
+        write_json(self.path, self.state)
+
+# ─── RUNNER ─────────────────────────────────────────────────────────────────────
+
+class PipelineRunner:
+    """
+    Runs stages in-process against one shared PipelineContext. A stage whose input
+    fingerprint matches its last successful run (and whose output files are
+    unchanged since) is skipped and its previous output reused. With a
+    JobCheckpoint, steps the job already finished are skipped as well.
+    """
+
+    def __init__(self, ctx=None, use_cache=True, checkpoint=None):
+        self.ctx = ctx or PipelineContext()
+        self.use_cache = use_cache
+        self.checkpoint = checkpoint
+        self.cache_log = []  # [{"stage", "hit"}] since the last take_cache_log()
+
+    def _load_cache(self):
+        if not os.path.exists(STAGE_CACHE_FILE):
+            return {}
+        try:
+            with open(STAGE_CACHE_FILE) as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def _save_cache(self, cache):
+        tmp = STAGE_CACHE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp, STAGE_CACHE_FILE)
+
+    def run(self, name, force=False, step=None):
+        """Run stage name; step labels this run of it in the job checkpoint (default: name)."""
+        inputs, outputs, reuse = STAGE_IO[name]
+        step = step or name
+        if self.checkpoint and self.checkpoint.done(step, verify=outputs if reuse else ()):
+            print(f">>> Skipping {step} (finished before the job was interrupted)")
+            self.cache_log.append({"stage": name, "hit": True, "resumed": True})
+            if reuse:
+                reuse(self.ctx)
+            return None
+
+        key = fingerprint({i: self.ctx.artifact(i) for i in inputs})
+        cached = reuse is not None  # Stages with side effects (ExecuteTrades places trades) always run
+        last = self._load_cache().get(name) if cached else None
+        hit = (
+            self.use_cache and not force and last is not None and last["inputs"] == key
+            and all(file_hash(path) == h for path, h in last["outputs"].items())
+        )
+        if cached:
+            self.cache_log.append({"stage": name, "hit": hit})
+        if hit:
+            print(f">>> Skipping {name} (inputs unchanged since {last['at']})")
+            if reuse:
+                reuse(self.ctx)
+            if self.checkpoint:
+                self.checkpoint.record(step, outputs, key)
+            return None
+
+        print(f">>> Running {name}")
+        if self.checkpoint:
+            self.checkpoint.begin(step)
+        with stage(step), profile(step):
+            result = STAGES[name](self.ctx)
+        if cached:
+            cache = self._load_cache()  # Re-read: a stage may run for a while
+            cache[name] = {
+                "inputs": key,
+                "outputs": {path: file_hash(path) for path in outputs},
+                "at": datetime.now().isoformat(timespec="seconds")
+            }
+            self._save_cache(cache)
+        if self.checkpoint:
+            self.checkpoint.record(step, outputs, key)
+        return result
+
+    def take_cache_log(self):
+        """Return and reset the stage cache hits/misses (recorded in the run log)."""
+        log, self.cache_log = self.cache_log, []
+        return log
@@ -0,0 +1,196 @@
+# PortfolioHistory.py
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+KEYFRAME_EVERY = 20    # Store a full holdings copy every N entries, deltas in between
+INTRADAY_DAYS  = 14    # Older than this: keep only each day's last entry (the daily close)
+DAILY_DAYS     = 180   # Older than this: keep only each week's last entry
+
+# History entry formats in portfolio_summary.json:
+#   keyframe: {"datetime", "cash", "total_value", "holdings": {ticker: shares}}
+#   delta:    {"datetime", "cash", "total_value", "delta": {ticker: shares or None if sold}}
+# Old files (every entry has "holdings") are simply all keyframes.
+# portfolio["daily_closes"] = {YYYY-MM-DD: total_value} keeps every daily close exact
+# once its entry has been downsampled to weekly.
+
+# ─── ENCODING ───────────────────────────────────────────────────────────────────
+
+def _delta(prev, curr):
+    changes = {t: s for t, s in curr.items() if prev.get(t) != s}
+    changes.update({t: None for t in prev if t not in curr})
+    return changes
+
+def _apply_delta(holdings, delta):
+    holdings = dict(holdings)
+    for t, s in delta.items():
+        if s is None:
+            holdings.pop(t, None)
+        else:
+            holdings[t] = s
+    return holdings
+
+def _tail_state(history):
+    """Return (holdings after the last entry, entries since the last keyframe)."""
+    i = len(history) - 1
+    while i >= 0 and "holdings" not in history[i]:
+        i -= 1
+    if i < 0:
+        holdings, i = {}, -1
+    else:
+        holdings = history[i]["holdings"]
+    for entry in history[i + 1:]:
+        holdings = _apply_delta(holdings, entry.get("delta", {}))
+    return holdings, len(history) - 1 - i
+
+def expand(history):
+    """Yield every history entry with its full holdings dict."""
+    holdings = {}
+    for entry in history:
+        if "holdings" in entry:
+            holdings = dict(entry["holdings"])
+        else:
+            holdings = _apply_delta(holdings, entry.get("delta", {}))
+        yield {
+            "datetime":    entry["datetime"],
+            "cash":        entry.get("cash"),
+            "total_value": entry.get("total_value"),
+            "holdings":    holdings
+        }
+
+def encode(entries):
+    """Delta-encode a list of full entries (inverse of expand)."""
+    history, prev = [], None
+    for i, entry in enumerate(entries):
+        base = {k: entry[k] for k in ("datetime", "cash", "total_value")}
+        if prev is None or i % KEYFRAME_EVERY == 0:
+            base["holdings"] = dict(entry["holdings"])
+        else:
+            base["delta"] = _delta(prev, entry["holdings"])
+        history.append(base)
+        prev = entry["holdings"]
+    return history
+
+# ─── APPEND ─────────────────────────────────────────────────────────────────────
+
+def append_entry(portfolio, cash, total_value, holdings, when=None):
+    """
+    Append a snapshot to portfolio["history"] as a delta against the previous
+    entry (a keyframe every KEYFRAME_EVERY entries), then downsample old
+    entries at most once per day. Only the entries since the last keyframe are read.
+    """
+    history = portfolio.setdefault("history", [])
+    prev_holdings, since_keyframe = _tail_state(history)
+    entry = {
+        "datetime":    when or datetime.now().isoformat(),
+        "cash":        round(cash, 2),
+        "total_value": round(total_value, 2)
+    }
+    if not history or since_keyframe + 1 >= KEYFRAME_EVERY:
+        entry["holdings"] = dict(holdings)
+    else:
+        entry["delta"] = _delta(prev_holdings, holdings)
+    history.append(entry)
+
+    today = str(date.today())
+    if portfolio.get("history_downsampled") != today:
+        downsample(portfolio)
+        portfolio["history_downsampled"] = today
+
+# ─── DOWNSAMPLING ───────────────────────────────────────────────────────────────
+
+def downsample(portfolio, now=None):
+    """
+    Thin old history: intraday → daily after INTRADAY_DAYS, daily → weekly
+    after DAILY_DAYS. Each day's last value is kept in portfolio["daily_closes"]
+    before it is dropped, so daily closes stay exact.
+    """
+    history = portfolio.get("history", [])
+    if not history:
+        return
+    now = now or datetime.now()
+    intraday_cut = str((now - timedelta(days=INTRADAY_DAYS)).date())
+    daily_cut    = str((now - timedelta(days=DAILY_DAYS)).date())
+    if history[0]["datetime"][:10] >= intraday_cut:
+        return  # Nothing old enough yet
+
+    entries = list(expand(history))
+    closes = portfolio.setdefault("daily_closes", {})
+
+    # Last entry per day (and per ISO week) among the old entries
+    last_of_day, last_of_week = {}, {}
+    for i, e in enumerate(entries):
+        day = e["datetime"][:10]
+        last_of_day[day] = i
+        last_of_week[datetime.fromisoformat(day).isocalendar()[:2]] = i
+
+    kept = []
+    for i, e in enumerate(entries):
+        day = e["datetime"][:10]
+        if day >= intraday_cut:
+            kept.append(e)
+        elif last_of_day[day] != i:
+            continue  # Intraday entry of an old day
+        elif day >= daily_cut:
+            kept.append(e)
+        else:
+            closes[day] = e["total_value"]
+            if last_of_week[datetime.fromisoformat(day).isocalendar()[:2]] == i:
+                kept.append(e)
+
+    if len(kept) != len(entries):
+        portfolio["history"] = encode(kept)
+
+# ─── TIME-INDEXED VIEW ──────────────────────────────────────────────────────────
+
+class HistoryView:
+    """
+    Read-only, time-indexed view over a portfolio's history.
+    Lookups are binary searches over the sorted entry datetimes.
+    """
+
+    def __init__(self, portfolio):
+        self.entries = sorted(expand(portfolio.get("history", [])), key=lambda e: e["datetime"])
+        self.times = [e["datetime"] for e in self.entries]
+        self.closes = dict(portfolio.get("daily_closes", {}))
+        for e in self.entries:
+            self.closes[e["datetime"][:10]] = e["total_value"]  # Later entries overwrite → last of day
+        self.close_days = sorted(self.closes)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def last_on(self, day):
+        """Last full entry on a given date, or None."""
+        day = str(day)
+        i = bisect_left(self.times, day + "~") - 1  # '~' sorts after any time suffix
+        if i >= 0 and self.times[i][:10] == day:
+            return self.entries[i]
+        return None
+
+    def at(self, when):
+        """Latest entry at or before a datetime (or ISO string), or None."""
+        when = when.isoformat() if isinstance(when, (date, datetime)) else str(when)
+        i = bisect_right(self.times, when) - 1
+        return self.entries[i] if i >= 0 else None
+
+    def close_on(self, day):
+        """Exact daily closing total value for a date, or None."""
+        return self.closes.get(str(day))
+
+    def daily_closes(self, start=None, end=None):
+        """[(YYYY-MM-DD, total_value)] for every day with a close, oldest first."""
+        lo = bisect_left(self.close_days, str(start)) if start else 0
+        hi = bisect_right(self.close_days, str(end)) if end else len(self.close_days)
+        return [(d, self.closes[d]) for d in self.close_days[lo:hi]]
+
+    def series(self):
+        """[(datetime, total_value)] for every retained entry (equity curve)."""
+        return [(datetime.fromisoformat(e["datetime"]), e["total_value"]) for e in self.entries]
+
+    def first_held(self, ticker):
+        """Datetime of the first retained entry holding ticker, or None."""
+        for e in self.entries:
+            if ticker in e["holdings"]:
+                return datetime.fromisoformat(e["datetime"])
+        return None
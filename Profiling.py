@@ -0,0 +1,261 @@
+# Profiling.py
+import os
+import re
+import sys
+import shutil
+import runpy
+import pstats
+import cProfile
+import argparse
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+MODE        = os.environ.get("BOT_PROFILE", "").lower()  # "cprofile", "sample" or off (default)
+ENABLED     = MODE in ("cprofile", "sample")
+PROFILE_DIR = os.environ.get("BOT_PROFILE_DIR", "profiles")
+INTERVAL    = float(os.environ.get("BOT_PROFILE_INTERVAL", "0.005"))  # Seconds between samples
+KEEP_RUNS   = 50   # Run directories kept; older ones are removed when a new run starts
+TOP_N       = 25
+
+# Opt-in, no code changes needed: BOT_PROFILE=cprofile or BOT_PROFILE=sample in the
+# environment of run_bot.py, BotDaemon.py or MonitorDeferredSells.py. Wrapped scopes are
+# the run_bot job, each daemon cycle, each pipeline stage, each script run_bot starts
+# (python Profiling.py run X.py) and the monitor loop. Artifacts per run:
+#   profiles/<run id>/<scope>.prof     cProfile (pstats), the outermost active scope only:
+#                                      cProfile can't nest, the job profile covers its stages
+#   profiles/<run id>/<scope>.folded   sampling: "thread;frame;frame count" lines (flamegraph
+#                                      input) of each process's outermost scope; the scopes
+#   profiles/<run id>/scopes/<scope>.folded  nested in it (stages) get the samples taken in them
+# Reports merge the outermost profiles (nothing counted twice), or one scope with --scope.
+# The run id (BOT_RUN_ID) is inherited by child scripts, so their profiles join the run.
+
+_lock = threading.Lock()
+_run = [os.environ.get("BOT_RUN_ID")]
+_active = []       # Open scopes, outermost first: [name, profile (cProfile) or Counter (samples)]
+_sampler = [None]  # Sampling thread while any scope is open
+
+# ─── RUN ID ─────────────────────────────────────────────────────────────────────
+
+def run_id():
+    """This run's id (shared with child processes through BOT_RUN_ID)."""
+    if _run[0] is None:
+        new_run()
+    return _run[0]
+
+def new_run():
+    """Start a new run (a daemon cycle): a new artifact directory, the oldest ones pruned."""
+    _run[0] = os.environ["BOT_RUN_ID"] = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+    if ENABLED and os.path.isdir(PROFILE_DIR):
+        for old in sorted(os.listdir(PROFILE_DIR))[:-KEEP_RUNS or None]:
+            shutil.rmtree(os.path.join(PROFILE_DIR, old), ignore_errors=True)
+    return _run[0]
+
+def run_dir():
+    """Where this run's profiles go (for the run log record), or None when not profiling."""
+    return os.path.join(PROFILE_DIR, run_id()) if ENABLED else None
+
+def _artifact(name, ext, nested=False):
+    """profiles/<run id>/[scopes/]<name>.<ext>, numbered if the scope ran more than once this run."""
+    folder = os.path.join(PROFILE_DIR, run_id(), "scopes" if nested else "")
+    os.makedirs(folder, exist_ok=True)
+    base = re.sub(r"[^\w.-]+", "_", name).strip("_") or "scope"
+    path, n = os.path.join(folder, f"{base}.{ext}"), 1
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(folder, f"{base}-{n}.{ext}")
+    return path
+
+# ─── SAMPLING ───────────────────────────────────────────────────────────────────
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _sample_loop(stop):
+    me = threading.get_ident()
+    while not stop.wait(INTERVAL):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stacks.append(";".join([names.get(ident, str(ident))] + stack[::-1]))
+        with _lock:
+            for _, samples in _active:
+                samples.update(stacks)
+
+def _start_sampler():
+    stop = threading.Event()
+    thread = threading.Thread(target=_sample_loop, args=(stop,), name="profiler", daemon=True)
+    thread.start()
+    _sampler[0] = (thread, stop)
+
+def _stop_sampler():
+    thread, stop = _sampler[0]
+    stop.set()
+    thread.join()
+    _sampler[0] = None
+
+# ─── SCOPES ─────────────────────────────────────────────────────────────────────
+
+@contextmanager
+def profile(name):
+    """Profile the enclosed code as <name> if BOT_PROFILE is set; otherwise do nothing."""
+    if not ENABLED:
+        yield
+        return
+    if MODE == "cprofile":
+        if any(isinstance(p, cProfile.Profile) for _, p in _active):
+            yield  # Already inside a profiled scope
+            return
+        scope = [name, cProfile.Profile()]
+        _active.append(scope)
+        scope[1].enable()
+        try:
+            yield
+        finally:
+            scope[1].disable()
+            _active.remove(scope)
+            scope[1].dump_stats(_artifact(name, "prof"))
+        return
+
+    scope = [name, Counter()]
+    with _lock:
+        nested = bool(_active)
+        _active.append(scope)
+        if _sampler[0] is None:
+            _start_sampler()
+    try:
+        yield
+    finally:
+        with _lock:
+            _active.remove(scope)
+            last = not _active
+        if last:
+            _stop_sampler()
+        with open(_artifact(name, "folded", nested), "w") as f:
+            for stack, n in scope[1].most_common():
+                f.write(f"{stack} {n}\n")
+
+def run_script(path, args=()):
+    """Run a script as __main__ inside a profiled scope named after it."""
+    sys.argv = [path, *args]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    with profile(os.path.splitext(os.path.basename(path))[0]):
+        runpy.run_path(path, run_name="__main__")
+
+# ─── REPORT ─────────────────────────────────────────────────────────────────────
+
+def find_profiles(runs=None, scope=None, profile_dir=PROFILE_DIR):
+    """
+    Artifact paths of the last `runs` runs (all if None): the outermost profiles, or
+    every profile of one scope (outermost or nested) if scope is given.
+    """
+    if not os.path.isdir(profile_dir):
+        return []
+    run_dirs = sorted(os.listdir(profile_dir))[-runs:] if runs else sorted(os.listdir(profile_dir))
+    found = []
+    for run in run_dirs:
+        folders = [os.path.join(profile_dir, run)]
+        if scope is not None:
+            folders.append(os.path.join(profile_dir, run, "scopes"))
+        for folder in folders:
+            for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+                base, ext = os.path.splitext(name)
+                if ext in (".prof", ".folded") and (scope is None or re.sub(r"-\d+$", "", base) == scope):
+                    found.append(os.path.join(folder, name))
+    return found
+
+def merge_cprofile(paths):
+    """pstats.Stats of all .prof files together."""
+    return pstats.Stats(*paths) if paths else None
+
+def merge_folded(paths):
+    """Counter {stack: samples} of all .folded files together."""
+    stacks = Counter()
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, n = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    stacks[stack] += int(n)
+    return stacks
+
+def hot_cprofile(stats, top=TOP_N, sort="self"):
+    """[(function, self s, cumulative s, calls)] with the most time, and the profiled total."""
+    rows = [(func if file == "~" else f"{func} ({os.path.basename(file)}:{line})", tt, ct, nc)  # "~": built-ins
+            for (file, line, func), (cc, nc, tt, ct, callers) in stats.stats.items()]
+    rows.sort(key=lambda r: r[1] if sort == "self" else r[2], reverse=True)
+    return rows[:top], stats.total_tt
+
+def hot_folded(stacks, top=TOP_N, sort="self"):
+    """[(function, self samples, total samples, None)] from merged stacks, and the sample total."""
+    own, total = Counter(), Counter()
+    for stack, n in stacks.items():
+        frames = stack.split(";")[1:]  # Without the thread name
+        if frames:
+            own[frames[-1]] += n
+        for frame in set(frames):  # Once per stack, however deep the recursion
+            total[frame] += n
+    rows = [(f, own[f], total[f], None) for f in total]
+    rows.sort(key=lambda r: r[1] if sort == "self" else r[2], reverse=True)
+    return rows[:top], sum(stacks.values())
+
+def _runs(paths):
+    return len({os.path.relpath(p, PROFILE_DIR).split(os.sep)[0] for p in paths})
+
+def print_report(paths, top=TOP_N, sort="self", output=None):
+    prof = [p for p in paths if p.endswith(".prof")]
+    folded = [p for p in paths if p.endswith(".folded")]
+    if prof:
+        stats = merge_cprofile(prof)
+        rows, total = hot_cprofile(stats, top, sort)
+        print(f"🔥 cProfile: {len(prof)} profiles from {_runs(prof)} runs, {total:.2f}s profiled")
+        print(f"{'self s':>9} {'cum s':>9} {'calls':>10}  function")
+        for func, tt, ct, calls in rows:
+            print(f"{tt:>9.3f} {ct:>9.3f} {calls:>10}  {func}")
+        if output:
+            stats.dump_stats(output if output.endswith(".prof") else output + ".prof")
+    if folded:
+        stacks = merge_folded(folded)
+        rows, total = hot_folded(stacks, top, sort)
+        print(f"🔥 Sampling: {len(folded)} profiles from {_runs(folded)} runs, {total} samples "
+              f"(~{total * INTERVAL:.1f}s at {INTERVAL * 1000:g} ms)")
+        print(f"{'self %':>8} {'total %':>8}  function")
+        for func, own, incl, _ in rows:
+            print(f"{own / total:>8.1%} {incl / total:>8.1%}  {func}")
+        if output:
+            with open(output if output.endswith(".folded") else output + ".folded", "w") as f:
+                for stack, n in stacks.most_common():
+                    f.write(f"{stack} {n}\n")
+
+# ─── CLI ────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "run":
+        # python Profiling.py run Script.py [args] – how run_bot starts scripts while profiling
+        run_script(sys.argv[2], sys.argv[3:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Merge profiles written with BOT_PROFILE into a hot function report")
+    parser.add_argument("query", choices=["report", "list"])
+    parser.add_argument("--runs", type=int, help="Only the last N runs (default: all kept runs)")
+    parser.add_argument("--scope", help="Only this scope, e.g. GenerateSignals, job, Monitor")
+    parser.add_argument("-n", type=int, default=TOP_N, help="Number of functions")
+    parser.add_argument("--sort", choices=["self", "total"], default="self")
+    parser.add_argument("-o", "--output", help="Also write the merged profile here (.prof / .folded)")
+    args = parser.parse_args()
+
+    paths = find_profiles(args.runs, args.scope)
+    if not paths:
+        print(f"No profiles in {PROFILE_DIR}/ – run with BOT_PROFILE=cprofile or BOT_PROFILE=sample first")
+    elif args.query == "list":
+        for path in paths:
+            print(f"{os.path.getsize(path):>10}  {path}")
+    else:
+        print_report(paths, args.n, args.sort, args.output)
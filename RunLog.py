@@ -0,0 +1,179 @@
+# RunLog.py
+import os
+import re
+import json
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+RUN_LOG_DIR       = "run_logs"
+LEGACY_RUN_LOG    = "run_log.json"
+MAX_SEGMENT_BYTES = 1_000_000  # Start a new segment within the month past this size
+
+# Segments are run_logs/run_log-YYYY-MM.jsonl, then run_log-YYYY-MM.1.jsonl, .2 ... once
+# a month's segment is full. One run record per line, appended and never rewritten.
+SEGMENT_RE = re.compile(r"^run_log-(\d{4}-\d{2})(?:\.(\d+))?\.jsonl$")
+
+# ─── SEGMENTS ───────────────────────────────────────────────────────────────────
+
+def _segments(since_month=None):
+    """Return segment paths (oldest first), optionally only months >= since_month."""
+    if not os.path.isdir(RUN_LOG_DIR):
+        return []
+    found = []
+    for name in os.listdir(RUN_LOG_DIR):
+        m = SEGMENT_RE.match(name)
+        if m and (since_month is None or m.group(1) >= since_month):
+            found.append((m.group(1), int(m.group(2) or 0), os.path.join(RUN_LOG_DIR, name)))
+    return [path for _, _, path in sorted(found)]
+
+def _segment_for(month):
+    """Path of the segment new records for month should be appended to."""
+    index = 0
+    while True:
+        suffix = f".{index}" if index else ""
+        path = os.path.join(RUN_LOG_DIR, f"run_log-{month}{suffix}.jsonl")
+        if not os.path.exists(path) or os.path.getsize(path) < MAX_SEGMENT_BYTES:
+            return path
+        index += 1
+
+def _read_segment(path):
+    entries = []
+    with open(path, "rb") as f:
+        for line in f:
+            if line.endswith(b"\n") and line.strip():
+                entries.append(json.loads(line))
+    return entries
+
+def _entry_month(entry):
+    return str(entry.get("timestamp") or entry.get("start_time") or datetime.now().isoformat())[:7]
+
+# ─── WRITE ──────────────────────────────────────────────────────────────────────
+
+def migrate_legacy():
+    """Move an old run_log.json array into monthly segments (once)."""
+    if not os.path.exists(LEGACY_RUN_LOG) or _segments():
+        return
+    with open(LEGACY_RUN_LOG) as f:
+        logs = json.load(f)
+    os.makedirs(RUN_LOG_DIR, exist_ok=True)
+    for entry in logs:
+        _append(entry)
+    os.replace(LEGACY_RUN_LOG, LEGACY_RUN_LOG + ".migrated")
+    print(f"🗂️ Migrated {len(logs)} run log entries into {RUN_LOG_DIR}/")
+
+def _append(entry):
+    line = (json.dumps(entry, separators=(",", ":")) + "\n").encode()
+    with open(_segment_for(_entry_month(entry)), "ab") as f:
+        f.write(line)  # Single O_APPEND write: concurrent writers can't clobber each other
+        f.flush()
+        os.fsync(f.fileno())
+
+def log_run(entry):
+    """Append one run record. Cost doesn't depend on how many runs are logged."""
+    os.makedirs(RUN_LOG_DIR, exist_ok=True)
+    migrate_legacy()
+    _append(entry)
+
+# ─── QUERIES ────────────────────────────────────────────────────────────────────
+
+def _duration_seconds(entry):
+    try:
+        start = datetime.strptime(entry["start_time"], "%Y-%m-%d %H:%M:%S")
+        end = datetime.strptime(entry["end_time"], "%Y-%m-%d %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (end - start).total_seconds()
+
+def last_runs(n=10):
+    """Return the n most recent runs (newest first), reading segments from the newest back."""
+    migrate_legacy()
+    runs = []
+    for path in reversed(_segments()):
+        runs.extend(reversed(_read_segment(path)))
+        if len(runs) >= n:
+            break
+    runs.sort(key=lambda e: e.get("timestamp", ""), reverse=True)
+    return runs[:n]
+
+def runs_since(since):
+    """Return runs started at or after since (date or datetime), oldest first."""
+    migrate_legacy()
+    since = since.isoformat() if isinstance(since, (date, datetime)) else str(since)
+    runs = []
+    for path in _segments(since_month=since[:7]):
+        runs.extend(e for e in _read_segment(path) if e.get("timestamp", "") >= since)
+    return runs
+
+def failures_since(since):
+    return [e for e in runs_since(since) if not e.get("success", True)]
+
+def failures_this_week():
+    today = date.today()
+    return failures_since(today - timedelta(days=today.weekday()))
+
+def average_duration(since=None):
+    """Average run duration in seconds per initiating script: {initiator: seconds}."""
+    runs = runs_since(since) if since is not None else runs_since("0000")
+    totals = defaultdict(lambda: [0.0, 0])
+    for entry in runs:
+        seconds = _duration_seconds(entry)
+        if seconds is not None:
+            totals[entry.get("initiator", "unknown")][0] += seconds
+            totals[entry.get("initiator", "unknown")][1] += 1
+    return {script: round(total / count, 1) for script, (total, count) in totals.items()}
+
+def stage_cache_stats(since=None):
+    """Pipeline stage cache hits and misses per stage: {stage: {"hit": n, "miss": n}}."""
+    runs = runs_since(since) if since is not None else runs_since("0000")
+    stats = defaultdict(lambda: {"hit": 0, "miss": 0})
+    for entry in runs:
+        for record in entry.get("stage_cache", []):
+            stats[record["stage"]]["hit" if record["hit"] else "miss"] += 1
+    return dict(stats)
+
+def stage_timings(since=None):
+    """Average wall/CPU seconds and worst peak RSS per instrumented stage (runs with "metrics")."""
+    runs = runs_since(since) if since is not None else runs_since("0000")
+    totals = defaultdict(lambda: {"runs": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None})
+    for entry in runs:
+        for record in (entry.get("metrics") or {}).get("stages", []):
+            t = totals[record["stage"]]
+            t["runs"] += 1
+            t["wall_s"] += record["wall_s"]
+            t["cpu_s"] += record["cpu_s"]
+            if record.get("peak_rss_mb") is not None:
+                t["peak_rss_mb"] = max(t["peak_rss_mb"] or 0, record["peak_rss_mb"])
+    return {stage: {**t, "wall_s": round(t["wall_s"] / t["runs"], 3), "cpu_s": round(t["cpu_s"] / t["runs"], 3)}
+            for stage, t in totals.items()}
+
+# ─── CLI ────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the bot run log")
+    parser.add_argument("query", choices=["last", "failures", "durations", "cache", "stages"])
+    parser.add_argument("-n", type=int, default=10, help="Number of runs for 'last'")
+    parser.add_argument("--since", help="ISO date for 'durations'/'cache'/'stages' (default: all time)")
+    args = parser.parse_args()
+
+    if args.query == "last":
+        for run in last_runs(args.n):
+            status = "✅" if run.get("success") else "❌"
+            print(f"{status} {run.get('start_time')} → {run.get('end_time')}  {run.get('initiator')}  "
+                  f"{', '.join(run.get('scripts_run', []))}")
+    elif args.query == "failures":
+        failures = failures_this_week()
+        print(f"❌ {len(failures)} failed runs this week")
+        for run in failures:
+            print(f"  {run.get('start_time')}  {run.get('initiator')}: {run.get('error_message')}")
+    elif args.query == "cache":
+        for stage, counts in sorted(stage_cache_stats(args.since).items()):
+            total = counts["hit"] + counts["miss"]
+            print(f"{stage:<18} {counts['hit']:>5} hits / {total:>5} runs ({counts['hit'] / total:.0%})")
+    elif args.query == "stages":
+        for stage, t in sorted(stage_timings(args.since).items()):
+            print(f"{stage:<32} {t['wall_s']:>8.2f}s wall {t['cpu_s']:>8.2f}s CPU  "
+                  f"peak {t['peak_rss_mb']} MB  ({t['runs']} runs)")
+    else:
+        for script, seconds in sorted(average_duration(args.since).items()):
+            print(f"{script:<28} {seconds:>8.1f}s")
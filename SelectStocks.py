@@ -1,87 +1,91 @@
 # SelectStocks.py
 
 #import yfinance as yf # One Cached Call in DataManager (reduce requests)
-from DataManager import load_cached_prices, get_current_price
-import pandas as pd
+from DataManager import load_cached_prices, load_universe
 import json
-from datetime import datetime, timedelta, date
+from datetime import datetime, date
 
 # ─── 1) YOUR UNIVERSE ───────────────────────────────────────────────────────────
 
-with open("ftse100_stocks.json", "r", encoding="utf-8") as f:
-    ftse100 = json.load(f)
-
-TICKERS = list({
-    f"{stock['code'].rstrip('.').replace('.', '-')}.L"
-    for stock in ftse100
-    if stock.get("code")
-})
-
-#sp500 = pd.read_csv("sp500_constituents.csv")  
+#sp500 = pd.read_csv("sp500_constituents.csv")
 #TICKERS = sp500["Symbol"].dropna().unique().tolist()
 
 LOOKBACK_DAYS = 30
 TOP_N = 100
 OUTPUT_JSON = "daily_screen.json"
-
-# ─── 2) LOAD CURRENT HOLDINGS ───────────────────────────────────────────────────
-try:
-    with open("portfolio_summary.json") as f:
-        holdings = set(json.load(f).get("holdings", {}).keys())
-except FileNotFoundError:
-    holdings = set()
-
-# ─── 3) DOWNLOAD HISTORICAL DATA ────────────────────────────────────────────────
-price_cache = load_cached_prices(data_type="daily") # From DataManager
-
-# ─── 4) COMPUTE MOMENTUM ────────────────────────────────────────────────────────
-momentum = {}
-skipped = []
-
-for t in TICKERS:
-    # pull the list of daily closes from our JSON cache
-    closes = price_cache.get(t, {}).get("close", [])
-    # need at least LOOKBACK_DAYS+1 closes to compute momentum
-    if len(closes) < LOOKBACK_DAYS + 1:
-        skipped.append((t, "not enough history"))
-        continue
-
-    # oldest reference price is LOOKBACK_DAYS+1 ago
-    ref_price   = closes[-(LOOKBACK_DAYS + 1)]
-    final_price = closes[-1]
-    mom_pct     = (final_price / ref_price - 1) * 100
-
-    momentum[t] = {
-        "momentum_pct": round(mom_pct, 2),
-        "window_used": f"{LOOKBACK_DAYS} trading days"
+LAST_RUN_FILE = "selectstocks_last_run.txt"
+
+def load_holdings():
+    try:
+        with open("portfolio_summary.json") as f:
+            return set(json.load(f).get("holdings", {}).keys())
+    except FileNotFoundError:
+        return set()
+
+def select_stocks(price_cache, holdings, tickers):
+    """
+    Rank tickers by LOOKBACK_DAYS momentum and decide buy/sell candidates.
+    price_cache: daily cache {ticker: {"close": [...], ...}}, holdings: set of held tickers.
+    Returns the daily screen dict (same shape as daily_screen.json).
+    """
+    # ─── 2) COMPUTE MOMENTUM ────────────────────────────────────────────────────
+    momentum = {}
+    skipped = []
+
+    for t in tickers:
+        # pull the list of daily closes from our JSON cache
+        closes = price_cache.get(t, {}).get("close", [])
+        # need at least LOOKBACK_DAYS+1 closes to compute momentum
+        if len(closes) < LOOKBACK_DAYS + 1:
+            skipped.append((t, "not enough history"))
+            continue
+
+        # oldest reference price is LOOKBACK_DAYS+1 ago
+        ref_price   = closes[-(LOOKBACK_DAYS + 1)]
+        final_price = closes[-1]
+        mom_pct     = (final_price / ref_price - 1) * 100
+
+        momentum[t] = {
+            "momentum_pct": round(mom_pct, 2),
+            "window_used": f"{LOOKBACK_DAYS} trading days"
+        }
+
+    # ─── 3) RANK AND PICK TOP N ─────────────────────────────────────────────────
+    ranked = sorted(momentum.items(), key=lambda x: x[1]["momentum_pct"], reverse=True)
+    top100 = [ticker for ticker, _ in ranked[:TOP_N]]
+
+    # ─── 4) DECIDE BUY / SELL ───────────────────────────────────────────────────
+    to_buy = [t for t in top100 if t not in holdings and momentum[t]["momentum_pct"] > 0]
+    to_sell = [
+        t for t in holdings
+        if (t not in top100) or (momentum.get(t, {"momentum_pct": 0})["momentum_pct"] < 0)
+    ]
+
+    return {
+        "date": datetime.today().strftime("%Y-%m-%d"),
+        "top_100": ranked[:TOP_N],
+        "to_buy": to_buy,
+        "to_sell": to_sell,
+        "momentum": {t: momentum[t]["momentum_pct"] for t in top100},
+        "skipped": skipped
     }
 
-# ─── 5) RANK AND PICK TOP N ─────────────────────────────────────────────────────
-ranked = sorted(momentum.items(), key=lambda x: x[1]["momentum_pct"], reverse=True)
-top100 = [ticker for ticker, _ in ranked[:TOP_N]]
-
-# ─── 6) DECIDE BUY / SELL ───────────────────────────────────────────────────────
-to_buy = [t for t in top100 if t not in holdings and momentum[t]["momentum_pct"] > 0]
-to_sell = [
-    t for t in holdings
-    if (t not in top100) or (momentum.get(t, {"momentum_pct": 0})["momentum_pct"] < 0)
-]
-
-# ─── 7) SAVE DAILY SCREEN ──────────────────────────────────────────────────────
-out = {
-    "date": datetime.today().strftime("%Y-%m-%d"),
-    "top_100": ranked[:TOP_N],
-    "to_buy": to_buy,
-    "to_sell": to_sell,
-    "momentum": {t: momentum[t]["momentum_pct"] for t in top100},
-    "skipped": skipped
-}
-
-with open(OUTPUT_JSON, "w") as f:
-    json.dump(out, f, indent=2)
-
-print(f"Screened {len(TICKERS)} tickers → buy {len(to_buy)}, sell {len(to_sell)}.")
-
-# Save today's date so we know when this was last run
-with open("selectstocks_last_run.txt", "w") as f:
-    f.write(str(date.today()))
+def save_screen(screen):
+    """Write daily_screen.json and record today's run date."""
+    with open(OUTPUT_JSON, "w") as f:
+        json.dump(screen, f, indent=2)
+
+    # Save today's date so we know when this was last run
+    with open(LAST_RUN_FILE, "w") as f:
+        f.write(str(date.today()))
+
+def main():
+    tickers = load_universe()
+    screen = select_stocks(load_cached_prices(data_type="daily"), load_holdings(), tickers)
+    save_screen(screen)
+    print(f"Screened {len(tickers)} tickers → buy {len(screen['to_buy'])}, sell {len(screen['to_sell'])}.")
+    return screen
+
+# ─── 5) RUN FUNCTION  ────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    main()
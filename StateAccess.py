@@ -0,0 +1,112 @@
+# StateAccess.py
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+import portalocker  # Same locking library as monitor.lock in MonitorDeferredSells.py
+from Instrumentation import count
+
+# Shared access to the JSON state files (portfolio_summary.json, deferred_sells.json, ...)
+# for every bot process:
+#  - readers take a shared lock, writers an exclusive one, on a sidecar <file>.lock,
+#    so a read never sees a half-written file and waits milliseconds, not retry sleeps;
+#  - writes go to a temp file that replaces the original (crash-safe);
+#  - a file's version is the hash of its contents. write_json(expected_version=...)
+#    refuses to overwrite a file someone else changed since it was read
+#    (VersionConflict), and update_json() does read-modify-write under one lock.
+
+LOCK_TIMEOUT = 30     # Seconds to wait for a lock before giving up
+LOCK_POLL    = 0.005  # Seconds between attempts while another process holds it
+
+class VersionConflict(Exception):
+    """The file changed between read_versioned() and write_json()."""
+
+_held = threading.local()  # {lock path: exclusive?} of the locks this thread holds
+
+@contextmanager
+def locked(path, exclusive=False):
+    """
+    Hold a shared (readers) or exclusive (writer) lock on path's sidecar lock file.
+    Re-entrant within a thread: a read inside an update_json() callback reuses the
+    lock already held instead of waiting LOCK_TIMEOUT on itself.
+    """
+    lock_path = os.path.abspath(path + ".lock")
+    held = _held.__dict__.setdefault("locks", {})
+    if lock_path in held:
+        if exclusive and not held[lock_path]:
+            raise RuntimeError(f"{path}: can't take the exclusive lock while holding the shared one")
+        yield
+        return
+    flags = (portalocker.LOCK_EX if exclusive else portalocker.LOCK_SH) | portalocker.LOCK_NB
+    with portalocker.Lock(lock_path, mode="a", flags=flags, timeout=LOCK_TIMEOUT, check_interval=LOCK_POLL):
+        held[lock_path] = exclusive
+        try:
+            yield
+        finally:
+            del held[lock_path]
+
+def _version(raw):
+    return hashlib.sha1(raw).hexdigest() if raw is not None else None
+
+def _read_raw(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        raw = f.read()
+    count("bytes.read", len(raw))
+    return raw
+
+def _write_raw(data, path, indent=2):
+    dir_name = os.path.dirname(os.path.abspath(path)) or "."
+    raw = json.dumps(data, indent=indent).encode()
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=dir_name, suffix=".tmp") as tmp:
+        tmp.write(raw)
+        tempname = tmp.name
+    os.replace(tempname, path)
+    count("bytes.written", len(raw))
+    return _version(raw)
+
+# ─── READ ───────────────────────────────────────────────────────────────────────
+
+def read_versioned(path, default=None):
+    """Return (data, version). A missing file gives (default, None)."""
+    with locked(path):
+        raw = _read_raw(path)
+    if raw is None:
+        return default, None
+    return json.loads(raw), _version(raw)
+
+def read_json(path, default=None):
+    return read_versioned(path, default)[0]
+
+def version_of(path):
+    with locked(path):
+        return _version(_read_raw(path))
+
+# ─── WRITE ──────────────────────────────────────────────────────────────────────
+
+ANY = object()  # expected_version that skips the check
+
+def write_json(path, data, expected_version=ANY, indent=2):
+    """
+    Atomically replace path with data and return the new version. With
+    expected_version, raise VersionConflict if the file isn't at that version.
+    """
+    with locked(path, exclusive=True):
+        if expected_version is not ANY and _version(_read_raw(path)) != expected_version:
+            raise VersionConflict(path)
+        return _write_raw(data, path, indent)
+
+def update_json(path, update, default=None, indent=2):
+    """
+    Read-modify-write under one exclusive lock: update(current) returns the new
+    data (current is default if the file doesn't exist). Returns the new data.
+    """
+    with locked(path, exclusive=True):
+        raw = _read_raw(path)
+        current = json.loads(raw) if raw is not None else default
+        new = update(current)
+        _write_raw(new, path, indent)
+        return new
@@ -0,0 +1,303 @@
+# StateStore.py
+import json
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from datetime import date, datetime
+import TradeJournal
+from PortfolioHistory import expand
+from StateAccess import read_json, write_json  # Locked, atomic JSON state files
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+DB_FILE             = "bot_state.db"
+PORTFOLIO_FILE      = "portfolio_summary.json"
+DEFERRED_SELLS_FILE = "deferred_sells.json"
+INITIAL_CASH        = 10_000
+BUSY_TIMEOUT_MS     = 30_000  # How long a writer waits for another writer's transaction
+
+# An optional SQLite mirror of the bot state, not the state of record: ExecuteTrades and
+# MonitorDeferredSells read and write portfolio_summary.json, deferred_sells.json (through
+# StateAccess.py's locks and version checks) and the append-only trade journal. Use
+# `import` to load those into bot_state.db for querying, `export` to write it back.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker  TEXT NOT NULL,
+    action  TEXT NOT NULL CHECK (action IN ('BUY', 'SELL')),
+    trigger TEXT,
+    date    TEXT NOT NULL,
+    price   REAL NOT NULL,
+    shares  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trades_date   ON trades (date);
+CREATE INDEX IF NOT EXISTS idx_trades_ticker ON trades (ticker);
+
+CREATE TABLE IF NOT EXISTS holdings (
+    ticker TEXT PRIMARY KEY,
+    shares REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cash (
+    id      INTEGER PRIMARY KEY CHECK (id = 1),
+    amount  REAL NOT NULL,
+    updated TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    datetime    TEXT NOT NULL,
+    cash        REAL NOT NULL,
+    total_value REAL NOT NULL,
+    holdings    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_datetime ON snapshots (datetime);
+
+CREATE TABLE IF NOT EXISTS deferred_sells (
+    ticker       TEXT PRIMARY KEY,
+    latest_price REAL,
+    momentum     REAL,
+    date_flagged TEXT NOT NULL
+);
+"""
+
+# ─── CONNECTION ─────────────────────────────────────────────────────────────────
+
+def connect(path=DB_FILE):
+    """
+    Open the state database in WAL mode (readers never block the writer).
+    Autocommit is used outside of explicit transaction() blocks.
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, avoids an fsync per commit
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.executescript(SCHEMA)
+    conn.execute(
+        "INSERT OR IGNORE INTO cash (id, amount, updated) VALUES (1, ?, ?)",
+        (INITIAL_CASH, datetime.now().isoformat())
+    )
+    return conn
+
+@contextmanager
+def transaction(conn):
+    """
+    Run a block as one write transaction.
+    BEGIN IMMEDIATE takes the write lock up front, so two processes can never
+    read the same cash balance and both write it back (no lost updates).
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+# ─── READS ──────────────────────────────────────────────────────────────────────
+
+def get_cash(conn):
+    return conn.execute("SELECT amount FROM cash WHERE id = 1").fetchone()["amount"]
+
+def get_holdings(conn):
+    return {row["ticker"]: row["shares"] for row in conn.execute("SELECT ticker, shares FROM holdings")}
+
+def get_trades(conn, since_id=0, ticker=None):
+    """Return trades (as trades_log.json style dicts) with id > since_id."""
+    query = "SELECT id, ticker, action, trigger, date, price, shares FROM trades WHERE id > ?"
+    params = [since_id]
+    if ticker is not None:
+        query += " AND ticker = ?"
+        params.append(ticker)
+    return [dict(row) for row in conn.execute(query + " ORDER BY id", params)]
+
+def get_trades_on(conn, day=None):
+    """Return trades made on a given day (defaults to today), using the date index."""
+    day = str(day or date.today())
+    rows = conn.execute(
+        "SELECT id, ticker, action, trigger, date, price, shares FROM trades "
+        "WHERE date >= ? AND date < ? ORDER BY id",
+        (day, day + "~")  # '~' sorts after any ISO time suffix
+    )
+    return [dict(row) for row in rows]
+
+def get_snapshots(conn, since=None):
+    query = "SELECT datetime, cash, total_value, holdings FROM snapshots"
+    params = []
+    if since is not None:
+        query += " WHERE datetime >= ?"
+        params.append(str(since))
+    return [
+        {**dict(row), "holdings": json.loads(row["holdings"])}
+        for row in conn.execute(query + " ORDER BY id", params)
+    ]
+
+def get_deferred(conn):
+    return {
+        row["ticker"]: {
+            "latest_price": row["latest_price"],
+            "momentum":     row["momentum"],
+            "date_flagged": row["date_flagged"]
+        }
+        for row in conn.execute("SELECT * FROM deferred_sells")
+    }
+
+def load_portfolio(conn):
+    """Return the portfolio in the same shape as portfolio_summary.json."""
+    return {
+        "date":     conn.execute("SELECT updated FROM cash WHERE id = 1").fetchone()["updated"],
+        "cash":     round(get_cash(conn), 2),
+        "holdings": get_holdings(conn),
+        "history":  get_snapshots(conn)
+    }
+
+# ─── TRANSACTIONAL TRADES ───────────────────────────────────────────────────────
+
+def _set_cash(conn, amount):
+    conn.execute("UPDATE cash SET amount = ?, updated = ? WHERE id = 1", (amount, datetime.now().isoformat()))
+
+def _insert_trade(conn, ticker, action, trigger, price, shares, when):
+    cur = conn.execute(
+        "INSERT INTO trades (ticker, action, trigger, date, price, shares) VALUES (?, ?, ?, ?, ?, ?)",
+        (ticker, action, trigger, when, price, shares)
+    )
+    return {
+        "ticker": ticker,
+        "action": action,
+        "trigger": trigger,
+        "date": when,
+        "price": price,
+        "shares": shares,
+        "id": cur.lastrowid
+    }
+
+def buy(conn, ticker, shares, price, trigger="unspecified", when=None):
+    """
+    Buy shares of ticker: debit cash, add to holdings and append the trade,
+    all in one transaction. Raises ValueError if cash is insufficient.
+    """
+    when = when or datetime.now().isoformat()
+    with transaction(conn):
+        cash = get_cash(conn)
+        cost = shares * price
+        if shares <= 0 or cost > cash + 1e-9:
+            raise ValueError(f"Cannot buy {shares} of {ticker} @ {price:.2f} with cash {cash:.2f}")
+        _set_cash(conn, cash - cost)
+        conn.execute(
+            "INSERT INTO holdings (ticker, shares) VALUES (?, ?) "
+            "ON CONFLICT(ticker) DO UPDATE SET shares = ROUND(shares + excluded.shares, 3)",
+            (ticker, round(shares, 3))
+        )
+        return _insert_trade(conn, ticker, "BUY", trigger, price, shares, when)
+
+def sell(conn, ticker, price, trigger="unspecified", shares=None, when=None):
+    """
+    Sell shares of ticker (all held shares if shares is None): credit cash,
+    reduce holdings, drop any deferred entry and append the trade in one transaction.
+    Returns the trade, or None if the ticker isn't held. Raises ValueError if shares <= 0.
+    """
+    if shares is not None and shares <= 0:
+        raise ValueError(f"Cannot sell {shares} of {ticker}")
+    when = when or datetime.now().isoformat()
+    with transaction(conn):
+        row = conn.execute("SELECT shares FROM holdings WHERE ticker = ?", (ticker,)).fetchone()
+        if row is None or row["shares"] <= 0:
+            return None
+        held = row["shares"]
+        shares = held if shares is None else min(shares, held)
+        remaining = round(held - shares, 3)
+        if remaining > 0:
+            conn.execute("UPDATE holdings SET shares = ? WHERE ticker = ?", (remaining, ticker))
+        else:
+            conn.execute("DELETE FROM holdings WHERE ticker = ?", (ticker,))
+            conn.execute("DELETE FROM deferred_sells WHERE ticker = ?", (ticker,))
+        _set_cash(conn, get_cash(conn) + shares * price)
+        return _insert_trade(conn, ticker, "SELL", trigger, price, shares, when)
+
+def add_snapshot(conn, total_value, when=None):
+    """Record a portfolio history snapshot from the current cash and holdings."""
+    when = when or datetime.now().isoformat()
+    with transaction(conn):
+        cash = get_cash(conn)
+        conn.execute(
+            "INSERT INTO snapshots (datetime, cash, total_value, holdings) VALUES (?, ?, ?, ?)",
+            (when, round(cash, 2), round(total_value, 2), json.dumps(get_holdings(conn)))
+        )
+
+def set_deferred(conn, ticker, latest_price, momentum, date_flagged=None):
+    conn.execute(
+        "INSERT OR REPLACE INTO deferred_sells (ticker, latest_price, momentum, date_flagged) VALUES (?, ?, ?, ?)",
+        (ticker, latest_price, momentum, str(date_flagged or date.today()))
+    )
+
+def remove_deferred(conn, ticker):
+    conn.execute("DELETE FROM deferred_sells WHERE ticker = ?", (ticker,))
+
+# ─── JSON IMPORT / EXPORT ───────────────────────────────────────────────────────
+
+def import_json(conn, portfolio_file=PORTFOLIO_FILE, deferred_file=DEFERRED_SELLS_FILE):
+    """Replace the store contents with the existing JSON state files and trade journal."""
+    portfolio = read_json(portfolio_file, {"cash": INITIAL_CASH, "holdings": {}, "history": []})
+    trades    = TradeJournal.load_trades()
+    deferred  = read_json(deferred_file, {})
+
+    with transaction(conn):
+        for table in ("trades", "holdings", "snapshots", "deferred_sells"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            "UPDATE cash SET amount = ?, updated = ? WHERE id = 1",
+            (portfolio.get("cash", INITIAL_CASH), portfolio.get("date") or datetime.now().isoformat())
+        )
+        conn.executemany(
+            "INSERT INTO holdings (ticker, shares) VALUES (?, ?)",
+            list(portfolio.get("holdings", {}).items())
+        )
+        conn.executemany(
+            "INSERT INTO trades (ticker, action, trigger, date, price, shares) VALUES (?, ?, ?, ?, ?, ?)",
+            [(t["ticker"], t["action"], t.get("trigger", "unspecified"), t["date"], t["price"], t["shares"])
+             for t in trades]
+        )
+        conn.executemany(
+            "INSERT INTO snapshots (datetime, cash, total_value, holdings) VALUES (?, ?, ?, ?)",
+            [(h["datetime"], h.get("cash", 0), h.get("total_value", 0), json.dumps(h.get("holdings", {})))
+             for h in expand(portfolio.get("history", []))]
+        )
+        conn.executemany(
+            "INSERT INTO deferred_sells (ticker, latest_price, momentum, date_flagged) VALUES (?, ?, ?, ?)",
+            [(t, d.get("latest_price"), d.get("momentum"), d.get("date_flagged", str(date.today())))
+             for t, d in deferred.items()]
+        )
+    print(f"📥 Imported {len(trades)} trades, {len(portfolio.get('holdings', {}))} holdings "
+          f"and {len(portfolio.get('history', []))} snapshots into {DB_FILE}")
+
+def export_json(conn, portfolio_file=PORTFOLIO_FILE, deferred_file=DEFERRED_SELLS_FILE):
+    """Write the store back out as the JSON files and trade journal the other scripts read."""
+    trades = [{k: v for k, v in t.items() if k != "id"} for t in get_trades(conn)]
+    TradeJournal.replace_all(trades)
+    for path, data in (
+        (portfolio_file, load_portfolio(conn)),
+        (deferred_file, get_deferred(conn)),
+    ):
+        write_json(path, data)  # Locked atomic replace: readers never see a half-written file
+    print(f"📤 Exported {len(trades)} trades to {TradeJournal.JOURNAL_FILE}, {portfolio_file} and {deferred_file}")
+
+# ─── CLI ────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite portfolio and trade store")
+    parser.add_argument("command", choices=["import", "export", "show"])
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+
+    connection = connect(args.db)
+    if args.command == "import":
+        import_json(connection)
+    elif args.command == "export":
+        export_json(connection)
+    else:
+        print(f"Cash: ${get_cash(connection):.2f}")
+        for tkr, qty in get_holdings(connection).items():
+            print(f" • {tkr}: {qty} shares")
+        print(f"Trades: {connection.execute('SELECT COUNT(*) FROM trades').fetchone()[0]}")
+    connection.close()
@@ -59,7 +59,12 @@ try:
                 cols = r.find_elements(By.TAG_NAME, "td")
                 code = cols[0].text.strip()
                 name = cols[1].text.strip()
-                all_stocks.append({"name": name, "code": code})
+                # Market cap (£m) column, used to cap-weight the index proxy in IndexBenchmark.py
+                try:
+                    market_cap = float(cols[3].text.replace(",", "").strip())
+                except (IndexError, ValueError):
+                    market_cap = None
+                all_stocks.append({"name": name, "code": code, "market_cap": market_cap})
             except Exception as e:
                 print("Error reading row:", e)
 
@@ -0,0 +1,229 @@
+# TradeJournal.py
+import os
+import json
+import hashlib
+import tempfile
+from datetime import date, datetime
+from Instrumentation import count
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────
+JOURNAL_FILE        = "trades_log.jsonl"    # Append-only, one trade per line
+SNAPSHOT_FILE       = "trades_snapshot.json"  # Compacted state + offset index
+LEGACY_LOG          = "trades_log.json"     # Old whole-array log (migrated once)
+SNAPSHOT_TAIL_BYTES = 64 * 1024             # Compact once the un-snapshotted tail grows past this
+MARK_CHECK_BYTES    = 256                   # Bytes before a reader's offset that must be unchanged to trust it
+
+# The snapshot holds everything up to "offset" (bytes into the journal):
+#  - count:       number of trades before offset
+#  - day_offsets: {YYYY-MM-DD: byte offset of that day's first trade}
+#  - positions:   {ticker: {"shares": net shares, "cost": buy cost - sell proceeds}}
+EMPTY_SNAPSHOT = {"offset": 0, "count": 0, "day_offsets": {}, "positions": {}}
+
+# ─── HELPERS ────────────────────────────────────────────────────────────────────
+
+def _atomic_write_json(data, filepath):
+    dir_name = os.path.dirname(os.path.abspath(filepath)) or "."
+    with tempfile.NamedTemporaryFile('w', delete=False, dir=dir_name, suffix=".tmp") as tmp:
+        json.dump(data, tmp, indent=2)
+        tempname = tmp.name
+    os.replace(tempname, filepath)
+
+def _trade_day(trade):
+    return str(trade.get("date", ""))[:10]
+
+def _read_from(offset, path=JOURNAL_FILE):
+    """
+    Yield (line_offset, next_offset, trade) for every complete line from offset onwards.
+    A trailing line without a newline is a write still in progress and is ignored.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pos = offset
+        try:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                end = pos + len(line)
+                if line.strip():
+                    yield pos, end, json.loads(line)
+                pos = end
+        finally:
+            count("bytes.read", pos - offset)
+
+def _apply_positions(positions, trade):
+    pos = positions.setdefault(trade["ticker"], {"shares": 0.0, "cost": 0.0})
+    value = trade["shares"] * trade["price"]
+    if trade["action"] == "BUY":
+        pos["shares"] += trade["shares"]
+        pos["cost"]   += value
+    elif trade["action"] == "SELL":
+        pos["shares"] -= trade["shares"]
+        pos["cost"]   -= value
+
+# ─── MIGRATION ──────────────────────────────────────────────────────────────────
+
+def migrate_legacy(legacy_file=LEGACY_LOG, path=JOURNAL_FILE):
+    """Convert the old trades_log.json array into the journal (once)."""
+    if os.path.exists(path) or not os.path.exists(legacy_file):
+        return
+    with open(legacy_file) as f:
+        trades = json.load(f)
+    trades.sort(key=lambda t: str(t.get("date", "")))  # Journal must be in date order for the day index
+    _write_lines(trades, path, mode="wb")
+    compact(path)
+    print(f"📒 Migrated {len(trades)} trades from {legacy_file} to {path}")
+
+# ─── WRITE ──────────────────────────────────────────────────────────────────────
+
+def _write_lines(trades, path, mode="ab"):
+    payload = b"".join(json.dumps(t, separators=(",", ":")).encode() + b"\n" for t in trades)
+    with open(path, mode) as f:
+        f.write(payload)  # One write per batch, so concurrent appenders never interleave lines
+        f.flush()
+        os.fsync(f.fileno())
+    count("bytes.written", len(payload))
+
+def append_trades(trades, path=JOURNAL_FILE):
+    """Durably append trades to the journal. Cost is independent of journal length."""
+    if not trades:
+        return
+    migrate_legacy(path=path)
+    _write_lines(trades, path)
+
+    snapshot = load_snapshot()
+    if os.path.getsize(path) - snapshot["offset"] > SNAPSHOT_TAIL_BYTES:
+        compact(path, snapshot)
+
+def append_trade(trade, path=JOURNAL_FILE):
+    append_trades([trade], path)
+
+def replace_all(trades, path=JOURNAL_FILE):
+    """Rewrite the whole journal (used by imports/repairs only) and rebuild the snapshot."""
+    _write_lines(trades, path, mode="wb")
+    if os.path.exists(SNAPSHOT_FILE):
+        os.remove(SNAPSHOT_FILE)
+    compact(path)
+
+# ─── SNAPSHOT ───────────────────────────────────────────────────────────────────
+
+def load_snapshot():
+    if not os.path.exists(SNAPSHOT_FILE):
+        return json.loads(json.dumps(EMPTY_SNAPSHOT))
+    try:
+        with open(SNAPSHOT_FILE) as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return json.loads(json.dumps(EMPTY_SNAPSHOT))  # Rebuilt from the journal on next compact
+
+def compact(path=JOURNAL_FILE, snapshot=None):
+    """Fold the journal tail into the snapshot so readers only need to scan new trades."""
+    snapshot = snapshot or load_snapshot()
+    for pos, end, trade in _read_from(snapshot["offset"], path):
+        day = _trade_day(trade)
+        if day and day not in snapshot["day_offsets"]:
+            snapshot["day_offsets"][day] = pos
+        _apply_positions(snapshot["positions"], trade)
+        snapshot["count"] += 1
+        snapshot["offset"] = end
+
+    # Avoid float drift leaving closed positions as 1e-12 shares
+    snapshot["positions"] = {
+        t: {"shares": round(p["shares"], 6), "cost": round(p["cost"], 6)}
+        for t, p in snapshot["positions"].items()
+    }
+    snapshot["compacted_at"] = datetime.now().isoformat()
+    _atomic_write_json(snapshot, SNAPSHOT_FILE)
+    return snapshot
+
+# ─── READ ───────────────────────────────────────────────────────────────────────
+
+def load_trades(path=JOURNAL_FILE):
+    """Return the full trade history (oldest first)."""
+    migrate_legacy(path=path)
+    return [trade for _, _, trade in _read_from(0, path)]
+
+def read_since(offset, path=JOURNAL_FILE):
+    """Return (trades appended after byte offset, new offset) for incremental readers."""
+    migrate_legacy(path=path)
+    trades = []
+    end = offset
+    for _, end, trade in _read_from(offset, path):
+        trades.append(trade)
+    return trades, end
+
+# Incremental readers (TradeSummary aggregates, LotLedger) persist the offset they have
+# read up to plus journal_mark(offset); if mark_matches() fails the journal was rewritten
+# (replace_all) and they rebuild from offset 0.
+def journal_mark(offset, path=JOURNAL_FILE):
+    """Hash of the MARK_CHECK_BYTES before offset (None at offset 0)."""
+    if not offset:
+        return None
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - MARK_CHECK_BYTES))
+        return hashlib.sha1(f.read(min(offset, MARK_CHECK_BYTES))).hexdigest()
+
+def mark_matches(offset, mark, path=JOURNAL_FILE):
+    if not offset:
+        return True
+    if not os.path.exists(path) or os.path.getsize(path) < offset:
+        return False
+    return journal_mark(offset, path) == mark
+
+def prefix_hash(offset, path=JOURNAL_FILE, chunk=1 << 20):
+    """SHA-1 of the journal's first offset bytes (None at offset 0)."""
+    if not offset:
+        return None
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        remaining = offset
+        while remaining:
+            data = f.read(min(chunk, remaining))
+            if not data:
+                return None  # Journal is shorter than offset
+            h.update(data)
+            remaining -= len(data)
+    return h.hexdigest()
+
+def trades_on(day=None, path=JOURNAL_FILE):
+    """Return trades made on day (default today) without scanning earlier history."""
+    migrate_legacy(path=path)
+    day = str(day or date.today())
+    snapshot = load_snapshot()
+    start = snapshot["day_offsets"].get(day, snapshot["offset"])
+    trades = []
+    for _, _, trade in _read_from(start, path):
+        trade_day = _trade_day(trade)
+        if trade_day == day:
+            trades.append(trade)
+        elif trade_day > day:
+            break
+    return trades
+
+def todays_trades(path=JOURNAL_FILE):
+    return trades_on(date.today(), path)
+
+def load_state(path=JOURNAL_FILE):
+    """Return net positions {ticker: {"shares", "cost"}} as of last snapshot + tail."""
+    migrate_legacy(path=path)
+    snapshot = load_snapshot()
+    positions = {t: dict(p) for t, p in snapshot["positions"].items()}
+    for _, _, trade in _read_from(snapshot["offset"], path):
+        _apply_positions(positions, trade)
+    return positions
+
+def cost_basis_map(path=JOURNAL_FILE):
+    """Average cost basis (net cost / net shares) for every ticker still held."""
+    return {
+        t: p["cost"] / p["shares"]
+        for t, p in load_state(path).items()
+        if p["shares"] > 1e-9
+    }
+
+# ─── CLI ────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    migrate_legacy()
+    snap = compact()
+    print(f"📒 Journal {JOURNAL_FILE}: {snap['count']} trades, "
+          f"{len(snap['day_offsets'])} trading days, {len(snap['positions'])} tickers")
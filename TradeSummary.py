@@ -1,188 +1,263 @@
-# summarize_trades.py
+# TradeSummary.py
 
 import json
 from datetime import date, datetime, timedelta
-import pandas as pd
 #import yfinance as yf
 from DataManager import load_cached_prices, get_current_price
-import matplotlib.pyplot as plt
+from TradeJournal import read_since, journal_mark, mark_matches, JOURNAL_FILE
+from PortfolioHistory import HistoryView
+from StateAccess import read_json, write_json
+#import matplotlib.pyplot as plt # Only needed for the plot below
 import time
 
-LOG_FILE        = "trades_log.json"
 PORTFOLIO_FILE  = "portfolio_summary.json"
 OUTPUT_FILE     = "trade_summary.json"
+AGGREGATES_FILE = "trade_aggregates.json"
 
-# ─── 1) LOAD DATA ────────────────────────────────────────────────────────────────
-with open(LOG_FILE) as f:
-    trades = json.load(f)
+# Running aggregates of the trade journal (trade_aggregates.json), up to "offset" (bytes):
+#  - count / buys / sells, last_buy / last_sell (ISO timestamps)
+#  - tickers: {ticker: {"buy_shares", "buy_cost", "sell_shares", "sell_proceeds",
+#                       "buys", "sells", "last_buy", "last_sell"}}
+#  - mark_hash: TradeJournal.journal_mark(offset); if the journal was rewritten
+#    (TradeJournal.replace_all) the aggregates are rebuilt from scratch
+EMPTY_AGGREGATES = {"offset": 0, "mark_hash": None, "count": 0, "buys": 0, "sells": 0,
+                    "last_buy": None, "last_sell": None, "tickers": {}}
 
-with open(PORTFOLIO_FILE) as f:
-    portfolio = json.load(f)
-cash_remaining = portfolio.get("cash", 0)
-initial_cash = 10_000
-
-if not trades:
-    print("⚠️  No trades found. Skipping summary generation.")
-    output = {
-        "date": str(date.today()),
-        "total_trades": 0,
-        "buys": 0,
-        "sells": 0,
-        "cash_remaining": cash_remaining,
-        "market_value": 0,
-        "total_value": cash_remaining,
-        "total_change": 0,
-        "change_since_last": 0,
-        "holdings": {}
-    }
+def save_summary(output):
     with open(OUTPUT_FILE, "w") as f:
         json.dump(output, f, indent=2)
-    print(f"✅ Saved empty trade summary to {OUTPUT_FILE}")
-    exit()
-
-# ─── 2) BUILD TRADES DATAFRAME ──────────────────────────────────────────────────
-df = pd.DataFrame(trades)
-total_trades = len(df)
-
-# ─── 3) AGGREGATE BUY/SELL BY TICKER ────────────────────────────────────────────
-buy_count = len(df[df["action"] == "BUY"])
-sell_count = len(df[df["action"] == "SELL"])
-
-summary = {}
-for ticker, sub in df.groupby("ticker"):
-    buys  = sub[sub["action"] == "BUY"]
-    sells = sub[sub["action"] == "SELL"]
-
-    total_buy_shares   = buys["shares"].sum()
-    total_buy_cost     = (buys["shares"] * buys["price"]).sum()
-    total_sell_shares  = sells["shares"].sum()
-    total_sell_proceed = (sells["shares"] * sells["price"]).sum()
-
-    net_shares = total_buy_shares - total_sell_shares
-    if round(net_shares, 5) > 0:
-        # average cost basis, adjusted for proceeds of sells
-        net_cost = total_buy_cost - total_sell_proceed
-        cost_basis = net_cost / net_shares
-        summary[ticker] = {
-            "shares":      round(net_shares, 3),
-            "cost_basis":  round(cost_basis, 2) if cost_basis is not None else None
-        }
+
+# ─── AGGREGATES ─────────────────────────────────────────────────────────────────
+
+def _later(a, b):
+    """Later of two ISO timestamps (either may be None)."""
+    if a is None or b is None:
+        return a or b
+    return a if datetime.fromisoformat(a) >= datetime.fromisoformat(b) else b
+
+def _apply_trade(aggregates, trade):
+    action = trade.get("action")
+    aggregates["count"] += 1
+    if action not in ("BUY", "SELL"):
+        return
+    agg = aggregates["tickers"].setdefault(trade["ticker"], {
+        "buy_shares": 0.0, "buy_cost": 0.0, "sell_shares": 0.0, "sell_proceeds": 0.0,
+        "buys": 0, "sells": 0, "last_buy": None, "last_sell": None
+    })
+    value = trade["shares"] * trade["price"]
+    when = str(trade.get("date")) if trade.get("date") else None
+    if action == "BUY":
+        aggregates["buys"] += 1
+        agg["buys"] += 1
+        agg["buy_shares"] += trade["shares"]
+        agg["buy_cost"]   += value
+        agg["last_buy"] = _later(agg["last_buy"], when)
+        aggregates["last_buy"] = _later(aggregates["last_buy"], when)
     else:
-        continue  # Do not include stocks with no remaining shares
-
-# Find last buy and sell timestamps
-df['date'] = pd.to_datetime(df['date'], format='ISO8601')
-last_buy_time = df[df["action"] == "BUY"]["date"].max()
-last_sell_time = df[df["action"] == "SELL"]["date"].max()
-
-# ─── 4) FETCH CURRENT PRICES ───────────────────────────────────────────────────
-price_cache = load_cached_prices()
-prices = {}
-for tkr in summary:
-    # try to pull last cached close
-    closes = price_cache.get(tkr, {}).get("close", [])
-    if closes:
-        prices[tkr] = float(closes[-1])
+        aggregates["sells"] += 1
+        agg["sells"] += 1
+        agg["sell_shares"]   += trade["shares"]
+        agg["sell_proceeds"] += value
+        agg["last_sell"] = _later(agg["last_sell"], when)
+        aggregates["last_sell"] = _later(aggregates["last_sell"], when)
+
+def update_aggregates(path=JOURNAL_FILE):
+    """
+    Bring trade_aggregates.json up to date with the journal, reading only the
+    trades appended since its high-water mark. Returns the aggregates.
+    """
+    aggregates = read_json(AGGREGATES_FILE) or json.loads(json.dumps(EMPTY_AGGREGATES))
+    if not mark_matches(aggregates["offset"], aggregates["mark_hash"], path):
+        print(f"⚠️  {path} was rewritten – rebuilding {AGGREGATES_FILE}")
+        aggregates = json.loads(json.dumps(EMPTY_AGGREGATES))
+
+    new_trades, offset = read_since(aggregates["offset"], path)
+    if new_trades:
+        for trade in new_trades:
+            _apply_trade(aggregates, trade)
+        aggregates["offset"] = offset
+        aggregates["mark_hash"] = journal_mark(offset, path)
+        write_json(AGGREGATES_FILE, aggregates)
+    return aggregates
+
+# ─── SUMMARY ────────────────────────────────────────────────────────────────────
+
+def summarize(portfolio, price_cache=None, aggregates=None):
+    """
+    Build the trade and portfolio summary and save it to trade_summary.json.
+    portfolio: portfolio summary dict, price_cache: daily price cache (loaded from
+    disk if not given), aggregates: trade aggregates (brought up to date if not given).
+    Returns (output dict, last BUY time, last SELL time).
+    """
+    # ─── 1) DATA ─────────────────────────────────────────────────────────────────────
+    cash_remaining = portfolio.get("cash", 0)
+    initial_cash = 10_000
+    if aggregates is None:
+        aggregates = update_aggregates()
+
+    if not aggregates["count"]:
+        print("⚠️  No trades found. Skipping summary generation.")
+        output = {
+            "date": str(date.today()),
+            "total_trades": 0,
+            "buys": 0,
+            "sells": 0,
+            "cash_remaining": cash_remaining,
+            "market_value": 0,
+            "total_value": cash_remaining,
+            "total_change": 0,
+            "change_since_last": 0,
+            "holdings": {}
+        }
+        save_summary(output)
+        print(f"✅ Saved empty trade summary to {OUTPUT_FILE}")
+        return output, None, None
+
+    # ─── 2) TRADE COUNTS ────────────────────────────────────────────────────────────
+    total_trades = aggregates["count"]
+    buy_count = aggregates["buys"]
+    sell_count = aggregates["sells"]
+
+    # ─── 3) NET POSITION BY TICKER (running aggregates) ─────────────────────────────
+    summary = {}
+    for ticker, agg in sorted(aggregates["tickers"].items()):
+        net_shares = agg["buy_shares"] - agg["sell_shares"]
+        if round(net_shares, 5) > 0:
+            # average cost basis, adjusted for proceeds of sells
+            net_cost = agg["buy_cost"] - agg["sell_proceeds"]
+            cost_basis = net_cost / net_shares
+            summary[ticker] = {
+                "shares":      round(net_shares, 3),
+                "cost_basis":  round(cost_basis, 2) if cost_basis is not None else None
+            }
+        else:
+            continue  # Do not include stocks with no remaining shares
+
+    # Last buy and sell timestamps
+    last_buy_time = datetime.fromisoformat(aggregates["last_buy"]) if aggregates["last_buy"] else None
+    last_sell_time = datetime.fromisoformat(aggregates["last_sell"]) if aggregates["last_sell"] else None
+
+    # ─── 4) FETCH CURRENT PRICES ───────────────────────────────────────────────────
+    if price_cache is None:
+        price_cache = load_cached_prices(data_type="daily")
+    prices = {}
+    for tkr in summary:
+        # try to pull last cached close
+        closes = price_cache.get(tkr, {}).get("close", [])
+        if closes:
+            prices[tkr] = float(closes[-1])
+        else:
+            # fallback to live quote
+            prices[tkr] = get_current_price(tkr) or 0.0
+
+
+    # ─── 5) COMPUTE MARKET VALUES ───────────────────────────────────────────────────
+    total_market_value = 0
+    for tkr, info in summary.items():
+        price = prices.get(tkr, 0.0)
+        info["current_price"] = round(price, 2)
+        info["market_value"]   = round(info["shares"] * price, 2)
+        total_market_value    += info["market_value"]
+
+    # ─── 6) TOTAL PORTFOLIO VALUE ──────────────────────────────────────────────────
+    total_value = round(cash_remaining + total_market_value, 2)
+
+    # Compute change vs initial cash (e.g., starting portfolio value)
+    change_total = round(total_value - initial_cash, 2)
+
+    # Get the closing value from the previous calendar day (time-indexed lookup)
+    history_view = HistoryView(portfolio)
+    yesterday = date.today() - timedelta(days=1)
+    prev_day_value = history_view.close_on(yesterday)
+
+    if prev_day_value is not None:
+        change_since_last = round(total_value - prev_day_value, 2)
     else:
-        # fallback to live quote
-        prices[tkr] = get_current_price(tkr) or 0.0
-
-
-# ─── 5) COMPUTE MARKET VALUES ───────────────────────────────────────────────────
-total_market_value = 0
-for tkr, info in summary.items():
-    price = prices.get(tkr, 0.0)
-    info["current_price"] = round(price, 2)
-    info["market_value"]   = round(info["shares"] * price, 2)
-    total_market_value    += info["market_value"]
-
-# ─── 6) TOTAL PORTFOLIO VALUE ──────────────────────────────────────────────────
-total_value = round(cash_remaining + total_market_value, 2)
-
-# Compute change vs initial cash (e.g., starting portfolio value)
-change_total = round(total_value - initial_cash, 2)
-
-# Get the last snapshot from the previous calendar day
-history = portfolio.get("history", [])
-yesterday = date.today() - timedelta(days=1)
-
-# Parse datetimes and filter for entries from yesterday
-prev_day_snapshots = [
-    h for h in history
-    if "datetime" in h and datetime.fromisoformat(h["datetime"]).date() == yesterday
-]
-
-if prev_day_snapshots:
-    # Use the last snapshot from the previous day
-    last_prev_day = max(prev_day_snapshots, key=lambda h: h["datetime"])
-    prev_day_value = last_prev_day.get("total_value", total_value)
-    change_since_last = round(total_value - prev_day_value, 2)
-else:
-    change_since_last = 0.0
-
-# ─── 7) BUILD OUTPUT DICT ──────────────────────────────────────────────────────
-output = {
-    "date":             str(date.today()),
-    "total_trades":     total_trades,
-    "buys":             buy_count,
-    "sells":            sell_count,
-    "cash_remaining":   round(cash_remaining, 2),
-    "market_value":     round(total_market_value, 2),
-    "total_value":      total_value,
-    "total_change":     change_total,
-    "change_since_last": change_since_last,
-    "holdings":         summary
-}
-
-# ─── 8) SAVE TO JSON ────────────────────────────────────────────────────────────
-with open(OUTPUT_FILE, "w") as f:
-    json.dump(output, f, indent=2)
-
-# ─── 9) PRINT A QUICK SUMMARY ──────────────────────────────────────────────────
-if change_total > 0:
-    total_color = "\033[92m"  # green
-elif change_total < 0:
-    total_color = "\033[91m"  # red
-else:
-    total_color = "\033[0m"
-reset = "\033[0m"
-
-delta_str = f"{change_total:+.2f}"
-delta_last_str = f"{change_since_last:+.2f}"
-
-print(f"Trade summary for {output['date']}:")
-print(f" • Total trades executed: {output['total_trades']}")
-print(f" • Buys = {output['buys']} / Sells = {output['sells']}")
-print(f" • Last BUY:              {last_buy_time.strftime('%Y-%m-%d %H:%M:%S') if pd.notna(last_buy_time) else 'N/A'}")
-print(f" • Last SELL:             {last_sell_time.strftime('%Y-%m-%d %H:%M:%S') if pd.notna(last_sell_time) else 'N/A'}")
-print(f" • Cash remaining:        ${output['cash_remaining']:.2f}")
-print(f" • Market value:          ${output['market_value']:.2f}")
-print(f" • TOTAL portfolio value: {total_color}${output['total_value']:.2f} "
-      f"({delta_str} | {delta_last_str} since yesterday){reset}")
-print("Holdings:")
-for tkr, info in output["holdings"].items():
-    cost = info["cost_basis"]
-    current = info["current_price"]
-    if cost is None or current is None:
-        color = "\033[0m"
-    elif current > cost:
-        color = "\033[92m"
-    elif current < cost:
-        color = "\033[91m"
+        change_since_last = 0.0
+
+    # ─── 7) BUILD OUTPUT DICT ──────────────────────────────────────────────────────
+    output = {
+        "date":             str(date.today()),
+        "total_trades":     total_trades,
+        "buys":             buy_count,
+        "sells":            sell_count,
+        "cash_remaining":   round(cash_remaining, 2),
+        "market_value":     round(total_market_value, 2),
+        "total_value":      total_value,
+        "total_change":     change_total,
+        "change_since_last": change_since_last,
+        "holdings":         summary
+    }
+
+    # Against the market: FTSE 100 proxies from the same price cache (numpy only from here)
+    from IndexBenchmark import benchmark_report
+    output["benchmark"] = benchmark_report(portfolio, price_cache)
+
+    # ─── 8) SAVE TO JSON ────────────────────────────────────────────────────────────
+    save_summary(output)
+    return output, last_buy_time, last_sell_time
+
+def print_summary(output, last_buy_time, last_sell_time):
+    # ─── 9) PRINT A QUICK SUMMARY ──────────────────────────────────────────────────
+    change_total = output["total_change"]
+    change_since_last = output["change_since_last"]
+    if change_total > 0:
+        total_color = "\033[92m"  # green
+    elif change_total < 0:
+        total_color = "\033[91m"  # red
     else:
-        color = "\033[0m"
+        total_color = "\033[0m"
     reset = "\033[0m"
-    print(f"{color}  {tkr:<6} = {info['shares']:.3f} shares, cost basis ${cost}, "
-      f"current ${current} → ${info['market_value']}{reset}")
 
-print(f"\n✅ Saved trade summary to {OUTPUT_FILE}")
-time.sleep(10) # Display for 10 seconds before ending
+    delta_str = f"{change_total:+.2f}"
+    delta_last_str = f"{change_since_last:+.2f}"
+
+    print(f"Trade summary for {output['date']}:")
+    print(f" • Total trades executed: {output['total_trades']}")
+    print(f" • Buys = {output['buys']} / Sells = {output['sells']}")
+    print(f" • Last BUY:              {last_buy_time.strftime('%Y-%m-%d %H:%M:%S') if last_buy_time else 'N/A'}")
+    print(f" • Last SELL:             {last_sell_time.strftime('%Y-%m-%d %H:%M:%S') if last_sell_time else 'N/A'}")
+    print(f" • Cash remaining:        ${output['cash_remaining']:.2f}")
+    print(f" • Market value:          ${output['market_value']:.2f}")
+    print(f" • TOTAL portfolio value: {total_color}${output['total_value']:.2f} "
+          f"({delta_str} | {delta_last_str} since yesterday){reset}")
+    print("Holdings:")
+    for tkr, info in output["holdings"].items():
+        cost = info["cost_basis"]
+        current = info["current_price"]
+        if cost is None or current is None:
+            color = "\033[0m"
+        elif current > cost:
+            color = "\033[92m"
+        elif current < cost:
+            color = "\033[91m"
+        else:
+            color = "\033[0m"
+        reset = "\033[0m"
+        print(f"{color}  {tkr:<6} = {info['shares']:.3f} shares, cost basis ${cost}, "
+          f"current ${current} → ${info['market_value']}{reset}")
+
+    if output.get("benchmark"):
+        from IndexBenchmark import print_report
+        print_report(output["benchmark"])
+
+    print(f"\n✅ Saved trade summary to {OUTPUT_FILE}")
+
+def main():
+    with open(PORTFOLIO_FILE) as f:
+        portfolio = json.load(f)
+    output, last_buy_time, last_sell_time = summarize(portfolio)
+    if output["total_trades"]:
+        print_summary(output, last_buy_time, last_sell_time)
+        time.sleep(10) # Display for 10 seconds before ending
+    return output
+
+if __name__ == "__main__":
+    main()
 
 # ─── 10) PLOT PROFIT/LOSS SUMMARY ──────────────────────────────────────────────────
-# # Extract the history section
-# history = portfolio['history']
-# df = pd.DataFrame(history)
-# df['datetime'] = pd.to_datetime(df['datetime'])
+# # Extract the history section (expanded, time-indexed view)
+# df = pd.DataFrame(history_view.series(), columns=['datetime', 'total_value'])
 # df.set_index('datetime', inplace=True)
 
 # # Calculate daily average total value and forward-fill missing days
@@ -0,0 +1,79 @@
+# Trend.py
+# Trend kernel for the intraday checks in ExecuteTrades.py and MonitorDeferredSells.py.
+# The windows are at most a day of 5-minute bars (~100 points); trend_batch() evaluates
+# every ticker's least-squares slope and drop from peak at once.
+
+def minutes_since_first(times):
+    """Datetimes → minutes since the first one (x values for trend_batch())."""
+    return [(t - times[0]).total_seconds() / 60 for t in times]
+
+# ─── BATCHED KERNEL ─────────────────────────────────────────────────────────────
+
+def trend_batch(series, xs=None, window=None, min_points=5, slope_threshold=None,
+                large_drop_pct=None, min_drop_pct=0.0, force_sell=False):
+    """
+    Trend statistics for many tickers in one vectorised pass.
+
+    series: {ticker: [prices]} – windows may have different lengths (ragged)
+    xs:     optional {ticker: [x values]} (e.g. minutes_since_first); default 0, 1, 2 ...
+    window: only use the last N points of each series
+
+    Returns {ticker: {"n", "slope", "last", "peak", "drop_pct", "sell"}}. Tickers with
+    fewer than min_points prices get slope None and sell False. The sell decision is the
+    MonitorDeferredSells rule: (slope < slope_threshold and last more than min_drop_pct
+    below the peak) or drop_pct > large_drop_pct or force_sell; thresholds left as None
+    are not applied.
+    """
+    import numpy as np  # Only the batched path needs numpy (see ImportBudget.py)
+
+    tickers = list(series)
+    if not tickers:
+        return {}
+    rows = [list(series[t])[-window:] if window else list(series[t]) for t in tickers]
+    x_rows = [
+        (list(xs[t])[-len(r):] if xs is not None and t in xs else list(range(len(r))))
+        for t, r in zip(tickers, rows)
+    ]
+    width = max(len(r) for r in rows) or 1
+
+    # Left-aligned ticker × window matrices; mask marks the real (non-padding) points
+    prices = np.zeros((len(rows), width))
+    times = np.zeros((len(rows), width))
+    mask = np.zeros((len(rows), width), dtype=bool)
+    for i, (r, x) in enumerate(zip(rows, x_rows)):
+        prices[i, :len(r)] = r
+        times[i, :len(r)] = x
+        mask[i, :len(r)] = True
+
+    n = mask.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+    mean_x = (times * mask).sum(axis=1) / safe_n
+    mean_y = (prices * mask).sum(axis=1) / safe_n
+    dx = (times - mean_x[:, None]) * mask
+    dy = (prices - mean_y[:, None]) * mask
+    sxx = (dx * dx).sum(axis=1)
+    slopes = np.where(sxx > 0, (dx * dy).sum(axis=1) / np.where(sxx > 0, sxx, 1), 0.0)
+
+    last = prices[np.arange(len(rows)), np.maximum(n - 1, 0)]
+    peak = np.where(mask, prices, -np.inf).max(axis=1)
+    drop_pct = np.where(peak > 0, (peak - last) / np.where(peak > 0, peak, 1) * 100, 0.0)
+
+    sell = np.full(len(rows), bool(force_sell))
+    if slope_threshold is not None:
+        sell |= (slopes < slope_threshold) & (last < peak * (1 - min_drop_pct / 100))
+    if large_drop_pct is not None:
+        sell |= drop_pct > large_drop_pct
+    enough = n >= min_points
+    sell &= enough
+
+    return {
+        t: {
+            "n": int(n[i]),
+            "slope": float(slopes[i]) if enough[i] else None,
+            "last": float(last[i]) if n[i] else None,
+            "peak": float(peak[i]) if n[i] else None,
+            "drop_pct": float(drop_pct[i]) if n[i] else None,
+            "sell": bool(sell[i])
+        }
+        for i, t in enumerate(tickers)
+    }
@@ -1,28 +1,49 @@
+import sys
 import json
 from collections import defaultdict
-import matplotlib.pyplot as plt
-from datetime import datetime, date
+from datetime import datetime
+from TradeJournal import read_since, prefix_hash
+from StateAccess import read_json, write_json
+
+CHECKPOINT_FILE = "validation_checkpoint.json"
+VIOLATIONS_FILE = "violations_log.json"
+INITIAL_CASH    = 10000
+
+# Validation is incremental. validation_checkpoint.json holds the state after the last
+# validated trade: cash, holdings, seq (trades validated), offset (journal bytes),
+# prefix_hash (SHA-1 of those bytes), the trade violations found so far and the cash
+# history. A run validates only the trades appended since; if the prefix hash no longer
+# matches (journal rewritten or edited) everything is replayed from trade 1.
+# Portfolio reconciliation (cash/holdings vs portfolio_summary.json) is redone every run.
+CHECKPOINT_FORMAT = 2  # 2: holdings from validation's own replay (1 took them from the lot ledger)
+EMPTY_CHECKPOINT = {"format": CHECKPOINT_FORMAT, "seq": 0, "offset": 0, "prefix_hash": None,
+                    "cash": INITIAL_CASH, "holdings": {}, "violations": [], "cash_history": []}
 
-# ── Load portfolio summary ──────────────────────────────────────────
-with open('portfolio_summary.json') as f:
-    portfolio_data = json.load(f)
-
-# ── Derive initial state from the first history entry ──────────────
-cash = 10000
-holdings = defaultdict(float)
-
-violations = []
-cash_history = []
-date_history = []
-violation_counts = defaultdict(int)
+# Field presence & type
+required_keys = {"date": str, "ticker": str, "action": str, "shares": (int, float), "price": (int, float)}
 
-# ── Load trades and sort ────────────────────────────────────────────
-with open('trades_log.json') as f:
-    trades = json.load(f)
-trades.sort(key=lambda x: datetime.fromisoformat(x['date']))
+def load_checkpoint():
+    checkpoint = read_json(CHECKPOINT_FILE)
+    current = checkpoint and checkpoint.get("format") == CHECKPOINT_FORMAT
+    if current and prefix_hash(checkpoint["offset"]) == checkpoint["prefix_hash"]:
+        return checkpoint
+    if current:
+        print("⚠️  Trade journal changed before the validated point – replaying from the first trade")
+    return json.loads(json.dumps(EMPTY_CHECKPOINT))
+
+def validate_trade(checkpoint, seq, trade, now):
+    """Check one trade and apply it to the checkpoint's cash and holdings. Returns its violations."""
+    violations = []
+    for key, typ in required_keys.items():
+        if key not in trade or not isinstance(trade[key], typ):
+            violations.append({
+                'type': 'BAD RECORD',
+                'date': trade.get('date', 'unknown'),
+                'detail': f"Record #{seq} missing/invalid {key} → {trade}"
+            })
+    if violations:
+        return violations  # Can't be simulated
 
-# ── Process trades (with rounding) ─────────────────────────────────
-for trade in trades:
     trade_date = trade['date']
     # Date is mix of date and datetime
     dt = datetime.fromisoformat(trade_date)
@@ -30,13 +51,23 @@ for trade in trades:
     ticker = trade['ticker']
     quantity = trade['shares']
     price = trade['price']
-    total_cost = round(quantity * price, 2) 
+    total_cost = round(quantity * price, 2)
+    cash = checkpoint["cash"]
+    holdings = checkpoint["holdings"]
+
+    # Future trades (each trade checked against its own date)
+    if dt > now:
+        violations.append({
+            'type': 'FUTURE TRADE',
+            'date': trade_date,
+            'detail': f"{trade}"
+        })
 
+    # ── Process trade (with rounding) ─────────────────────────────────
     if action == 'BUY':
         if cash >= total_cost:
-            holdings[ticker] += quantity
-            cash -= total_cost
-            cash = round(cash, 2)
+            cash = round(cash - total_cost, 2)
+            holdings[ticker] = holdings.get(ticker, 0) + quantity
         else:
             violations.append({
                 'type': 'BUY WITHOUT SUFFICIENT CASH',
@@ -46,122 +77,134 @@ for trade in trades:
                 'price': price,
                 'cash_available': cash
             })
-            violation_counts['BUY WITHOUT SUFFICIENT CASH'] += 1
     elif action == 'SELL':
-        if holdings[ticker] >= quantity:
-            holdings[ticker] -= quantity
-            cash += total_cost
-            cash = round(cash, 2)
+        # Own replay, not the lot ledger: a rejected BUY above never opened a position
+        held = holdings.get(ticker, 0)
+        if held >= quantity - 1e-9:
+            cash = round(cash + total_cost, 2)
+            if held - quantity > 1e-9:
+                holdings[ticker] = held - quantity
+            else:
+                holdings.pop(ticker, None)
         else:
             violations.append({
                 'type': 'SELL WITHOUT HOLDING',
                 'date': trade_date,
                 'ticker': ticker,
                 'quantity': quantity,
-                'held': holdings[ticker]
+                'held': held
             })
-            violation_counts['SELL WITHOUT HOLDING'] += 1
 
-    date_history.append(dt)
-    cash_history.append(cash)
+    checkpoint["cash"] = cash
+    checkpoint["cash_history"].append([trade_date, cash])
+    return violations
 
-# ── Additional QC Checks ────────────────────────────────────────────
+def reconcile(checkpoint, portfolio_data):
+    """Compare the simulated cash/holdings with portfolio_summary.json."""
+    violations = []
+    cash, holdings = checkpoint["cash"], checkpoint["holdings"]
+    if round(cash, 5) != round(portfolio_data['cash'], 5):
+        violations.append({
+            'type': 'CASH MISMATCH',
+            'date': portfolio_data['date'],
+            'detail': f"simulated={cash}, summary={portfolio_data['cash']}"
+        })
 
-# Field presence & type
-required_keys = {"date": str, "ticker": str, "action": str, "shares": (int, float), "price": (int, float)}
-for i, trade in enumerate(trades):
-    for key, typ in required_keys.items():
-        if key not in trade or not isinstance(trade[key], typ):
+    for ticker, qty in portfolio_data['holdings'].items():
+        simulated_qty = holdings.get(ticker, 0)
+        if abs(simulated_qty - qty) > 1e-6:
             violations.append({
-                'type': 'BAD RECORD',
-                'date': trade.get('date', 'unknown'),
-                'detail': f"Record #{i} missing/invalid {key} → {trade}"
+                'type': 'HOLDING MISMATCH',
+                'date': portfolio_data['date'],
+                'ticker': ticker,
+                'detail': f"simulated={simulated_qty}, summary={qty}"
             })
-            violation_counts['BAD RECORD'] += 1
 
-# Future trades
-today_dt = datetime.today()
-for trade in trades:
-    dt = datetime.fromisoformat(trade_date)
-    if dt > today_dt:
-        violations.append({
-            'type': 'FUTURE TRADE',
-            'date': trade['date'],
-            'detail': f"{trade}"
-        })
-        violation_counts['FUTURE TRADE'] += 1
-
-# Portfolio reconciliation
-if round(cash, 5) != round(portfolio_data['cash'], 5):
-    violations.append({
-        'type': 'CASH MISMATCH',
-        'date': portfolio_data['date'],
-        'detail': f"simulated={cash}, summary={portfolio_data['cash']}"
-    })
-    violation_counts['CASH MISMATCH'] += 1
-
-for ticker, qty in portfolio_data['holdings'].items():
-    simulated_qty = holdings.get(ticker, 0)
-    if abs(simulated_qty - qty) > 1e-6:
-        violations.append({
-            'type': 'HOLDING MISMATCH',
-            'date': portfolio_data['date'],
-            'ticker': ticker,
-            'detail': f"simulated={simulated_qty}, summary={qty}"
-        })
-        violation_counts['HOLDING MISMATCH'] += 1
+    # Extra holdings not in summary
+    for ticker in holdings:
+        if ticker not in portfolio_data['holdings'] and abs(holdings[ticker]) > 1e-6:
+            violations.append({
+                'type': 'EXTRA HOLDING',
+                'date': portfolio_data['date'],
+                'ticker': ticker,
+                'detail': f"{holdings[ticker]} shares not in summary"
+            })
+    return violations
+
+def validate(portfolio_data=None):
+    """
+    Validate trades appended since the last checkpoint and reconcile with the
+    portfolio. Writes violations_log.json and the new checkpoint.
+    Returns (all violations, number of trades validated this run, checkpoint).
+    """
+    if portfolio_data is None:
+        portfolio_data = read_json('portfolio_summary.json')
+    checkpoint = load_checkpoint()
+
+    # ── New trades ──────────────────────────────────────────────────────
+    trades, offset = read_since(checkpoint["offset"])
+
+    now = datetime.today()
+    for trade in trades:
+        checkpoint["violations"].extend(validate_trade(checkpoint, checkpoint["seq"], trade, now))
+        checkpoint["seq"] += 1
+
+    if trades:
+        checkpoint["offset"] = offset
+        checkpoint["prefix_hash"] = prefix_hash(offset)
+        checkpoint["validated_at"] = now.isoformat(timespec="seconds")
+        write_json(CHECKPOINT_FILE, checkpoint)
+
+    violations = checkpoint["violations"] + reconcile(checkpoint, portfolio_data)
+
+    # ── Write violations to JSON ─────────────────────────────────────────
+    with open(VIOLATIONS_FILE, 'w') as vf:
+        json.dump(violations, vf, indent=2)
+    return violations, len(trades), checkpoint
+
+def print_report(violations, validated):
+    print(f"🔍 Validated {validated} new trades; logged {len(violations)} violations to {VIOLATIONS_FILE}")
+
+    # ── Summary print ─────────────────────────────────────────────────────
+    print(f"\n✅ Total Violations: {len(violations)}")
+    for v in violations[:10]:
+        line = f"{v['type']} on {v.get('date', 'unknown')}"
+        if 'ticker' in v:
+            line += f" for {v['ticker']}"
+        print(f"{line}: {v.get('detail', '')}")
+
+    # ── Violation breakdown by type and date range ────────────────────────
+    violation_counts = defaultdict(int)
+    type_dates = defaultdict(list)
+    for v in violations:
+        t = v['type']
+        violation_counts[t] += 1
+        d = v.get('date')
+        if d:
+            type_dates[t].append(d)
+
+    print("\n📋 Violation Summary by Type and Date Range:")
+    for t, count in violation_counts.items():
+        dates = sorted(type_dates.get(t, []))
+        if dates:
+            print(f"- {t}: {count} violations from {dates[0]} to {dates[-1]}")
+        else:
+            print(f"- {t}: {count} violations")
 
-# Extra holdings not in summary
-for ticker in holdings:
-    if ticker not in portfolio_data['holdings'] and abs(holdings[ticker]) > 1e-6:
-        violations.append({
-            'type': 'EXTRA HOLDING',
-            'date': portfolio_data['date'],
-            'ticker': ticker,
-            'detail': f"{holdings[ticker]} shares not in summary"
-        })
-        violation_counts['EXTRA HOLDING'] += 1
-
-# ── Write violations to JSON ─────────────────────────────────────────
-with open('violations_log.json', 'w') as vf:
-    json.dump(violations, vf, indent=2)
-print(f"🔍 Logged {len(violations)} violations to violations_log.json")
-
-# ── Summary print ─────────────────────────────────────────────────────
-print(f"\n✅ Total Violations: {len(violations)}")
-for v in violations[:10]:
-    line = f"{v['type']} on {v.get('date', 'unknown')}"
-    if 'ticker' in v:
-        line += f" for {v['ticker']}"
-    print(f"{line}: {v.get('detail', '')}")
-
-# ── Violation breakdown by type and date range ────────────────────────
-type_dates = defaultdict(list)
-for v in violations:
-    t = v['type']
-    d = v.get('date')
-    if d:
-        type_dates[t].append(d)
-
-print("\n📋 Violation Summary by Type and Date Range:")
-for t, count in violation_counts.items():
-    dates = sorted(type_dates.get(t, []))
-    if dates:
-        print(f"- {t}: {count} violations from {dates[0]} to {dates[-1]}")
-    else:
-        print(f"- {t}: {count} violations")
-
-# ── Plot cash over time ────────────────────────────────────────────────
-plt.figure(figsize=(12, 6))
-plt.plot(date_history, cash_history, label='Cash Over Time')
-plt.xlabel('Date')
-plt.ylabel('Cash (£)')
-plt.title('Cash Balance Over Time')
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.show()
-
-# ── Plot violation counts ─────────────────────────────────────────────
-if violation_counts == 0:
-    print("🎉 No violations detected.")
\ No newline at end of file
+    if not violations:
+        print("🎉 No violations detected.")
+
+def plot_cash(checkpoint):
+    import matplotlib.pyplot as plt  # Only when plotting (validation also runs after every ExecuteTrades)
+    from ChartRenderer import cash_figure
+
+    # ── Plot cash over time ────────────────────────────────────────────────
+    cash_figure(checkpoint["cash_history"])
+    plt.show()
+
+if __name__ == "__main__":
+    # python ValidateTrades.py [--plot]
+    violations, validated, checkpoint = validate()
+    print_report(violations, validated)
+    if "--plot" in sys.argv:
+        plot_cash(checkpoint)
@@ -3,16 +3,19 @@
 import os
 import sys
 import json
-import time
 import subprocess
 from datetime import date, datetime
-from DataManager import fetch_and_cache_prices
-import pandas as pd
+from TradeJournal import todays_trades
+from RunLog import log_run
+from EventChannel import Listener
+from Pipeline import PipelineRunner, JobCheckpoint
+from DataManager import CACHE_FILE
+from StateAccess import read_json, write_json, VersionConflict
+from Instrumentation import stage, snapshot, reset, print_snapshot
+import Profiling
 
 # ─── CONFIG ─────────────────────────────────────────────────────────────────────
-RUN_LOG_FILE = "run_log.json"
 PORTFOLIO_FILE   = "portfolio_summary.json"
-TRADE_LOG        = "trades_log.json"
 DAILY_SCREEN     = "daily_screen.json"
 LAST_SELECT_RUN  = "selectstocks_last_run.txt"
 LAST_STOCKTICKERS_RUN = "stocktickers_last_run.txt"
@@ -20,59 +23,25 @@ MONITOR_FLAG = "monitor_started.txt"
 DEFERRED_SELLS_FILE = "deferred_sells.json"
 INITIAL_CASH     = 10_000
 
-# Set the working directory to the folder where run_bot.py is located
-os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
-
-# ─── PRE-FETCH HISTORICAL DATA ─────────────────────────────────────────────────
-# Ensure ftse100_stocks.json exists
-if not os.path.exists("ftse100_stocks.json"):
-    print("ftse100_stocks.json not found – running StockTickers.py")
-    subprocess.run(["python", "StockTickers.py"], check=True)
-    
-# Load tickers from ftse100_stocks.json
-with open("ftse100_stocks.json", "r", encoding="utf-8") as f:
-    ftse100 = json.load(f)
-
-UNIVERSE = list({
-    f"{stock['code'].rstrip('.').replace('.', '-')}.L"
-    for stock in ftse100
-    if stock.get("code")
-})
-
-# Cache 60 days daily history for all symbols
-fetch_and_cache_prices(UNIVERSE, period="60d", interval="1d", force=True, intraday=True) # Force = Ensure Latest values downloaded
-
 # ────────────────────────────────────────────────────────────────────────────────
 
 # The current quater
 def current_quarter(dt):
     return (dt.month - 1) // 3 + 1  # 1-based: Jan-Mar = Q1, etc.
 
-# Log each time bot runs
-def log_run(run_data):
-    """Append a run log entry to run_log.json."""
-    if os.path.exists(RUN_LOG_FILE):
-        with open(RUN_LOG_FILE) as f:
-            logs = json.load(f)
-    else:
-        logs = []
-
-    logs.append(run_data)
-
-    with open(RUN_LOG_FILE, "w") as f:
-        json.dump(logs, f, indent=2)
-
 def init_portfolio():
     """Ensure portfolio_summary.json exists."""
     if not os.path.exists(PORTFOLIO_FILE):
-        with open(PORTFOLIO_FILE, "w") as f:
-            json.dump({
+        try:
+            write_json(PORTFOLIO_FILE, {
                 "date":     str(date.today()),
                 "cash":     INITIAL_CASH,
                 "holdings": {},
                 "history":  []
-            }, f, indent=2)
-        print("Initialized portfolio_summary.json with $10,000 cash.")
+            }, expected_version=None)  # Only if no other process created it meanwhile
+            print("Initialized portfolio_summary.json with $10,000 cash.")
+        except VersionConflict:
+            pass
 
 def ran_select_today():
     """Has SelectStocks.py already run today?"""
@@ -86,22 +55,8 @@ def mark_select_ran():
         f.write(str(date.today()))
 
 def get_todays_sells():
-    """Return set of tickers sold or deferred today."""
-    today = date.today()
-    sells = set()
-    if os.path.exists(TRADE_LOG):
-        with open(TRADE_LOG) as f:
-            logs = json.load(f)
-        for entry in logs:
-            if entry["action"] == "SELL":
-                try:
-                    entry_date = datetime.fromisoformat(entry["date"]).date()
-                except ValueError:
-                    # Fallback if the date is not ISO format
-                    entry_date = datetime.strptime(entry["date"], "%Y-%m-%d").date()
-                if entry_date == today:
-                    sells.add(entry["ticker"])
-    return sells
+    """Return set of tickers sold today (reads only today's part of the trade journal)."""
+    return {entry["ticker"] for entry in todays_trades() if entry["action"] == "SELL"}
 
 def prune_sold_from_screen(sold_set):
     """Remove sold tickers from daily_screen.json (top_100, to_buy, momentum)."""
@@ -119,121 +74,190 @@ def prune_sold_from_screen(sold_set):
     print(f"Pruned sold tickers from screen: {sold_set}")
 
 def run_script(name):
-    """Helper to run a python script in subprocess."""
+    """Helper to run a python script in subprocess (only for scripts outside the pipeline)."""
     print(f">>> Running {name}")
-    subprocess.run(["python", name], check=True)
+    command = ["python", "Profiling.py", "run", name] if Profiling.ENABLED else ["python", name]
+    with stage(name):  # Wall time only – the child's CPU and memory aren't ours
+        subprocess.run(command, check=True)
 
-def job():
+def update_tickers_if_due():
+    """Run StockTickers.py once per quarter (index rebalance). Returns True if it ran."""
+    today = date.today()
+    this_q = current_quarter(today)
+    last_q = 0
+
+    if os.path.exists(LAST_STOCKTICKERS_RUN):
+        with open(LAST_STOCKTICKERS_RUN) as f:
+            last_run_date = datetime.strptime(f.read().strip(), "%Y-%m-%d").date()
+            last_q = current_quarter(last_run_date)
+
+    if this_q != last_q:
+        print("New quarter detected – running StockTickers.py")
+        run_script("StockTickers.py")
+        with open(LAST_STOCKTICKERS_RUN, "w") as f:
+            f.write(str(today))
+        return True
+    print("Skipping - StockTickers.py already ran this quarter")
+    return False
+
+def is_deferred_sells_nonempty():
+    """Check if deferred_sells.json is non-empty."""
+    if not os.path.exists(DEFERRED_SELLS_FILE):
+        return False
+    try:
+        return bool(read_json(DEFERRED_SELLS_FILE))  # True if data is not empty (e.g., list or dict with content)
+    except ValueError:
+        return False  # File is invalid or empty
+
+def launch_monitor_if_needed():
+    """Start MonitorDeferredSells.py (once per day) if there are deferred sells. Returns True if started."""
+    monitor_already_started = (
+            os.path.exists(MONITOR_FLAG) and
+            open(MONITOR_FLAG).read().strip() == str(date.today())
+        )
+    if monitor_already_started or not is_deferred_sells_nonempty():
+        return False
+    print("Launching MonitorDeferredSells.py...")
+    subprocess.Popen(["python", "MonitorDeferredSells.py"])
+    with open(MONITOR_FLAG, "w") as f:
+        f.write(str(date.today()))
+    return True
+
+def wait_for_monitor(events, check_every=60):
+    """
+    Block until MonitorDeferredSells.py publishes "done" on the event channel.
+    The MONITOR_FLAG check only matters if the monitor died without saying so.
+    """
+    while True:
+        event = events.get(timeout=check_every)
+        if event is None:
+            if not os.path.exists(MONITOR_FLAG):
+                return
+        elif event["event"] == "sold":
+            print(f"Monitor sold {event['shares']} of {event['ticker']} @ ${event['price']:.2f}")
+        elif event["event"] == "done":
+            return
+
+def job(scripts_run=None, stage_cache=None):
+    """
+    One bot run. Steps run and stage cache hits are appended to the caller's
+    scripts_run and stage_cache lists, so the run log has them even if it fails.
+    """
     start_time = datetime.now()
-    scripts_run = []
+    scripts_run = [] if scripts_run is None else scripts_run
+    stage_cache = [] if stage_cache is None else stage_cache
     
     print(f"\n=== Bot run at {datetime.now().isoformat()} ===")
     init_portfolio()
 
-    try:
-        # 0) ─── RUN STOCKTICKERS ON QUARTERLY REBALANCE DATES ─────────────────────
-        today = date.today()
-        this_q = current_quarter(today)
-        last_q = 0
-
-        if os.path.exists(LAST_STOCKTICKERS_RUN):
-            with open(LAST_STOCKTICKERS_RUN) as f:
-                last_run_date = datetime.strptime(f.read().strip(), "%Y-%m-%d").date()
-                last_q = current_quarter(last_run_date)
+    # Stages run in-process, sharing prices, portfolio and trades (see Pipeline.py).
+    # Finished steps are checkpointed: after a failure the next run resumes where it stopped.
+    checkpoint = JobCheckpoint()
+    runner = PipelineRunner(checkpoint=checkpoint)
+    if checkpoint.resumed:
+        print(f"Resuming the interrupted run of {checkpoint.state['started']} (failed in {checkpoint.failed_step or 'between steps'})")
+        scripts_run.append(f"RESUMED - {checkpoint.failed_step or 'between steps'}")
 
-        if this_q != last_q:
-            print("New quarter detected – running StockTickers.py")
+    try:
+        # ─── PRE-FETCH HISTORICAL DATA ─────────────────────────────────────────────
+        # Ensure ftse100_stocks.json exists
+        if not os.path.exists("ftse100_stocks.json"):
+            print("ftse100_stocks.json not found – running StockTickers.py")
             run_script("StockTickers.py")
+
+        # 0) ─── RUN STOCKTICKERS ON QUARTERLY REBALANCE DATES ─────────────────────
+        if update_tickers_if_due():
             scripts_run.append("StockTickers")
-            with open(LAST_STOCKTICKERS_RUN, "w") as f:
-                f.write(str(today))
+
+        # Download price data once for every stage of this run (a resumed run reuses the download)
+        if checkpoint.done("Prices", verify=[CACHE_FILE]):
+            print("Reusing the prices downloaded by the interrupted run")
+            runner.ctx.load_prices(fetch=False)
         else:
-            print("Skipping - StockTickers.py already ran this quarter")
+            checkpoint.begin("Prices")
+            runner.ctx.load_prices()
+            checkpoint.record("Prices", [CACHE_FILE])
 
         # 1) Daily screen once
         if not ran_select_today():
-            run_script("SelectStocks.py")
+            runner.run("SelectStocks")
             scripts_run.append("SelectStocks")
             mark_select_ran()
         else:
             print("Skipping - SelectStocks.py already ran today")
 
         # 2) How many sells have happened already today?
-        sells_before = get_todays_sells()
+        sells_before = set(checkpoint.remember("sells_before", lambda: sorted(get_todays_sells())))
 
         # 3) Run generate+execute
-        run_script("GenerateSignals.py")
+        runner.run("GenerateSignals")
         scripts_run.append("GenerateSignals")
-        run_script("ExecuteTrades.py")
+        runner.run("ExecuteTrades")
         scripts_run.append("ExecuteTrades")
 
         # 4) Handle new sells
-        new_sells = get_todays_sells() - sells_before
-        monitor_already_started = (
-                os.path.exists(MONITOR_FLAG) and
-                open(MONITOR_FLAG).read().strip() == str(date.today())
-            )
-        
-        # Check if deferred_sells.json is non-empty
-        def is_deferred_sells_nonempty():
-            if not os.path.exists(DEFERRED_SELLS_FILE):
-                return False
-            try:
-                with open(DEFERRED_SELLS_FILE, 'r') as f:
-                    data = json.load(f)
-                    return bool(data)  # True if data is not empty (e.g., list or dict with content)
-            except (json.JSONDecodeError, ValueError):
-                return False  # File is invalid or empty
-
-        monitor_started = False
-
-        if not monitor_already_started and is_deferred_sells_nonempty():
-            print("Launching MonitorDeferredSells.py...")
-            subprocess.Popen(["python", "MonitorDeferredSells.py"])
-            with open(MONITOR_FLAG, "w") as f:
-                f.write(str(date.today()))
-            scripts_run.append("DEFERRED - MonitorDeferredSells STARTED")
-            monitor_started = True
+        new_sells = set(checkpoint.remember("new_sells", lambda: sorted(get_todays_sells() - sells_before)))
+        if checkpoint.done("Monitor"):
+            monitor_started = checkpoint.data("Monitor")["started"]
+        else:
+            checkpoint.begin("Monitor")
+            # Listen before launching so the monitor's completion event can't be missed
+            with Listener("monitor_events") as monitor_events:
+                monitor_started = launch_monitor_if_needed()
+                if monitor_started:
+                    scripts_run.append("DEFERRED - MonitorDeferredSells STARTED")
+                # No real sells, but deferred monitor was started → wait, then act
+                if monitor_started and not new_sells:
+                    print("Waiting for MonitorDeferredSells.py to finish...")
+                    wait_for_monitor(monitor_events)
+                    print("MonitorDeferredSells.py has finished.")
+            checkpoint.record("Monitor", started=monitor_started)
 
         # CASE 1: Real sells today → proceed immediately
         if new_sells:
             print("Detected real sells for today.")
-            run_script("GenerateSignals.py")
+            runner.run("GenerateSignals", step="NEW SELL - GenerateSignals")
             scripts_run.append("NEW SELL - GenerateSignals")
-            run_script("ExecuteTrades.py")
+            runner.run("ExecuteTrades", step="NEW SELL - ExecuteTrades")
             scripts_run.append("NEW SELL - ExecuteTrades")
 
-        # CASE 2: No real sells, but deferred monitor was started → wait, then act
+        # CASE 2: Monitor has finished selling the deferred tickers
         elif monitor_started:
-            print("Waiting for MonitorDeferredSells.py to finish...")
-            while os.path.exists(MONITOR_FLAG):
-                time.sleep(60)
-            print("MonitorDeferredSells.py has finished.")
-
-            run_script("GenerateSignals.py")
+            runner.run("GenerateSignals", step="AFTER MONITOR - GenerateSignals")
             scripts_run.append("AFTER MONITOR - GenerateSignals")
-            run_script("ExecuteTrades.py")
+            runner.run("ExecuteTrades", step="AFTER MONITOR - ExecuteTrades")
             scripts_run.append("AFTER MONITOR - ExecuteTrades")
         else:
             print("No new sells and no need to start MonitorDeferredSells.")
 
         # 5) Summarize trades
-        run_script("TradeSummary.py")
+        runner.run("TradeSummary")
         scripts_run.append("TradeSummary")
+        checkpoint.complete()
         end_time = datetime.now()
         print("=== Run complete ===")
-        return scripts_run
+        return scripts_run, stage_cache
     except Exception as e:
+        checkpoint.fail(e)  # The next run resumes from here
         raise e
+    finally:
+        stage_cache.extend(runner.take_cache_log())
 
 if __name__ == "__main__":
+    # Set the working directory to the folder where run_bot.py is located
+    os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
+
+    reset()
+    Profiling.new_run()  # Child scripts (and the monitor) write their profiles into this run's folder
     start_time = datetime.now()
     success = True
     error_message = None
     scripts_run = []
+    stage_cache = []
 
     try:
-        scripts_run = job()
+        with Profiling.profile("job"):
+            job(scripts_run, stage_cache)
     except Exception as e:
         success = False
         error_message = str(e)
@@ -248,7 +272,11 @@ if __name__ == "__main__":
         "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
         "success": success,
         "error_message": error_message,
-        "scripts_run": scripts_run
+        "scripts_run": scripts_run,
+        "stage_cache": stage_cache,
+        "metrics": snapshot(),
+        "profile": Profiling.run_dir()
     }
 
     log_run(run_entry)
+    print_snapshot(run_entry["metrics"])  # Per-stage wall/CPU time and network calls of this run